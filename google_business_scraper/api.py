@@ -0,0 +1,185 @@
+"""
+API assíncrona para usar o scraper dentro de outro serviço (ex.: FastAPI).
+
+O ``process.start()`` do run_scraper.py bloqueia e não pode ser chamado de novo
+no mesmo processo, porque o reactor do Twisted não reinicia. Aqui o reactor roda
+uma única vez, em uma thread própria, e todas as buscas reutilizam o mesmo
+``CrawlerRunner``. Os itens chegam ao event loop de quem chamou à medida que
+saem dos pipelines:
+
+    from google_business_scraper.api import scrape
+
+    async for item in scrape('barbearia atibaia', max_results=20):
+        print(item.name, item.rating)
+
+Por padrão os itens não são gravados em data/ (o ExportPipeline é removido);
+use ``export=True`` para também gerar o arquivo. Interromper o ``async for``
+(break, cancelamento da tarefa) encerra o crawl.
+"""
+
+import asyncio
+import threading
+
+from scrapy import signals
+from scrapy.crawler import Crawler, CrawlerRunner
+from scrapy.settings import Settings
+from scrapy.utils.defer import deferred_from_coro
+from scrapy.utils.reactor import install_reactor
+from twisted.internet.threads import blockingCallFromThread
+
+from google_business_scraper.queries import make_query
+from google_business_scraper.spiders.business_spider import BusinessSpider
+
+EXPORT_PIPELINE = 'google_business_scraper.pipelines.ExportPipeline'
+
+
+class _Finished:
+    """Fim do crawl na fila de itens (``failure`` se o crawl falhou)"""
+
+    def __init__(self, failure=None):
+        self.failure = failure
+
+
+def project_settings(overrides=None):
+    """Settings do projeto (sem depender do scrapy.cfg do diretório atual) + ``overrides``"""
+    settings = Settings()
+    settings.setmodule('google_business_scraper.settings', priority='project')
+    # Um console telnet / controle remoto por crawl esgotaria as portas em um serviço de longa duração
+    settings.set('TELNETCONSOLE_ENABLED', False, priority='project')
+    settings.set('REMOTE_CONTROL_ENABLED', False, priority='project')
+    if overrides:
+        settings.setdict(overrides, priority='cmdline')
+    return settings
+
+
+_reactor = None
+_reactor_thread = None
+_reactor_lock = threading.Lock()
+
+
+def start_reactor(settings):
+    """Inicia o reactor em uma thread própria (uma vez por processo) e o retorna"""
+    global _reactor, _reactor_thread
+    with _reactor_lock:
+        if _reactor is not None:
+            return _reactor
+        ready = threading.Event()
+        errors = []
+
+        def run():
+            try:
+                # Na thread do reactor: o loop asyncio do AsyncioSelectorReactor é criado aqui
+                install_reactor(settings['TWISTED_REACTOR'], settings['ASYNCIO_EVENT_LOOP'])
+                from twisted.internet import reactor
+            except Exception as e:
+                errors.append(e)
+                ready.set()
+                return
+            reactor.callWhenRunning(ready.set)
+            reactor.run(installSignalHandlers=False)
+
+        _reactor_thread = threading.Thread(target=run, name='scrapy-reactor', daemon=True)
+        _reactor_thread.start()
+        ready.wait()
+        if errors:
+            raise errors[0]
+        from twisted.internet import reactor
+        _reactor = reactor
+        return _reactor
+
+
+def shutdown():
+    """Para o reactor ao encerrar o serviço (ele não pode ser reiniciado no mesmo processo)"""
+    if _reactor is not None and _reactor_thread.is_alive():
+        _reactor.callFromThread(_reactor.stop)
+        _reactor_thread.join()
+
+
+class ScraperRunner:
+    """``CrawlerRunner`` com as settings do projeto, rodando no reactor compartilhado"""
+
+    def __init__(self, settings=None):
+        self.settings = project_settings(settings)
+        self.runner = None
+        self.reactor = None
+
+    def start(self):
+        if self.runner is None:
+            self.reactor = start_reactor(self.settings)
+            self.runner = CrawlerRunner(self.settings)
+
+    def stop(self):
+        """Encerra os crawls em andamento deste runner e aguarda o fim deles"""
+        if self.runner is not None:
+            blockingCallFromThread(self.reactor, self.runner.stop)
+
+    async def scrape(self, queries, max_results=50, plan=None, settings=None, export=False):
+        """
+        Busca ``queries`` (um termo, uma lista de termos ou de dicionários como os de
+        ``make_query``) ou um ``plan`` do planejador e gera os itens à medida que são extraídos
+        """
+        if not queries and not plan:
+            raise ValueError("Informe as consultas ou um plano")
+        self.start()
+        loop = asyncio.get_running_loop()
+        items = asyncio.Queue()
+
+        crawl_settings = self.settings.copy()
+        if settings:
+            crawl_settings.setdict(settings, priority='cmdline')
+        if not export:
+            pipelines = dict(crawl_settings.getdict('ITEM_PIPELINES'))
+            pipelines.pop(EXPORT_PIPELINE, None)
+            crawl_settings.set('ITEM_PIPELINES', pipelines, priority='cmdline')
+        crawler = Crawler(BusinessSpider, crawl_settings)
+
+        def item_scraped(item):
+            # Pipelines que devolvem None também disparam item_scraped
+            if item is not None:
+                loop.call_soon_threadsafe(items.put_nowait, item)
+
+        def finished(result):
+            loop.call_soon_threadsafe(items.put_nowait, _Finished(result))
+
+        def stop():
+            if crawler.crawling:
+                deferred_from_coro(crawler.stop_async())
+
+        def crawl():
+            crawler.signals.connect(item_scraped, signal=signals.item_scraped)
+            self.runner.crawl(crawler, max_results=max_results, queries=_query_list(queries, max_results),
+                              plan=plan).addBoth(finished)
+
+        self.reactor.callFromThread(crawl)
+        done = False
+        try:
+            while True:
+                item = await items.get()
+                if isinstance(item, _Finished):
+                    done = True
+                    if item.failure is not None:
+                        item.failure.raiseException()
+                    return
+                yield item
+        finally:
+            if not done:
+                self.reactor.callFromThread(stop)
+
+
+def _query_list(queries, max_results):
+    if queries is None:
+        return None
+    if isinstance(queries, str):
+        queries = [queries]
+    return [make_query(q, max_results) if isinstance(q, str) else q for q in queries]
+
+
+_default_runner = None
+
+
+def scrape(queries=None, **kwargs):
+    """Busca com o ``ScraperRunner`` padrão do processo (ver ``ScraperRunner.scrape``)"""
+    global _default_runner
+    if _default_runner is None:
+        _default_runner = ScraperRunner()
+    return _default_runner.scrape(queries, **kwargs)
@@ -0,0 +1,75 @@
+"""
+Classificação de respostas do Google e controle adaptativo de ritmo (AIMD).
+
+Cada resposta é classificada como ``results``, ``empty``, ``block`` ou
+``consent`` por marcadores em bytes, antes do parse. Páginas de bloqueio e de
+consentimento nunca chegam ao spider. O delay de cada slot de download diminui
+aditivamente a cada página boa e é multiplicado a cada bloqueio.
+"""
+
+RESULTS = 'results'
+EMPTY = 'empty'
+BLOCK = 'block'
+CONSENT = 'consent'
+
+# Sinal enviado quando uma requisição é bloqueada (args: request, response, spider)
+request_blocked = object()
+
+# Marcadores procurados no corpo (bytes, sem decodificar nem converter para minúsculas)
+RESULT_MARKERS = (b'data-cid', b'VkpGBb', b'rllt__details')
+BLOCK_MARKERS = (
+    b'id="captcha-form"',
+    b'g-recaptcha',
+    b'unusual traffic from your computer network',
+    'tráfego incomum'.encode('utf-8'),
+)
+CONSENT_MARKERS = (b'consent.google.com/save', b'action="https://consent.google.')
+
+BLOCK_STATUS = {429}
+
+
+def classify_response(response):
+    """Retorna ``results``, ``empty``, ``block`` ou ``consent``"""
+    url = response.url
+    if response.status in BLOCK_STATUS or '/sorry/' in url:
+        return BLOCK
+    if 'consent.google.' in url:
+        return CONSENT
+
+    body = response.body
+    if any(marker in body for marker in RESULT_MARKERS):
+        return RESULTS
+    if any(marker in body for marker in BLOCK_MARKERS):
+        return BLOCK
+    if any(marker in body for marker in CONSENT_MARKERS):
+        return CONSENT
+    return EMPTY
+
+
+class AimdController:
+    """
+    Aumento aditivo / redução multiplicativa da taxa, aplicado ao delay:
+    cada página boa tira ``decrease`` segundos do delay (até ``min_delay``)
+    e cada bloqueio multiplica o delay por ``factor`` (até ``max_delay``).
+    """
+
+    def __init__(self, min_delay=1.0, max_delay=120.0, decrease=0.1, factor=2.0):
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.decrease = decrease
+        self.factor = factor
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(
+            min_delay=settings.getfloat('BACKOFF_MIN_DELAY', 1.0),
+            max_delay=settings.getfloat('BACKOFF_MAX_DELAY', 120.0),
+            decrease=settings.getfloat('BACKOFF_DECREASE', 0.1),
+            factor=settings.getfloat('BACKOFF_FACTOR', 2.0),
+        )
+
+    def on_success(self, delay):
+        return max(self.min_delay, delay - self.decrease)
+
+    def on_block(self, delay):
+        return min(self.max_delay, max(delay, self.min_delay) * self.factor)
@@ -0,0 +1,105 @@
+"""
+Checkpoint de jobs longos em JOBDIR/checkpoint.sqlite.
+
+Guarda o estado de paginação de cada consulta (itens, próxima página, páginas
+concluídas) e os IDs dos itens já exportados. As gravações são feitas em lote a
+cada CHECKPOINT_INTERVAL segundos (ou EXPORT_BATCH_SIZE itens), sempre logo
+depois de os sinks gravarem os seus lotes: o checkpoint nunca registra uma
+página cujos itens ainda estão só em memória.
+
+Ao reexecutar com o mesmo JOBDIR, o spider refaz as páginas pendentes de cada
+consulta a partir do checkpoint. A fila de requisições do próprio Scrapy
+(JOBDIR/requests.queue) é descartada: ela não sobrevive a um processo morto
+(kill -9, queda da máquina) e as páginas pendentes já estão no checkpoint.
+"""
+
+import json
+import os
+import shutil
+import sqlite3
+
+from twisted.internet import task
+
+
+class CheckpointStore:
+    """Estado das consultas e IDs dos itens exportados, gravados em lotes"""
+
+    def __init__(self, path, batch_size=500, interval=30):
+        self.path = path
+        self.batch_size = batch_size
+        self.interval = interval
+        self.staged_states = {}  # consulta -> estado (JSON) ainda não gravado
+        self.staged_keys = []    # IDs de itens exportados ainda não gravados
+        self.flushers = []       # chamados antes de cada gravação (ex.: ExportPipeline grava os lotes)
+        self.timer = None
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS queries (key TEXT PRIMARY KEY, state TEXT)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS emitted (key TEXT PRIMARY KEY)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+            row = self.connection.execute("SELECT value FROM meta WHERE name = 'run'").fetchone()
+            self.run = int(row[0]) + 1 if row else 1
+            self.connection.execute("INSERT OR REPLACE INTO meta VALUES ('run', ?)", (str(self.run),))
+        self.resumed = self.run > 1
+
+    @classmethod
+    def from_settings(cls, settings):
+        jobdir = settings.get('JOBDIR')
+        if not jobdir:
+            return None
+        store = cls(
+            os.path.join(jobdir, 'checkpoint.sqlite'),
+            batch_size=settings.getint('EXPORT_BATCH_SIZE', 500),
+            interval=settings.getfloat('CHECKPOINT_INTERVAL', 30),
+        )
+        if store.resumed:
+            # Chamado antes de o scheduler abrir a fila do JOBDIR
+            shutil.rmtree(os.path.join(jobdir, 'requests.queue'), ignore_errors=True)
+        return store
+
+    def load_states(self):
+        return {key: json.loads(state) for key, state in self.connection.execute("SELECT key, state FROM queries")}
+
+    def load_emitted(self):
+        return {key for (key,) in self.connection.execute("SELECT key FROM emitted")}
+
+    def stage_state(self, query, state):
+        """Registra o estado da consulta (serializado agora; gravado no próximo commit)"""
+        self.staged_states[query['search_query']] = json.dumps({
+            'query': query,
+            'items': state['items'],
+            'next_start': state['next_start'],
+            'done': state['done'],
+            'pages': sorted(state['pages']),
+        })
+
+    def stage_emitted(self, key):
+        self.staged_keys.append(key)
+        if len(self.staged_keys) >= self.batch_size:
+            self.commit()
+
+    def commit(self):
+        # Sinks primeiro: os itens das páginas registradas precisam estar gravados
+        for flush in self.flushers:
+            flush()
+        if not self.staged_states and not self.staged_keys:
+            return
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO queries VALUES (?, ?)", self.staged_states.items())
+            self.connection.executemany("INSERT OR IGNORE INTO emitted VALUES (?)", ((key,) for key in self.staged_keys))
+        self.staged_states = {}
+        self.staged_keys = []
+
+    def start(self):
+        self.timer = task.LoopingCall(self.commit)
+        self.timer.start(self.interval, now=False)
+
+    def close(self):
+        if self.timer is not None and self.timer.running:
+            self.timer.stop()
+        self.commit()
+        self.connection.close()
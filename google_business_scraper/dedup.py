@@ -0,0 +1,118 @@
+"""
+Índice de deduplicação de negócios entre páginas, consultas e execuções.
+
+A identidade de um negócio é o seu ``data-cid``; sem ele, usa-se o nome e a
+localização normalizados. O índice pode ser persistido em SQLite para valer
+entre execuções, com um filtro de Bloom opcional na frente das consultas.
+"""
+
+import hashlib
+import math
+import os
+import re
+import sqlite3
+import time
+import unicodedata
+
+_NON_ALNUM_RE = re.compile(r'[^a-z0-9]+')
+
+
+def normalize_text(text):
+    """Minúsculas, sem acentos e sem pontuação: "Salão Bela & Cia" -> "salao bela cia" """
+    if not text:
+        return ''
+    text = unicodedata.normalize('NFKD', str(text)).encode('ascii', 'ignore').decode('ascii')
+    return _NON_ALNUM_RE.sub(' ', text.lower()).strip()
+
+
+def business_key(cid=None, name=None, location=None):
+    """Chave de identidade do negócio (CID ou hash de nome + localização normalizados)"""
+    if cid:
+        return f"cid:{cid}"
+    digest = hashlib.sha1(f"{normalize_text(name)}|{normalize_text(location)}".encode('utf-8')).hexdigest()
+    return f"nl:{digest[:20]}"
+
+
+class BloomFilter:
+    """Filtro de Bloom simples: ``key in filtro`` é False com certeza para chaves nunca vistas"""
+
+    def __init__(self, capacity=1_000_000, error_rate=0.001):
+        capacity = max(capacity, 1)
+        self.size = max(int(-capacity * math.log(error_rate) / (math.log(2) ** 2)), 8)
+        self.hashes = max(int(round(self.size / capacity * math.log(2))), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class DedupIndex:
+    """
+    Conjunto de chaves já vistas. Sem ``path`` vale só para a execução atual;
+    com ``path`` as chaves são gravadas em SQLite (em lotes) e valem entre execuções.
+    """
+
+    def __init__(self, path=None, bloom_capacity=0, batch_size=500):
+        self.path = path
+        self.batch_size = batch_size
+        self.seen = set()      # chaves vistas nesta execução
+        self.pending = []      # chaves novas ainda não gravadas no SQLite
+        self.bloom = None
+        self.connection = None
+
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.connection = sqlite3.connect(path)
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS seen (key TEXT PRIMARY KEY, first_seen REAL, query TEXT)"
+            )
+            if bloom_capacity:
+                # Pré-carrega o filtro: chaves ausentes dispensam a consulta ao SQLite
+                self.bloom = BloomFilter(bloom_capacity)
+                for (key,) in self.connection.execute("SELECT key FROM seen"):
+                    self.bloom.add(key)
+
+    def _stored(self, key):
+        if self.connection is None:
+            return False
+        if self.bloom is not None and key not in self.bloom:
+            return False
+        return self.connection.execute("SELECT 1 FROM seen WHERE key = ?", (key,)).fetchone() is not None
+
+    def check_and_add(self, key, query=None):
+        """Retorna True se a chave é nova (e a registra), False se é duplicada"""
+        if key in self.seen or self._stored(key):
+            return False
+
+        self.seen.add(key)
+        if self.connection is not None:
+            if self.bloom is not None:
+                self.bloom.add(key)
+            self.pending.append((key, time.time(), query))
+            if len(self.pending) >= self.batch_size:
+                self.flush()
+        return True
+
+    def flush(self):
+        if self.connection is not None and self.pending:
+            with self.connection:
+                self.connection.executemany("INSERT OR IGNORE INTO seen VALUES (?, ?, ?)", self.pending)
+            self.pending = []
+
+    def close(self):
+        self.flush()
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
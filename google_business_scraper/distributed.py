@@ -0,0 +1,414 @@
+"""
+Modo distribuído: vários nós (workers) consomem consultas de uma fila compartilhada
+e gravam os itens em um destino compartilhado.
+
+A fila é indicada por URL em DISTRIBUTED_QUEUE:
+    sqlite:///data/fila.sqlite   (arquivo local ou em disco compartilhado; também usado nos testes)
+    redis://host:6379/0          (requer o pacote opcional ``redis``)
+
+Cada consulta é uma tarefa com lease: o nó que a pega renova o lease enquanto
+trabalha. Se o nó morrer, o lease expira e outro nó retoma a consulta do zero
+(as impressões digitais das requisições dessa consulta são esquecidas). Uma
+tarefa só é marcada como concluída depois que os seus itens foram gravados no
+destino compartilhado (entrega "pelo menos uma vez"; a coleta deduplica).
+"""
+
+import json
+import logging
+import os
+import socket
+import sqlite3
+import time
+
+from google_business_scraper.exporters import export_unique
+from google_business_scraper.items import BusinessItem
+
+logger = logging.getLogger(__name__)
+
+
+def node_name():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def open_task_queue(url, lease=600, batch_size=500):
+    """Abre a fila a partir da URL (``sqlite:///caminho`` ou ``redis://...``)"""
+    if url.startswith('sqlite:///'):
+        return SqliteTaskQueue(url[len('sqlite:///'):], lease, batch_size)
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisTaskQueue(url, lease, batch_size)
+    raise ValueError(f"DISTRIBUTED_QUEUE inválida: {url} (use sqlite:///arquivo ou redis://host:porta/db)")
+
+
+def task_queue_from_settings(settings):
+    url = settings.get('DISTRIBUTED_QUEUE')
+    if not url:
+        return None
+    return open_task_queue(
+        url,
+        lease=settings.getfloat('DISTRIBUTED_LEASE', 600),
+        batch_size=settings.getint('EXPORT_BATCH_SIZE', 500),
+    )
+
+
+class BaseTaskQueue:
+    """
+    Interface comum às filas: ``enqueue``, ``claim``, ``renew``, ``complete``,
+    ``release``, ``seen`` (impressões digitais), ``push_item``, ``iter_items`` e ``counts``.
+    """
+
+    def __init__(self, lease=600, batch_size=500):
+        self.lease = lease
+        self.batch_size = batch_size
+        self.node = node_name()
+        self.claimed = set()   # consultas em andamento neste nó
+        self.pending = []      # itens ainda não gravados no destino compartilhado
+
+    def push_item(self, item):
+        self.pending.append(json.dumps(dict(item), ensure_ascii=False))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self._write_items(self.pending)
+            self.pending = []
+
+    def complete(self, key):
+        # Itens primeiro: uma consulta concluída nunca perde itens ainda em memória
+        self.flush()
+        self._complete(key)
+        self.claimed.discard(key)
+
+    def unfinished(self):
+        counts = self.counts()
+        return counts.get('pending', 0) + counts.get('running', 0)
+
+    def close(self):
+        """Grava os itens pendentes e devolve à fila as consultas não concluídas"""
+        self.flush()
+        if self.claimed:
+            self.release(list(self.claimed))
+            self.claimed.clear()
+
+
+class SqliteTaskQueue(BaseTaskQueue):
+    """Fila em SQLite (WAL); serve para vários processos na mesma máquina ou disco compartilhado"""
+
+    def __init__(self, path, lease=600, batch_size=500):
+        super().__init__(lease, batch_size)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS tasks (key TEXT PRIMARY KEY, query TEXT, status TEXT, "
+            "lease_until REAL, node TEXT, attempts INTEGER DEFAULT 0)"
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS fingerprints (key TEXT, fingerprint TEXT, PRIMARY KEY (key, fingerprint))"
+        )
+        self.connection.execute("CREATE TABLE IF NOT EXISTS items (id INTEGER PRIMARY KEY AUTOINCREMENT, item TEXT)")
+
+    def _transaction(self, statements):
+        # BEGIN IMMEDIATE: a trava de escrita é obtida antes da leitura (claim atômico entre processos)
+        cursor = self.connection.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            result = statements(cursor)
+            cursor.execute("COMMIT")
+            return result
+        except BaseException:
+            cursor.execute("ROLLBACK")
+            raise
+
+    def enqueue(self, queries):
+        def insert(cursor):
+            added = 0
+            for query in queries:
+                cursor.execute(
+                    "INSERT OR IGNORE INTO tasks (key, query, status, lease_until) VALUES (?, ?, 'pending', 0)",
+                    (query['search_query'], json.dumps(query, ensure_ascii=False)),
+                )
+                added += cursor.rowcount
+            return added
+        return self._transaction(insert)
+
+    def claim(self):
+        """Retorna ``(consulta, retomada)`` ou ``(None, False)``; consultas com lease vencido têm prioridade"""
+        now = time.time()
+
+        def take(cursor):
+            row = cursor.execute(
+                "SELECT key, query, status FROM tasks "
+                "WHERE status = 'pending' OR (status = 'running' AND lease_until < ?) "
+                "ORDER BY status = 'running' DESC, rowid LIMIT 1", (now,)
+            ).fetchone()
+            if row is None:
+                return None, False
+            key, query, status = row
+            cursor.execute(
+                "UPDATE tasks SET status = 'running', lease_until = ?, node = ?, attempts = attempts + 1 WHERE key = ?",
+                (now + self.lease, self.node, key),
+            )
+            resumed = status == 'running'
+            if resumed:
+                # Retomada: as páginas do nó anterior precisam ser buscadas de novo
+                cursor.execute("DELETE FROM fingerprints WHERE key = ?", (key,))
+            return json.loads(query), resumed
+
+        query, resumed = self._transaction(take)
+        if query is not None:
+            self.claimed.add(query['search_query'])
+        return query, resumed
+
+    def renew(self):
+        if self.claimed:
+            until = time.time() + self.lease
+            self._transaction(lambda cursor: cursor.executemany(
+                "UPDATE tasks SET lease_until = ? WHERE key = ? AND node = ?",
+                [(until, key, self.node) for key in self.claimed],
+            ))
+
+    def _complete(self, key):
+        self._transaction(lambda cursor: cursor.execute(
+            "UPDATE tasks SET status = 'done' WHERE key = ? AND node = ?", (key, self.node)))
+
+    def release(self, keys):
+        def give_back(cursor):
+            for key in keys:
+                released = cursor.execute(
+                    "UPDATE tasks SET status = 'pending', lease_until = 0 "
+                    "WHERE key = ? AND status = 'running' AND node = ?", (key, self.node),
+                ).rowcount
+                if released:
+                    # O próximo nó recomeça a consulta: as páginas deste nó não contam como vistas
+                    cursor.execute("DELETE FROM fingerprints WHERE key = ?", (key,))
+
+        self._transaction(give_back)
+
+    def seen(self, key, fingerprint):
+        """Registra a impressão digital; True se algum nó já fez essa requisição"""
+        cursor = self.connection.execute(
+            "INSERT OR IGNORE INTO fingerprints VALUES (?, ?)", (key, fingerprint))
+        return cursor.rowcount == 0
+
+    def _write_items(self, items):
+        self._transaction(lambda cursor: cursor.executemany(
+            "INSERT INTO items (item) VALUES (?)", [(item,) for item in items]))
+
+    def iter_items(self):
+        last_id = 0
+        while True:
+            rows = self.connection.execute(
+                "SELECT id, item FROM items WHERE id > ? ORDER BY id LIMIT ?", (last_id, self.batch_size)
+            ).fetchall()
+            if not rows:
+                return
+            for row_id, item in rows:
+                yield json.loads(item)
+            last_id = rows[-1][0]
+
+    def counts(self):
+        return dict(self.connection.execute("SELECT status, COUNT(*) FROM tasks GROUP BY status"))
+
+    def close(self):
+        super().close()
+        self.connection.close()
+
+
+# Scripts Lua: conferir o dono da consulta e alterá-la na mesma operação atômica.
+# Um nó cujo lease venceu não mexe na consulta que outro nó já retomou.
+# KEYS: tasks, pending; ARGV: consulta, JSON; 1 se entrou na fila
+_ENQUEUE_SCRIPT = """
+if redis.call('HSETNX', KEYS[1], ARGV[1], ARGV[2]) == 1 then
+    redis.call('RPUSH', KEYS[2], ARGV[1])
+    return 1
+end
+return 0
+"""
+# KEYS: leases, pending, owners; ARGV: agora, lease_until, nó, prefixo das impressões digitais
+# Lease vencido primeiro; retorna {consulta, retomada} com lease e dono gravados juntos
+_CLAIM_SCRIPT = """
+local resumed = 1
+local key = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, 1)[1]
+if not key then
+    resumed = 0
+    key = redis.call('LPOP', KEYS[2])
+    if not key then
+        return nil
+    end
+end
+redis.call('ZADD', KEYS[1], ARGV[2], key)
+redis.call('HSET', KEYS[3], key, ARGV[3])
+if resumed == 1 then
+    redis.call('DEL', ARGV[4] .. key)
+end
+return {key, resumed}
+"""
+# KEYS: leases, owners; ARGV: lease_until, nó, consultas...; retorna as consultas que o nó perdeu
+_RENEW_SCRIPT = """
+local lost = {}
+for i = 3, #ARGV do
+    if redis.call('HGET', KEYS[2], ARGV[i]) == ARGV[2] then
+        redis.call('ZADD', KEYS[1], 'XX', ARGV[1], ARGV[i])
+    else
+        table.insert(lost, ARGV[i])
+    end
+end
+return lost
+"""
+# KEYS: leases, done, owners; ARGV: consulta, nó, prefixo das impressões digitais; 1 se concluída
+_COMPLETE_SCRIPT = """
+if redis.call('HGET', KEYS[3], ARGV[1]) ~= ARGV[2] then
+    return 0
+end
+redis.call('ZREM', KEYS[1], ARGV[1])
+redis.call('SADD', KEYS[2], ARGV[1])
+redis.call('HDEL', KEYS[3], ARGV[1])
+redis.call('DEL', ARGV[3] .. ARGV[1])
+return 1
+"""
+# KEYS: leases, owners, pending; ARGV: nó, prefixo das impressões digitais, consultas...; devolvidas
+_RELEASE_SCRIPT = """
+local released = 0
+for i = 3, #ARGV do
+    if redis.call('HGET', KEYS[2], ARGV[i]) == ARGV[1] and redis.call('ZREM', KEYS[1], ARGV[i]) == 1 then
+        redis.call('HDEL', KEYS[2], ARGV[i])
+        redis.call('DEL', ARGV[2] .. ARGV[i])
+        redis.call('LPUSH', KEYS[3], ARGV[i])
+        released = released + 1
+    end
+end
+return released
+"""
+
+
+class RedisTaskQueue(BaseTaskQueue):
+    """Fila em Redis: lista de pendentes, zset de leases, hash de donos e hash com as consultas"""
+
+    def __init__(self, url, lease=600, batch_size=500, prefix='gbs'):
+        super().__init__(lease, batch_size)
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("A fila redis:// requer o pacote redis (pip install redis)")
+        self.redis = redis.Redis.from_url(url)
+        self.keys = {name: f"{prefix}:{name}" for name in ('tasks', 'pending', 'leases', 'owners', 'done', 'items')}
+        self.fingerprint_prefix = f"{prefix}:fp:"
+        self._enqueue = self.redis.register_script(_ENQUEUE_SCRIPT)
+        self._claim = self.redis.register_script(_CLAIM_SCRIPT)
+        self._renew = self.redis.register_script(_RENEW_SCRIPT)
+        self._complete_if_owner = self.redis.register_script(_COMPLETE_SCRIPT)
+        self._release = self.redis.register_script(_RELEASE_SCRIPT)
+
+    def enqueue(self, queries):
+        added = 0
+        for query in queries:
+            key = query['search_query']
+            added += self._enqueue(keys=[self.keys['tasks'], self.keys['pending']],
+                                   args=[key, json.dumps(query, ensure_ascii=False)])
+        return added
+
+    def claim(self):
+        now = time.time()
+        claimed = self._claim(keys=[self.keys['leases'], self.keys['pending'], self.keys['owners']],
+                              args=[now, now + self.lease, self.node, self.fingerprint_prefix])
+        if claimed is None:
+            return None, False
+        key, resumed = claimed[0].decode('utf-8'), bool(claimed[1])
+        self.claimed.add(key)
+        return json.loads(self.redis.hget(self.keys['tasks'], key)), resumed
+
+    def renew(self):
+        if self.claimed:
+            lost = self._renew(keys=[self.keys['leases'], self.keys['owners']],
+                               args=[time.time() + self.lease, self.node, *self.claimed])
+            for key in lost:
+                key = key.decode('utf-8')
+                # Lease vencido e consulta retomada por outro nó: ela não é mais deste nó
+                logger.warning(f"Consulta retomada por outro nó: {key}")
+                self.claimed.discard(key)
+
+    def _complete(self, key):
+        if not self._complete_if_owner(keys=[self.keys['leases'], self.keys['done'], self.keys['owners']],
+                                       args=[key, self.node, self.fingerprint_prefix]):
+            logger.warning(f"Consulta retomada por outro nó, não marcada como concluída: {key}")
+
+    def release(self, keys):
+        self._release(keys=[self.keys['leases'], self.keys['owners'], self.keys['pending']],
+                      args=[self.node, self.fingerprint_prefix, *keys])
+
+    def seen(self, key, fingerprint):
+        return not self.redis.sadd(self.fingerprint_prefix + key, fingerprint)
+
+    def _write_items(self, items):
+        self.redis.rpush(self.keys['items'], *items)
+
+    def iter_items(self):
+        start = 0
+        while True:
+            items = self.redis.lrange(self.keys['items'], start, start + self.batch_size - 1)
+            if not items:
+                return
+            for item in items:
+                yield json.loads(item)
+            start += len(items)
+
+    def counts(self):
+        running = self.redis.zcard(self.keys['leases'])
+        return {
+            'pending': self.redis.llen(self.keys['pending']),
+            'running': running,
+            'done': self.redis.scard(self.keys['done']),
+        }
+
+    def close(self):
+        super().close()
+        self.redis.close()
+
+
+class SharedDupeFilter:
+    """
+    DUPEFILTER_CLASS do modo distribuído: impressões digitais compartilhadas entre os nós.
+    Implementa a interface do dupefilter do Scrapy sem importá-lo (``--enqueue`` e
+    ``--collect`` não carregam o Scrapy).
+    """
+
+    def __init__(self, task_queue, fingerprinter):
+        self.task_queue = task_queue
+        self.fingerprinter = fingerprinter
+        self.local = set()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(task_queue_from_settings(crawler.settings), crawler.request_fingerprinter)
+
+    def request_seen(self, request):
+        fingerprint = self.fingerprinter.fingerprint(request).hex()
+        query = request.meta.get('query')
+        if self.task_queue is None or not query:
+            # Requisições fora das consultas (data:, detalhes...) ficam no filtro local
+            if fingerprint in self.local:
+                return True
+            self.local.add(fingerprint)
+            return False
+        return self.task_queue.seen(query['search_query'], fingerprint)
+
+    def open(self):
+        pass
+
+    def close(self, reason):
+        if self.task_queue is not None:
+            self.task_queue.close()
+
+    def log(self, request, spider):
+        logger.debug(f"Requisição duplicada filtrada: {request}")
+
+
+def collect(task_queue, sink_class, filename, logger):
+    """Exporta os itens do destino compartilhado para um arquivo, sem duplicatas; retorna o total"""
+    # Consultas retomadas após a queda de um nó podem ter gravado o mesmo negócio duas vezes
+    items = (BusinessItem(**data) for data in task_queue.iter_items())
+    return export_unique(items, sink_class, filename, logger, task_queue.batch_size)
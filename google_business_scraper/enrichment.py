@@ -0,0 +1,180 @@
+"""
+Enriquecimento opcional dos itens com a página de detalhes de cada negócio.
+
+O cartão da busca não traz telefone, site, horário nem coordenadas. Com
+ENRICH_ENABLED, cada item com CID gera uma requisição à página do negócio no
+Google Maps (``maps?cid=...``, que redireciona para ``/maps/place/...@lat,lng``)
+e só é emitido depois que os detalhes são mesclados. Os detalhes ficam em um
+cache SQLite por CID: dentro de ENRICH_TTL o mesmo negócio nunca é buscado de
+novo, nem nesta execução nem nas próximas.
+"""
+
+import json
+import os
+import re
+import sqlite3
+import time
+
+# Campos preenchidos pelo enriquecimento
+DETAIL_FIELDS = ['url', 'phone', 'website', 'hours', 'latitude', 'longitude']
+
+# Seletores da página do negócio (Maps) e do painel do Google (ordem = prioridade)
+DETAIL_SELECTORS = {
+    'phone': [
+        'button[data-item-id^="phone:tel:"]::attr(data-item-id)',
+        'a[href^="tel:"]::attr(href)',
+        'span[data-dtype="d3ph"] span::text',
+        'span[data-dtype="d3ph"]::text',
+        '[data-phone-number]::attr(data-phone-number)',
+    ],
+    'website': [
+        'a[data-item-id="authority"]::attr(href)',
+        'a[data-attrid="visit_official_site"]::attr(href)',
+        'a[aria-label^="Site"]::attr(href)',
+    ],
+    'hours': [
+        'table.eK4R0e tr',
+        'table.WgFkxc tr',
+        '[data-attrid="kc:/location/location:hours"] table tr',
+    ],
+    'hours_label': [
+        'div.t39EBf::attr(aria-label)',
+        '[data-item-id="oh"]::attr(aria-label)',
+    ],
+}
+
+# Coordenadas: na URL final (@lat,lng), nos dados da página (!3dlat!4dlng) ou no mapa estático
+_COORDINATE_RES = [
+    re.compile(r'@(-?\d{1,2}\.\d+),(-?\d{1,3}\.\d+)'),
+    re.compile(r'!3d(-?\d{1,2}\.\d+)!4d(-?\d{1,3}\.\d+)'),
+    re.compile(r'center=(-?\d{1,2}\.\d+)(?:%2C|,)(-?\d{1,3}\.\d+)'),
+]
+_PHONE_PREFIXES = ('phone:tel:', 'tel:')
+_SPACES_RE = re.compile(r'\s+')
+
+
+def detail_url(cid):
+    """Página do negócio no Google Maps a partir do CID (data-cid do cartão)"""
+    return f'https://www.google.com/maps?cid={cid}&hl=pt-BR'
+
+
+def _clean(text):
+    return _SPACES_RE.sub(' ', text or '').strip()
+
+
+def _coordinates(text):
+    for pattern in _COORDINATE_RES:
+        match = pattern.search(text)
+        if match:
+            latitude, longitude = float(match.group(1)), float(match.group(2))
+            if -90 <= latitude <= 90 and -180 <= longitude <= 180:
+                return latitude, longitude
+    return None, None
+
+
+def extract_details(response):
+    """Campos de DETAIL_FIELDS a partir da página de detalhes (vazios se não encontrados)"""
+    def first(field):
+        for css in DETAIL_SELECTORS[field]:
+            value = _clean(response.css(css).get())
+            if value:
+                return value
+        return ''
+
+    phone = first('phone')
+    for prefix in _PHONE_PREFIXES:
+        if phone.startswith(prefix):
+            phone = phone[len(prefix):]
+
+    hours = ''
+    for css in DETAIL_SELECTORS['hours']:
+        rows = [_clean(' '.join(row.css('::text').getall())) for row in response.css(css)]
+        if rows:
+            hours = '; '.join(row for row in rows if row)
+            break
+    hours = hours or first('hours_label')
+
+    latitude, longitude = _coordinates(response.url)
+    if latitude is None:
+        latitude, longitude = _coordinates(response.text)
+
+    return {
+        'url': response.url,
+        'phone': phone,
+        'website': first('website'),
+        'hours': hours,
+        'latitude': latitude,
+        'longitude': longitude,
+    }
+
+
+class DetailCache:
+    """Detalhes por CID, com TTL (sem ``path``, apenas em memória para a execução atual)"""
+
+    def __init__(self, path=None, ttl=30 * 24 * 3600, batch_size=500):
+        self.ttl = ttl
+        self.batch_size = batch_size
+        self.pending = {}  # cid -> (detalhes, quando) ainda não gravados
+
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path or ':memory:')
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS details (cid TEXT PRIMARY KEY, fields TEXT, fetched_at REAL)"
+            )
+            self.connection.execute("DELETE FROM details WHERE fetched_at < ?", (time.time() - ttl,))
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(
+            settings.get('ENRICH_CACHE'),
+            ttl=settings.getfloat('ENRICH_TTL', 30 * 24 * 3600),
+            batch_size=settings.getint('EXPORT_BATCH_SIZE', 500),
+        )
+
+    def get(self, cid):
+        """Detalhes do CID, se buscados dentro do TTL (None caso contrário)"""
+        if cid in self.pending:
+            return self.pending[cid][0]
+        row = self.connection.execute(
+            "SELECT fields, fetched_at FROM details WHERE cid = ?", (cid,)
+        ).fetchone()
+        if row is None or time.time() - row[1] >= self.ttl:
+            return None
+        return json.loads(row[0])
+
+    def put(self, cid, fields):
+        self.pending[cid] = (fields, time.time())
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            with self.connection:
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO details VALUES (?, ?, ?)",
+                    ((cid, json.dumps(fields, ensure_ascii=False), fetched_at)
+                     for cid, (fields, fetched_at) in self.pending.items()),
+                )
+            self.pending = {}
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+
+def has_details(fields):
+    """Se a página trouxe algum detalhe além da própria URL (senão não é página de negócio)"""
+    return any(fields.get(field) not in (None, '') for field in DETAIL_FIELDS if field != 'url')
+
+
+def merge_details(item, fields):
+    """Mescla os detalhes no item (sem apagar valores que o cartão já trazia)"""
+    for field in DETAIL_FIELDS:
+        value = fields.get(field)
+        if value not in (None, ''):
+            item[field] = value
+    return item
@@ -0,0 +1,296 @@
+"""
+Backends de exportação (sinks) usados pelo ExportPipeline.
+
+Cada sink recebe lotes de linhas já ordenadas conforme ``fields`` e as grava
+de uma só vez (``executemany``, row groups, ``writerows``), nunca item a item.
+"""
+
+import csv
+import json
+import os
+import sqlite3
+from operator import attrgetter
+
+from google_business_scraper.dedup import DedupIndex, business_key
+
+# Colunas exportadas (na ordem) e seus tipos
+EXPORT_FIELDS = ['name', 'rating', 'review_count', 'address', 'city', 'state', 'category', 'url', 'cid', 'query',
+                 'confidence', 'phone', 'website', 'hours', 'latitude', 'longitude']
+FIELD_TYPES = {**dict.fromkeys(EXPORT_FIELDS, str), 'rating': float, 'review_count': int,
+               'latitude': float, 'longitude': float}
+
+
+class BaseSink:
+    """
+    Interface comum: ``open(resume)``, ``write_rows(linhas)`` e ``close()``.
+    Com ``resume`` (job retomado do checkpoint), as linhas já gravadas são mantidas.
+    """
+
+    extension = None
+    fields = EXPORT_FIELDS
+
+    def __init__(self, filename, logger):
+        self.filename = filename
+        self.logger = logger
+
+    def open(self, resume=False):
+        pass
+
+    def write_rows(self, rows):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class CsvSink(BaseSink):
+    extension = 'csv'
+
+    def open(self, resume=False):
+        if resume and os.path.exists(self.filename):
+            return
+        with open(self.filename, 'w', newline='', encoding='utf-8') as f:
+            csv.writer(f).writerow(self.fields)
+
+    def write_rows(self, rows):
+        # Arquivo aberto apenas durante a escrita do lote (modo lote pode ter milhares de saídas)
+        with open(self.filename, 'a', newline='', encoding='utf-8') as f:
+            csv.writer(f).writerows(rows)
+
+
+class JsonLinesSink(BaseSink):
+    extension = 'jsonl'
+
+    def open(self, resume=False):
+        open(self.filename, 'a' if resume else 'w', encoding='utf-8').close()
+
+    def write_rows(self, rows):
+        fields = self.fields
+        lines = [json.dumps(dict(zip(fields, row)), ensure_ascii=False) for row in rows]
+        with open(self.filename, 'a', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+
+
+class SqliteSink(BaseSink):
+    extension = 'db'
+    table = 'businesses'
+    SQL_TYPES = {str: 'TEXT', int: 'INTEGER', float: 'REAL'}
+
+    def open(self, resume=False):
+        columns = ', '.join(f"{field} {self.SQL_TYPES[FIELD_TYPES[field]]}" for field in self.fields)
+        with sqlite3.connect(self.filename) as connection:
+            if not resume:
+                connection.execute(f"DROP TABLE IF EXISTS {self.table}")
+            connection.execute(f"CREATE TABLE IF NOT EXISTS {self.table} ({columns})")
+        connection.close()
+
+    def write_rows(self, rows):
+        placeholders = ', '.join('?' for _ in self.fields)
+        connection = sqlite3.connect(self.filename)
+        try:
+            with connection:
+                connection.executemany(f"INSERT INTO {self.table} VALUES ({placeholders})", rows)
+        finally:
+            connection.close()
+
+
+class ParquetSink(BaseSink):
+    """Cada lote vira um row group; requer o pacote opcional ``pyarrow``"""
+
+    extension = 'parquet'
+
+    def open(self, resume=False):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("O formato parquet requer o pacote pyarrow (pip install pyarrow)")
+
+        arrow_types = {str: pa.string(), int: pa.int64(), float: pa.float64()}
+        self._pa = pa
+        self.schema = pa.schema([(field, arrow_types[FIELD_TYPES[field]]) for field in self.fields])
+
+        previous = None
+        if resume and os.path.exists(self.filename):
+            # Parquet não aceita append: os row groups da execução anterior são copiados para o novo arquivo
+            previous = f"{self.filename}.anterior"
+            os.replace(self.filename, previous)
+        self.writer = pq.ParquetWriter(self.filename, self.schema)
+        if previous:
+            source = pq.ParquetFile(previous)
+            for i in range(source.num_row_groups):
+                self.writer.write_table(source.read_row_group(i))
+            os.remove(previous)
+
+    def write_rows(self, rows):
+        columns = list(zip(*rows))
+        table = self._pa.Table.from_arrays(
+            [self._pa.array(column, type=self.schema.field(i).type) for i, column in enumerate(columns)],
+            schema=self.schema,
+        )
+        self.writer.write_table(table)
+
+    def close(self):
+        self.writer.close()
+
+
+def _typed(row, types):
+    """Restaura o tipo numérico de cada coluna (no CSV e no .xlsx, 5.0 e 5 são o mesmo número)"""
+    return [kind(value) if kind in (int, float) and isinstance(value, (int, float)) else value
+            for value, kind in zip(row, types)]
+
+
+def _read_journal(journal, types):
+    """Lê as linhas do diário, restaurando números gravados sem aspas"""
+    with open(journal, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f, quoting=csv.QUOTE_NONNUMERIC)
+        try:
+            for row in reader:
+                # Linha truncada por uma interrupção (campos a menos): descartar
+                if len(row) == len(types):
+                    yield _typed(row, types)
+        except (csv.Error, ValueError):
+            # Última linha truncada por uma interrupção: descartar
+            return
+
+
+def build_workbook(journal, filename, headers, types):
+    """Gera o .xlsx em modo write-only, anexando linhas inteiras a partir do diário"""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet("Resultados da Busca")
+    worksheet.append(headers)
+
+    rows = 0
+    if os.path.exists(journal):
+        for row in _read_journal(journal, types):
+            worksheet.append(row)
+            rows += 1
+
+    # Salvar em arquivo temporário e substituir: o .xlsx nunca fica corrompido
+    tmp_filename = f"{filename}.tmp"
+    workbook.save(tmp_filename)
+    os.replace(tmp_filename, filename)
+    return rows
+
+
+def drop_partial_line(journal):
+    """Remove a linha incompleta do fim do diário (processo morto no meio de uma gravação)"""
+    with open(journal, 'rb+') as f:
+        data = f.read()
+        if data and not data.endswith(b'\n'):
+            f.truncate(data.rfind(b'\n') + 1)
+
+
+def write_journal(journal, rows):
+    with open(journal, 'a', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f, quoting=csv.QUOTE_NONNUMERIC)
+        writer.writerows(['' if value is None else value for value in row] for row in rows)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def read_workbook(filename, types):
+    """Linhas de dados de um .xlsx gerado pelo XlsxSink (sem o cabeçalho)"""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(filename, read_only=True)
+    try:
+        rows = workbook.active.iter_rows(min_row=2, values_only=True)
+        return [_typed(['' if value is None else value for value in row], types) for row in rows]
+    finally:
+        workbook.close()
+
+
+class XlsxSink(BaseSink):
+    """
+    Lotes vão para um diário CSV (``[arquivo].xlsx.parcial.csv``); o .xlsx é
+    gerado em modo write-only no ``close()``. Se a execução for morta, o diário
+    é o arquivo parcial: legível no Excel e convertido em ``[arquivo].parcial.xlsx``
+    na próxima execução.
+    """
+
+    extension = 'xlsx'
+    fields = ['name', 'rating', 'review_count', 'address', 'city', 'state', 'category', 'url', 'phone', 'website',
+              'hours', 'latitude', 'longitude', 'confidence']
+    HEADERS = ['Nome', 'Avaliação', 'Número de Avaliações', 'Endereço', 'Cidade', 'UF', 'Categoria', 'URL', 'Telefone',
+               'Site', 'Horário', 'Latitude', 'Longitude', 'Confiança']
+    TYPES = [FIELD_TYPES[field] for field in fields]
+
+    def __init__(self, filename, logger):
+        super().__init__(filename, logger)
+        self.journal = f"{filename}.parcial.csv"
+
+    def open(self, resume=False):
+        if resume:
+            # Job retomado: continuar o diário ou, se o .xlsx já foi gerado, recriá-lo a partir dele
+            if os.path.exists(self.journal):
+                drop_partial_line(self.journal)
+            elif os.path.exists(self.filename):
+                write_journal(self.journal, read_workbook(self.filename, self.TYPES))
+            return
+
+        # Diário deixado por uma execução interrompida: recuperar como .xlsx parcial
+        if os.path.exists(self.journal):
+            base = self.filename[:-len('.xlsx')] if self.filename.endswith('.xlsx') else self.filename
+            partial_filename = f"{base}.parcial.xlsx"
+            try:
+                rows = build_workbook(self.journal, partial_filename, self.HEADERS, self.TYPES)
+                self.logger.warning(f"Execução anterior interrompida - {rows} itens recuperados em {partial_filename}")
+            except Exception as e:
+                self.logger.error(f"Erro ao recuperar arquivo parcial {self.journal}: {e}")
+            os.remove(self.journal)
+
+    def write_rows(self, rows):
+        write_journal(self.journal, rows)
+
+    def close(self):
+        try:
+            build_workbook(self.journal, self.filename, self.HEADERS, self.TYPES)
+        except Exception as e:
+            self.logger.error(f"Erro ao salvar arquivo Excel: {e}")
+            # Tentar salvar no diretório raiz como fallback
+            try:
+                fallback_filename = os.path.basename(self.filename)
+                build_workbook(self.journal, fallback_filename, self.HEADERS, self.TYPES)
+                self.logger.info(f"Arquivo salvo no diretório raiz: {fallback_filename}")
+            except Exception as e2:
+                self.logger.error(f"Erro ao salvar no diretório raiz: {e2}")
+                self.logger.error(f"Dados preservados no diário: {self.journal}")
+                return
+
+        if os.path.exists(self.journal):
+            os.remove(self.journal)
+
+
+SINKS = {
+    'xlsx': XlsxSink,
+    'csv': CsvSink,
+    'jsonl': JsonLinesSink,
+    'parquet': ParquetSink,
+    'sqlite': SqliteSink,
+}
+
+
+def export_unique(items, sink_class, filename, logger, batch_size=500):
+    """Grava os itens (``BusinessItem``) em um arquivo novo, sem duplicatas; retorna o total"""
+    index = DedupIndex()
+    row = attrgetter(*sink_class.fields)
+    sink = sink_class(filename, logger)
+    sink.open()
+    batch = []
+    rows = 0
+    for item in items:
+        if not index.check_and_add(business_key(item.cid, item.name, item.location)):
+            continue
+        batch.append(row(item))
+        if len(batch) >= batch_size:
+            sink.write_rows(batch)
+            rows += len(batch)
+            batch = []
+    if batch:
+        sink.write_rows(batch)
+        rows += len(batch)
+    sink.close()
+    return rows
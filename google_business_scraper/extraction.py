@@ -0,0 +1,429 @@
+"""
+Motor de extração compilado para os cartões de resultado do Google Local.
+
+Os seletores são compilados uma única vez (na criação do spider) e cada
+cartão é percorrido uma só vez, preenchendo todos os campos no mesmo passe.
+"""
+
+import re
+import time
+
+from lxml import etree
+from parsel import css2xpath
+
+from google_business_scraper.health import CARD_FIELD
+
+# Seletores para diferentes layouts do Google (ordem = prioridade)
+BUSINESS_SELECTORS = [
+    'div[data-cid]',  # Seletor principal
+    '.VkpGBb',        # Seletor alternativo
+    '.rllt__details', # Outro seletor
+    'div.VkpGBb',     # Variação
+    '.g',             # Seletor genérico do Google
+    '[data-ved]',     # Elementos com data-ved
+]
+
+FIELD_SELECTORS = {
+    'name': [
+        '.OSrXXb::text',
+        'h3::text',
+        '.BNeawe.vvjwJb.AP7Wnd::text',
+        '.LC20lb.MBeuO.DKV0Md::text',
+        'a h3::text',
+        '.r a h3::text',
+        'h3.LC20lb::text',
+        '.yuRUbf h3::text',
+    ],
+    'rating': [
+        '.BTtC6e::text',
+        'span.yi40Hd.YrbPuc::text',
+        '.AJLUJb::text',
+        '.fTKmHE99XE4__star-rating::text',
+    ],
+    'review_count': [
+        '.RDApEe.YrbPuc::text',
+        'span.RDApEe::text',
+        '.YrbPuc::text',
+    ],
+    'location': [
+        '.UaQhfb::text',
+        '.rllt__details .UaQhfb::text',
+        '.VkpGBb .UaQhfb::text',
+    ],
+}
+
+# Campos lidos de atributos do próprio cartão ou de um descendente
+ATTRIBUTE_FIELDS = {
+    'cid': 'data-cid',
+}
+
+# Contêiner das linhas do cartão ("4,9(118) · Salão de Beleza", "Mais de 3 anos no mercado · Atibaia - SP"),
+# de onde saem a categoria e a localização quando não há seletor próprio
+LINES_CLASS = 'rllt__details'
+
+# Critério de aceitação do primeiro texto encontrado por cada seletor
+FIELD_ACCEPT = {
+    'name': lambda text: bool(text and text.strip()),
+    'rating': bool,
+    'review_count': lambda text: bool(text and '(' in text),
+    'location': bool,
+}
+
+_COMPOUND_RE = re.compile(r'^(?P<tag>[a-zA-Z][\w-]*)?(?P<classes>(?:\.[\w-]+)*)$')
+
+
+def _first_text(element):
+    """Equivalente a ``::text`` + ``.get()``: primeiro nó de texto direto do elemento"""
+    if element.text is not None:
+        return element.text
+    for child in element:
+        if child.tail is not None:
+            return child.tail
+    return None
+
+
+def _lines(container):
+    """Texto de cada filho do contêiner, com os espaços normalizados"""
+    return [' '.join(''.join(child.itertext()).split()) for child in container]
+
+
+class CompiledSelector:
+    """Seletor CSS de campo (``a h3::text``, ``.A.B::text``...) pré-compilado"""
+
+    __slots__ = ('css', 'field', 'key', 'tag', 'classes', 'ancestors')
+
+    def __init__(self, css, field):
+        self.css = css
+        self.field = field
+
+        compounds = [self._parse_compound(css, part)
+                     for part in css.replace('::text', '').split()]
+        self.tag, self.classes = compounds[-1]
+        self.ancestors = compounds[:-1]
+
+        # Chave usada para indexar o seletor durante o passe único
+        self.key = sorted(self.classes)[0] if self.classes else ('<tag>', self.tag)
+
+    @staticmethod
+    def _parse_compound(css, part):
+        match = _COMPOUND_RE.match(part)
+        if not match or not part:
+            raise ValueError(f"Seletor não suportado pelo motor compilado: {css}")
+        classes = frozenset(c for c in match.group('classes').split('.') if c)
+        return match.group('tag'), classes
+
+    @staticmethod
+    def _compound_matches(compound, element):
+        tag, classes = compound
+        if tag and element.tag != tag:
+            return False
+        if classes:
+            element_classes = element.get('class')
+            if not element_classes or not classes.issubset(element_classes.split()):
+                return False
+        return True
+
+    def matches(self, element, card):
+        """Verifica os ancestrais exigidos (combinador descendente), limitado ao cartão"""
+        current = element
+        for compound in reversed(self.ancestors):
+            while True:
+                if current is card:
+                    return False
+                current = current.getparent()
+                if current is None:
+                    return False
+                if self._compound_matches(compound, current):
+                    break
+        return True
+
+
+class CompiledExtractor:
+    """Extrai todos os campos de um cartão em um único percurso da árvore"""
+
+    def __init__(self, field_selectors=None, business_selectors=None, attribute_fields=None):
+        field_selectors = field_selectors or FIELD_SELECTORS
+        business_selectors = business_selectors or BUSINESS_SELECTORS
+
+        self.fields = list(field_selectors)
+        self.attribute_fields = ATTRIBUTE_FIELDS if attribute_fields is None else attribute_fields
+        self.compiled = {
+            field: [CompiledSelector(css, field) for css in selectors]
+            for field, selectors in field_selectors.items()
+        }
+
+        # Seletores de cartão são compilados para XPath uma única vez
+        self.business_xpaths = [
+            (css, etree.XPath(css2xpath(css))) for css in business_selectors
+        ]
+
+        # Seletores vencedores (tentados primeiro nas próximas páginas)
+        self.preferred = {}
+        self.preferred_business = None
+
+        self._index = None
+        self._rebuild_index()
+
+    def apply_ranking(self, ranking):
+        """
+        Reordena as cascatas pelos acertos persistidos (``SelectorStats.ranking()``):
+        campo -> CSS do melhor para o pior; seletores sem acertos mantêm a ordem original, no fim
+        """
+        for field, order in ranking.items():
+            position = {css: rank for rank, css in enumerate(order)}
+            if field == CARD_FIELD:
+                self.business_xpaths.sort(key=lambda entry: position.get(entry[0], len(position)))
+            elif field in self.compiled:
+                self.compiled[field].sort(key=lambda selector: position.get(selector.css, len(position)))
+        self._rebuild_index()
+
+    def _ordered(self, field):
+        selectors = self.compiled[field]
+        winner = self.preferred.get(field)
+        if winner is None:
+            return selectors
+        return [winner] + [s for s in selectors if s is not winner]
+
+    def _rebuild_index(self):
+        index = {}
+        for field in self.fields:
+            for rank, selector in enumerate(self._ordered(field)):
+                index.setdefault(selector.key, []).append((rank, selector))
+        self._index = index
+
+    def find_businesses(self, root):
+        """Retorna (seletor, elementos) para o primeiro seletor de cartão com resultados"""
+        xpaths = self.business_xpaths
+        if self.preferred_business is not None:
+            xpaths = [self.preferred_business] + [x for x in xpaths if x is not self.preferred_business]
+
+        for entry in xpaths:
+            css, xpath = entry
+            elements = xpath(root)
+            if elements:
+                self.preferred_business = entry
+                return css, elements
+        return None, []
+
+    def extract(self, card):
+        """
+        Percorre o cartão uma única vez e retorna ``(valores, vencedores)``,
+        onde ``vencedores`` mapeia cada campo ao seletor CSS que o preencheu.
+        """
+        index = self._index
+        found = {}      # campo -> (rank, texto, seletor)
+        tried = set()   # seletores cujo primeiro resultado já foi avaliado
+        attributes = {}
+        lines = None
+        pending_attributes = list(self.attribute_fields.items())
+        remaining = len(self.fields) + len(pending_attributes)
+
+        for element in card.iter(etree.Element):
+            if pending_attributes:
+                for field, attribute in pending_attributes:
+                    value = element.get(attribute)
+                    if value:
+                        attributes[field] = value
+                        remaining -= 1
+                if attributes:
+                    pending_attributes = [entry for entry in pending_attributes if entry[0] not in attributes]
+
+            classes = element.get('class')
+            keys = classes.split() if classes else []
+            if lines is None and LINES_CLASS in keys:
+                lines = _lines(element)
+            keys.append(('<tag>', element.tag))
+
+            for key in keys:
+                for rank, selector in index.get(key, ()):
+                    if selector in tried:
+                        continue
+                    previous = found.get(selector.field)
+                    if previous is not None and previous[0] <= rank:
+                        continue
+                    if not selector.matches(element, card):
+                        continue
+
+                    text = _first_text(element)
+                    if text is None:
+                        # Sem texto direto: ::text segue para o próximo elemento do mesmo seletor
+                        continue
+                    tried.add(selector)
+                    if not FIELD_ACCEPT[selector.field](text):
+                        continue
+
+                    found[selector.field] = (rank, text, selector)
+                    if rank == 0:
+                        remaining -= 1
+
+            if not remaining:
+                break
+
+        values = dict.fromkeys(self.attribute_fields)
+        values.update(attributes)
+        values['lines'] = lines or []
+        winners = {}
+        changed = False
+        for field in self.fields:
+            entry = found.get(field)
+            if entry is None:
+                values[field] = None
+                continue
+            rank, text, selector = entry
+            values[field] = text
+            winners[field] = selector.css
+            if rank:
+                self.preferred[field] = selector
+                changed = True
+
+        if changed:
+            self._rebuild_index()
+
+        return values, winners
+
+    @staticmethod
+    def fallback_name(card):
+        """Quando nenhum seletor de nome funciona, usa o primeiro texto plausível"""
+        for text in card.itertext():
+            if text and len(text.strip()) > 3 and not text.strip().isdigit():
+                return text.strip()
+        return None
+
+
+# Extração alternativa (nenhum seletor de cartão encontrou resultados): um percurso da árvore,
+# em ordem do documento, com os candidatos a nome (elementos), avaliação e endereço (nós de texto)
+FALLBACK_NAME_CLASSES = frozenset(('OSrXXb', 'dbg0pd', 'qBF1Pd', 'vvjwJb'))
+_ADDRESS_PREFIXES = ('R.', 'Rua', 'Av.', 'Avenida', 'Al.', 'Alameda', 'Estr.', 'Estrada', 'Rod.', 'Praça', 'Tv.')
+_ADDRESS_MARKERS = tuple(f'{prefix} ' for prefix in _ADDRESS_PREFIXES)
+_RATING_TEXT_RE = re.compile(r'^[0-5],\d$')
+_ADDRESS_RE = re.compile(r'(?:^|[\s·,])(?:' + '|'.join(re.escape(prefix) for prefix in _ADDRESS_PREFIXES) + r')\s')
+_FALLBACK_EXCLUDED = ('Google', 'Maps')
+_NO_TEXT_TAGS = ('script', 'style')
+
+
+def _fallback_name_element(element):
+    """Títulos (h3, role="heading") e classes de nome conhecidas"""
+    if element.tag == 'h3' or element.get('role') == 'heading':
+        return True
+    classes = element.get('class')
+    return bool(classes) and not FALLBACK_NAME_CLASSES.isdisjoint(classes.split())
+
+
+def _fallback_text(text, parent_tag):
+    """Nó de texto candidato: avaliação ("4,9" em um span) ou texto com um logradouro ("63 Rua X")"""
+    if parent_tag == 'span' and len(text) < 16 and _RATING_TEXT_RE.match(text.strip()):
+        return True
+    return parent_tag not in _NO_TEXT_TAGS and any(marker in text for marker in _ADDRESS_MARKERS)
+
+
+class FallbackExtractor:
+    """
+    Último recurso quando os seletores de cartão falham: agrupa nome, avaliação e
+    endereço pelo ancestral comum mais próximo (o "cartão" implícito). Limitado em
+    itens, nós percorridos e tempo; os itens saem com confiança baixa.
+    """
+
+    # Níveis acima do nome em que avaliação e endereço ainda contam como do mesmo cartão
+    card_depth = 5
+
+    def __init__(self, max_items=20, max_nodes=2000, time_budget=0.05):
+        self.max_items = max_items
+        self.max_nodes = max_nodes
+        self.time_budget = time_budget
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(
+            max_items=settings.getint('FALLBACK_MAX_ITEMS', 20),
+            max_nodes=settings.getint('FALLBACK_MAX_NODES', 2000),
+            time_budget=settings.getfloat('FALLBACK_TIME_BUDGET', 0.05),
+        )
+
+    @staticmethod
+    def _valid_name(text):
+        return len(text) > 3 and not text.isdigit() and not any(word in text for word in _FALLBACK_EXCLUDED)
+
+    def _ancestors(self, element):
+        ancestors = []
+        for _ in range(self.card_depth):
+            element = element.getparent()
+            if element is None:
+                break
+            ancestors.append(element)
+        return ancestors
+
+    def extract(self, root, limit=None):
+        """Retorna ``[(nome, valores)]``, com ``valores`` no formato de ``CompiledExtractor.extract``"""
+        max_items = self.max_items if limit is None else min(self.max_items, limit)
+        if max_items <= 0:
+            return []
+
+        results = []
+        seen = set()
+        card = None  # (nome, valores, ancestrais do nome)
+
+        for node, parent in self._candidates(root):
+            if parent is None:
+                # Elemento: candidato a nome, inicia um novo cartão
+                text = ' '.join(''.join(node.itertext()).split())
+                if text in seen or not self._valid_name(text):
+                    continue
+                if self._flush(card, results) and len(results) >= max_items:
+                    card = None
+                    break
+                seen.add(text)
+                card = (text, {'name': text, 'rating': None, 'review_count': None, 'location': None, 'cid': None},
+                        set(self._ancestors(node)))
+                continue
+
+            # Texto: avaliação ou endereço, do cartão atual se tiver um ancestral próximo em comum com o nome
+            if card is None:
+                continue
+            if parent not in card[2] and card[2].isdisjoint(self._ancestors(parent)):
+                continue
+            text = ' '.join(node.split())
+            values = card[1]
+            if _RATING_TEXT_RE.match(text):
+                if values['rating'] is None:
+                    values['rating'] = text
+            elif values['location'] is None and _ADDRESS_RE.search(text):
+                # "Mais de 3 anos no mercado · 63 Rua X": o endereço é o último trecho
+                values['location'] = text.split('·')[-1].strip()
+
+        if len(results) < max_items:
+            self._flush(card, results)
+        return results
+
+    def _candidates(self, root):
+        """
+        Percorre a árvore uma única vez, em ordem do documento, até ``max_nodes`` elementos ou
+        ``time_budget`` segundos: ``(elemento, None)`` para nomes e ``(texto, elemento dono)``
+        para avaliações e endereços (o dono de um ``tail`` é o elemento que o precede).
+        """
+        deadline = time.perf_counter() + self.time_budget
+        nodes = 0
+        for event, element in etree.iterwalk(root, events=('start', 'end')):
+            if event == 'end':
+                tail = element.tail
+                parent = element.getparent()
+                if tail and parent is not None and _fallback_text(tail, parent.tag):
+                    yield tail, element
+                continue
+
+            nodes += 1
+            if nodes > self.max_nodes or (nodes % 64 == 0 and time.perf_counter() > deadline):
+                return
+            if not isinstance(element.tag, str):
+                continue
+            if _fallback_name_element(element):
+                yield element, None
+            if element.text and _fallback_text(element.text, element.tag):
+                yield element.text, element
+
+    @staticmethod
+    def _flush(card, results):
+        """Só vira item o nome com avaliação ou endereço (títulos de seção, trechos de avaliações etc. ficam de fora)"""
+        if card is None or not (card[1]['rating'] or card[1]['location']):
+            return False
+        results.append(card[:2])
+        return True
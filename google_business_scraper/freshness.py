@@ -0,0 +1,136 @@
+"""
+Cache de frescor por consulta para recrawls incrementais.
+
+Guarda, para cada consulta, quando ela foi buscada e o hash do seu conteúdo,
+além do hash de cada negócio encontrado. Consultas dentro do TTL são puladas
+(ou servidas do cache) e, ao recrawlear, apenas negócios novos ou alterados
+são emitidos.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+from google_business_scraper.dedup import business_key
+
+# Campos que definem se um negócio mudou (o termo de busca não entra)
+HASHED_FIELDS = ['name', 'rating', 'review_count', 'address', 'city', 'state', 'category', 'url', 'cid']
+
+
+def item_hash(item):
+    payload = json.dumps([item.get(field) for field in HASHED_FIELDS], ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+class FreshnessCache:
+    def __init__(self, path, ttl=24 * 3600, mode='skip', batch_size=500):
+        if mode not in ('skip', 'serve'):
+            raise ValueError(f"FRESHNESS_MODE inválido: {mode} (opções: skip, serve)")
+        self.path = path
+        self.ttl = ttl
+        self.mode = mode
+        self.batch_size = batch_size
+        self.crawled = {}  # consulta -> {chave: hash} dos negócios vistos nesta execução
+        self.completed = set()  # consultas concluídas sem falhas nesta execução
+        self.pending = []
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS queries "
+                "(query TEXT PRIMARY KEY, fetched_at REAL, content_hash TEXT, items INTEGER)"
+            )
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS businesses "
+                "(query TEXT, key TEXT, item_hash TEXT, item TEXT, updated_at REAL, PRIMARY KEY (query, key))"
+            )
+
+    @classmethod
+    def from_settings(cls, settings):
+        path = settings.get('FRESHNESS_CACHE')
+        if not path:
+            return None
+        return cls(
+            path,
+            ttl=settings.getfloat('FRESHNESS_TTL', 24 * 3600),
+            mode=settings.get('FRESHNESS_MODE', 'skip'),
+            batch_size=settings.getint('EXPORT_BATCH_SIZE', 500),
+        )
+
+    def is_fresh(self, search_query):
+        row = self.connection.execute(
+            "SELECT fetched_at FROM queries WHERE query = ?", (search_query,)
+        ).fetchone()
+        return row is not None and time.time() - row[0] < self.ttl
+
+    def cached_items(self, search_query):
+        """Itens da última busca da consulta (modo ``serve``)"""
+        rows = self.connection.execute(
+            "SELECT item FROM businesses WHERE query = ?", (search_query,)
+        )
+        return [json.loads(item) for (item,) in rows]
+
+    def record(self, search_query, item):
+        """Registra o negócio; retorna True se ele é novo ou mudou desde a última busca"""
+        key = business_key(item.cid, item.name, item.location)
+        digest = item_hash(item)
+        self.crawled.setdefault(search_query, {})[key] = digest
+
+        row = self.connection.execute(
+            "SELECT item_hash FROM businesses WHERE query = ? AND key = ?", (search_query, key)
+        ).fetchone()
+        if row is not None and row[0] == digest:
+            return False
+
+        self.pending.append((search_query, key, digest, json.dumps(dict(item), ensure_ascii=False), time.time()))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+        return True
+
+    def complete(self, search_query):
+        """Consulta buscada até o fim e sem falhas: passa a contar como fresca no ``close()``"""
+        self.completed.add(search_query)
+
+    def flush(self):
+        if self.pending:
+            with self.connection:
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO businesses VALUES (?, ?, ?, ?, ?)", self.pending
+                )
+            self.pending = []
+
+    def close(self):
+        """
+        Grava os negócios alterados e, nas consultas concluídas sem falhas,
+        remove os que sumiram e as marca como frescas (consultas interrompidas,
+        bloqueadas ou com erro são buscadas de novo). Retorna quantas
+        consultas tiveram exatamente o mesmo conteúdo da última busca.
+        """
+        self.flush()
+        now = time.time()
+        rows = []
+        stale = []
+        unchanged = 0
+        for search_query in self.completed:
+            seen = self.crawled.get(search_query, {})
+            content_hash = hashlib.sha1(''.join(sorted(seen.values())).encode('ascii')).hexdigest()
+            previous = self.connection.execute(
+                "SELECT content_hash FROM queries WHERE query = ?", (search_query,)
+            ).fetchone()
+            if previous is not None and previous[0] == content_hash:
+                unchanged += 1
+            rows.append((search_query, now, content_hash, len(seen)))
+
+            stored = self.connection.execute("SELECT key FROM businesses WHERE query = ?", (search_query,))
+            stale.extend((search_query, key) for (key,) in stored if key not in seen)
+
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO queries VALUES (?, ?, ?, ?)", rows)
+            self.connection.executemany("DELETE FROM businesses WHERE query = ? AND key = ?", stale)
+        self.connection.close()
+        return unchanged
@@ -0,0 +1,148 @@
+"""
+Saúde dos seletores: acertos por seletor persistidos entre execuções.
+
+Para cada cascata (seletores de cartão e seletores de cada campo) é contado
+quantas vezes cada seletor venceu e, nos seletores de cartão, quantos cartões
+ele trouxe. As contagens das execuções anteriores perdem peso
+(SELECTOR_STATS_DECAY) a cada execução, e a cascata passa a começar pelos
+seletores que mais acertam. Quando a taxa de acerto de um campo em uma janela
+recente cai bem abaixo da histórica, um alerta é emitido: em geral, o Google
+mudou o layout.
+"""
+
+import os
+import sqlite3
+
+# Nome da cascata dos seletores de cartão (as demais usam o nome do campo)
+CARD_FIELD = '_card'
+
+
+class SelectorStats:
+    """Contagens por seletor (persistidas em SQLite) e alertas de queda na taxa de acerto"""
+
+    def __init__(self, path, decay=0.5, window=200, page_window=10, ratio=0.5, min_rate=0.3, alert=None):
+        self.path = path
+        self.window = window
+        self.page_window = page_window
+        self.ratio = ratio
+        self.min_rate = min_rate
+        self.alert = alert          # alert(campo, taxa da janela, taxa histórica)
+        self.selectors = {}         # (campo, seletor) -> [vitórias, rendimento]
+        self.fields = {}            # campo -> [acertos, erros]
+        self.recent = {}            # campo -> acertos na janela atual
+        self.recent_cards = 0
+        self.recent_pages = 0
+        self.alerting = set()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS selectors "
+                "(field TEXT, selector TEXT, hits REAL, yield REAL, PRIMARY KEY (field, selector))"
+            )
+            self.connection.execute("CREATE TABLE IF NOT EXISTS fields (field TEXT PRIMARY KEY, hits REAL, misses REAL)")
+        # Execuções anteriores valem cada vez menos: o layout atual pesa mais
+        for field, selector, hits, yield_ in self.connection.execute("SELECT * FROM selectors"):
+            self.selectors[(field, selector)] = [hits * decay, yield_ * decay]
+        for field, hits, misses in self.connection.execute("SELECT * FROM fields"):
+            self.fields[field] = [hits * decay, misses * decay]
+
+    @classmethod
+    def from_settings(cls, settings, alert=None):
+        path = settings.get('SELECTOR_STATS')
+        if not path:
+            return None
+        if not os.path.isabs(path):
+            from scrapy.utils.project import data_path
+            path = data_path(path)
+        return cls(
+            path,
+            decay=settings.getfloat('SELECTOR_STATS_DECAY', 0.5),
+            window=settings.getint('SELECTOR_ALERT_WINDOW', 200),
+            page_window=settings.getint('SELECTOR_ALERT_PAGES', 10),
+            ratio=settings.getfloat('SELECTOR_ALERT_RATIO', 0.5),
+            alert=alert,
+        )
+
+    def _count(self, field, selector, found, amount=1):
+        if selector is not None:
+            entry = self.selectors.setdefault((field, selector), [0.0, 0.0])
+            entry[0] += 1
+            entry[1] += amount
+        totals = self.fields.setdefault(field, [0.0, 0.0])
+        totals[0 if found else 1] += 1
+        if found:
+            self.recent[field] = self.recent.get(field, 0) + 1
+
+    def record_page(self, selector, cards):
+        """Página extraída: seletor de cartão vencedor (None = nenhum funcionou) e nº de cartões"""
+        self._count(CARD_FIELD, selector, selector is not None, cards)
+        self.recent_pages += 1
+        if self.recent_pages >= self.page_window:
+            self._check([CARD_FIELD], self.recent_pages)
+            self.recent_pages = 0
+
+    def record_card(self, fields, winners):
+        """
+        Cartão extraído: ``winners`` mapeia cada campo encontrado ao seletor que o preencheu.
+        Retorna True ao fechar uma janela (momento de reordenar as cascatas).
+        """
+        for field in fields:
+            selector = winners.get(field)
+            self._count(field, selector, selector is not None)
+        self.recent_cards += 1
+        if self.recent_cards < self.window:
+            return False
+        self._check(fields, self.recent_cards)
+        self.recent_cards = 0
+        self.save()
+        return True
+
+    def hit_rate(self, field):
+        hits, misses = self.fields.get(field, (0, 0))
+        return hits / (hits + misses) if hits + misses else None
+
+    def _check(self, fields, observations):
+        """Fim de uma janela: compara a taxa de acerto recente com a histórica"""
+        for field in fields:
+            found = self.recent.pop(field, 0)
+            hits, misses = self.fields.get(field, (0, 0))
+            # Taxa histórica sem a janela atual
+            hits, misses = hits - found, misses - (observations - found)
+            if hits + misses <= 0:
+                continue
+            rate, baseline = found / observations, hits / (hits + misses)
+            if baseline < self.min_rate:
+                continue
+            if rate < baseline * self.ratio:
+                if field not in self.alerting and self.alert is not None:
+                    self.alert(field, rate, baseline)
+                self.alerting.add(field)
+            else:
+                self.alerting.discard(field)
+
+    def ranking(self):
+        """Campo -> seletores com acertos, do que mais acerta para o que menos acerta"""
+        ranking = {}
+        for (field, selector), (hits, _) in sorted(self.selectors.items(), key=lambda entry: -entry[1][0]):
+            if hits > 0:
+                ranking.setdefault(field, []).append(selector)
+        return ranking
+
+    def save(self):
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO selectors VALUES (?, ?, ?, ?)",
+                ((field, selector, hits, yield_) for (field, selector), (hits, yield_) in self.selectors.items()),
+            )
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO fields VALUES (?, ?, ?)",
+                ((field, hits, misses) for field, (hits, misses) in self.fields.items()),
+            )
+
+    def close(self):
+        self.save()
+        self.connection.close()
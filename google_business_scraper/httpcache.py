@@ -0,0 +1,190 @@
+"""
+Armazenamento do cache HTTP do Scrapy em um único SQLite (HTTPCACHE_STORAGE).
+
+No lugar dos milhares de arquivos pequenos do ``FilesystemCacheStorage``, cada
+resposta é uma linha (chave = fingerprint da requisição) com o corpo comprimido
+(gzip ou zstd). Respostas mais velhas que HTTPCACHE_EXPIRATION_SECS são
+ignoradas e removidas ao abrir; acima de HTTPCACHE_MAX_BYTES, as mais antigas
+são descartadas. Uma resposta que veio de um redirecionamento (``maps?cid=...``
+-> ``/maps/place/...``) também fica acessível pelo fingerprint da requisição
+original: na próxima execução a requisição original já é servida pelo cache.
+
+Serve para desenvolvimento: depois de uma execução com o cache ativo, as
+páginas podem ser extraídas de novo, sem rede, com
+``python -m google_business_scraper.replay --cache .scrapy/httpcache/business.sqlite``.
+"""
+
+import gzip
+import json
+import logging
+import os
+import sqlite3
+import time
+
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.project import data_path
+
+logger = logging.getLogger(__name__)
+
+# Ao passar de HTTPCACHE_MAX_BYTES, libera espaço até esta fração (evita despejar a cada gravação)
+EVICTION_TARGET = 0.9
+# Redirecionamentos cujo destino expirou ou foi despejado
+DELETE_ORPHAN_REDIRECTS = "DELETE FROM redirects WHERE target NOT IN (SELECT fingerprint FROM responses)"
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError("HTTPCACHE_COMPRESSION = 'zstd' requer o pacote zstandard (pip install zstandard)")
+    return zstandard
+
+
+def compress(body, codec):
+    if codec == 'zstd':
+        return _zstd().ZstdCompressor(level=9).compress(body)
+    if codec == 'gzip':
+        return gzip.compress(body, compresslevel=6)
+    return body
+
+
+def decompress(data, codec):
+    if codec == 'zstd':
+        return _zstd().ZstdDecompressor().decompress(data)
+    if codec == 'gzip':
+        return gzip.decompress(data)
+    return data
+
+
+def build_response(url, status, headers, body):
+    """Recria a resposta (HtmlResponse, TextResponse...) a partir da linha do cache"""
+    headers = Headers({name: values for name, values in json.loads(headers).items()})
+    respcls = responsetypes.from_args(headers=headers, url=url, body=body)
+    return respcls(url=url, headers=headers, status=status, body=body)
+
+
+class SqliteCacheStorage:
+    """Respostas comprimidas em HTTPCACHE_DIR/<spider>.sqlite, com TTL e limite de tamanho"""
+
+    def __init__(self, settings):
+        self.cachedir = data_path(settings['HTTPCACHE_DIR'], createdir=True)
+        self.expiration_secs = settings.getint('HTTPCACHE_EXPIRATION_SECS')
+        self.max_bytes = settings.getint('HTTPCACHE_MAX_BYTES', 0)
+        self.codec = settings.get('HTTPCACHE_COMPRESSION', 'gzip')
+        if self.codec == 'zstd':
+            _zstd()
+        self.connection = None
+        self.total_bytes = 0
+
+    def open_spider(self, spider):
+        self.path = os.path.join(self.cachedir, f'{spider.name}.sqlite')
+        self.connection = open_cache(self.path)
+        if self.expiration_secs > 0:
+            with self.connection:
+                expired = self.connection.execute(
+                    "DELETE FROM responses WHERE stored_at < ?", (time.time() - self.expiration_secs,)
+                ).rowcount
+                self.connection.execute(DELETE_ORPHAN_REDIRECTS)
+            if expired:
+                spider.logger.info(f"Cache HTTP: {expired} respostas expiradas removidas")
+        self.total_bytes = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        self._fingerprinter = spider.crawler.request_fingerprinter
+        logger.debug(f"Cache HTTP em {self.path} ({self.total_bytes / 1024 / 1024:.1f} MB)")
+
+    def close_spider(self, spider):
+        self.connection.close()
+
+    def retrieve_response(self, spider, request):
+        fingerprint = self._fingerprinter.fingerprint(request).hex()
+        # A resposta da própria requisição ou, se ela foi redirecionada, a do destino
+        row = self.connection.execute(
+            "SELECT url, status, headers, body, codec, stored_at FROM responses "
+            "WHERE fingerprint IN (?, (SELECT target FROM redirects WHERE fingerprint = ?)) "
+            "ORDER BY fingerprint = ? DESC LIMIT 1",
+            (fingerprint, fingerprint, fingerprint),
+        ).fetchone()
+        if row is None:
+            return None
+        url, status, headers, body, codec, stored_at = row
+        if 0 < self.expiration_secs < time.time() - stored_at:
+            return None
+        request.meta['cache_timestamp'] = stored_at
+        return build_response(url, status, headers, decompress(body, codec))
+
+    def store_response(self, spider, request, response):
+        fingerprint = self._fingerprinter.fingerprint(request).hex()
+        body = compress(response.body, self.codec)
+        headers = json.dumps({
+            name.decode('latin-1'): [value.decode('latin-1') for value in values]
+            for name, values in response.headers.items()
+        })
+        with self.connection:
+            previous = self.connection.execute(
+                "SELECT size FROM responses WHERE fingerprint = ?", (fingerprint,)
+            ).fetchone()
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (fingerprint, response.url, response.status, headers, body, self.codec, len(body), time.time()),
+            )
+            # Requisições anteriores ao redirecionamento apontam para esta resposta
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO redirects VALUES (?, ?)",
+                [(self._fingerprinter.fingerprint(request.replace(url=url)).hex(), fingerprint)
+                 for url in request.meta.get('redirect_urls', [])],
+            )
+        self.total_bytes += len(body) - (previous[0] if previous else 0)
+        if self.max_bytes and self.total_bytes > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """Remove as respostas mais antigas até ficar abaixo de EVICTION_TARGET x HTTPCACHE_MAX_BYTES"""
+        excess = self.total_bytes - self.max_bytes * EVICTION_TARGET
+        evicted = []
+        for fingerprint, size in self.connection.execute("SELECT fingerprint, size FROM responses ORDER BY stored_at"):
+            if excess <= 0:
+                break
+            evicted.append((fingerprint,))
+            excess -= size
+            self.total_bytes -= size
+        with self.connection:
+            self.connection.executemany("DELETE FROM responses WHERE fingerprint = ?", evicted)
+            self.connection.execute(DELETE_ORPHAN_REDIRECTS)
+        logger.info(f"Cache HTTP: {len(evicted)} respostas antigas removidas (limite de {self.max_bytes} bytes)")
+
+
+def open_cache(path):
+    connection = sqlite3.connect(path)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    with connection:
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses (fingerprint TEXT PRIMARY KEY, url TEXT, status INTEGER, "
+            "headers TEXT, body BLOB, codec TEXT, size INTEGER, stored_at REAL)"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS responses_stored_at ON responses (stored_at)")
+        connection.execute("CREATE TABLE IF NOT EXISTS redirects (fingerprint TEXT PRIMARY KEY, target TEXT)")
+    return connection
+
+
+def iter_cached_responses(path, batch_size=100):
+    """Todas as respostas 200 do cache, na ordem em que foram gravadas (reextração)"""
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Cache HTTP não encontrado: {path}")
+    connection = open_cache(path)
+    try:
+        # INSERT OR REPLACE dá um rowid novo a cada gravação: rowid segue a ordem de gravação
+        last_rowid = 0
+        while True:
+            rows = connection.execute(
+                "SELECT rowid, url, status, headers, body, codec FROM responses "
+                "WHERE status = 200 AND rowid > ? ORDER BY rowid LIMIT ?",
+                (last_rowid, batch_size),
+            ).fetchall()
+            if not rows:
+                return
+            for _, url, status, headers, body, codec in rows:
+                yield build_response(url, status, headers, decompress(body, codec))
+            last_rowid = rows[-1][0]
+    finally:
+        connection.close()
@@ -1,10 +1,77 @@
-import scrapy
-
-class BusinessItem(scrapy.Item):
-    # Definir todos os campos que serão usados
-    name = scrapy.Field()
-    rating = scrapy.Field()
-    review_count = scrapy.Field()
-    location = scrapy.Field()
-    category = scrapy.Field()
-    url = scrapy.Field()
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass(init=False)
+class BusinessItem:
+    """
+    Negócio extraído, com os campos já convertidos na extração (avaliação em
+    float, número de avaliações em int, localização separada em endereço,
+    cidade e UF). ``__slots__`` evita um ``__dict__`` por item.
+    """
+
+    __slots__ = ('name', 'rating', 'review_count', 'address', 'city', 'state',
+                 'category', 'url', 'cid', 'query', 'confidence',
+                 'phone', 'website', 'hours', 'latitude', 'longitude')
+
+    name: str
+    rating: Optional[float]
+    review_count: Optional[int]
+    address: str
+    city: str
+    state: str
+    category: str
+    url: str
+    cid: Optional[str]    # ID do Google (data-cid), identifica o negócio
+    query: Optional[str]  # Termo de busca que originou o item
+    confidence: str       # 'high' ou 'low' (extração alternativa, sem os seletores de cartão)
+    # Preenchidos pelo enriquecimento com a página de detalhes (ENRICH_ENABLED)
+    phone: str
+    website: str
+    hours: str
+    latitude: Optional[float]
+    longitude: Optional[float]
+
+    fields = __slots__
+
+    def __init__(self, name='', rating=None, review_count=None, address='', city='', state='',
+                 category='', url='', cid=None, query=None, confidence='high',
+                 phone='', website='', hours='', latitude=None, longitude=None):
+        self.name = name
+        self.rating = rating
+        self.review_count = review_count
+        self.address = address
+        self.city = city
+        self.state = state
+        self.category = category
+        self.url = url
+        self.cid = cid
+        self.query = query
+        self.confidence = confidence
+        self.phone = phone
+        self.website = website
+        self.hours = hours
+        self.latitude = latitude
+        self.longitude = longitude
+
+    @property
+    def location(self):
+        """Localização completa (endereço, cidade e UF), usada na chave de deduplicação"""
+        return ' '.join(part for part in (self.address, self.city, self.state) if part)
+
+    # Acesso no estilo dicionário (item['name'], dict(item)), como no antigo scrapy.Item
+    def keys(self):
+        return self.fields
+
+    def __getitem__(self, field):
+        if field not in self.fields:
+            raise KeyError(field)
+        return getattr(self, field)
+
+    def __setitem__(self, field, value):
+        if field not in self.fields:
+            raise KeyError(f"BusinessItem não tem o campo: {field}")
+        setattr(self, field, value)
+
+    def get(self, field, default=None):
+        return getattr(self, field, default) if field in self.fields else default
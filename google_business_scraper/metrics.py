@@ -0,0 +1,214 @@
+"""
+Métricas do crawl: contadores e histogramas expostos nas estatísticas do Scrapy
+e, opcionalmente, em um endpoint HTTP no formato do Prometheus.
+
+O ``MetricsExtension`` coloca o registro em ``spider.metrics``; o spider e os
+pipelines registram nele os tempos do caminho crítico (parse, pipelines...).
+"""
+
+import bisect
+import functools
+import time
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.web import resource
+
+# Limites dos histogramas (segundos), no estilo dos buckets padrão do Prometheus
+TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+COUNT_BUCKETS = (0, 1, 5, 10, 15, 20, 30, 50, 100)
+
+HELP = {
+    'request_latency_seconds': 'Latência de download das respostas',
+    'parse_seconds': 'Tempo de extração por página',
+    'items_per_page': 'Itens extraídos por página',
+    'pipeline_seconds': 'Tempo de cada pipeline por item',
+    'selector_hits_total': 'Campos preenchidos por seletor',
+    'selector_misses_total': 'Campos não encontrados em nenhum seletor',
+    'selector_alerts_total': 'Quedas na taxa de acerto dos seletores (SELECTOR_STATS)',
+}
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class Histogram:
+    """Histograma cumulativo (contagem por limite superior, soma e total)"""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        i = bisect.bisect_left(self.buckets, value)
+        if i < len(self.buckets):
+            self.counts[i] += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield bound, total
+
+
+class MetricsRegistry:
+    """Contadores e histogramas por nome + rótulos"""
+
+    def __init__(self, prefix='gbs'):
+        self.prefix = prefix
+        self.counters = {}    # nome -> {rótulos: valor}
+        self.histograms = {}  # nome -> {rótulos: Histogram}
+
+    def inc(self, name, value=1, **labels):
+        series = self.counters.setdefault(name, {})
+        key = _label_key(labels)
+        series[key] = series.get(key, 0) + value
+
+    def observe(self, name, value, buckets=TIME_BUCKETS, **labels):
+        series = self.histograms.setdefault(name, {})
+        key = _label_key(labels)
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series[key] = Histogram(buckets)
+        histogram.observe(value)
+
+    def to_stats(self, stats):
+        """Copia as métricas para as estatísticas do crawl (``metrics/...``)"""
+        for name, series in self.counters.items():
+            for key, value in series.items():
+                suffix = ''.join(f'/{v}' for _, v in key)
+                stats.set_value(f'metrics/{name}{suffix}', value)
+        for name, series in self.histograms.items():
+            for key, histogram in series.items():
+                suffix = ''.join(f'/{v}' for _, v in key)
+                stats.set_value(f'metrics/{name}{suffix}/count', histogram.count)
+                if histogram.count:
+                    stats.set_value(f'metrics/{name}{suffix}/avg', round(histogram.sum / histogram.count, 6))
+
+    def render(self, stats=None):
+        """Texto no formato de exposição do Prometheus"""
+        lines = []
+        for name, series in sorted(self.counters.items()):
+            metric = f'{self.prefix}_{name}'
+            lines.append(f'# HELP {metric} {HELP.get(name, name)}')
+            lines.append(f'# TYPE {metric} counter')
+            for key, value in series.items():
+                lines.append(f'{metric}{_format_labels(key)} {value}')
+
+        for name, series in sorted(self.histograms.items()):
+            metric = f'{self.prefix}_{name}'
+            lines.append(f'# HELP {metric} {HELP.get(name, name)}')
+            lines.append(f'# TYPE {metric} histogram')
+            for key, histogram in series.items():
+                for bound, total in histogram.cumulative():
+                    lines.append(f'{metric}_bucket{_format_labels(key, [("le", bound)])} {total}')
+                lines.append(f'{metric}_bucket{_format_labels(key, [("le", "+Inf")])} {histogram.count}')
+                lines.append(f'{metric}_sum{_format_labels(key)} {histogram.sum}')
+                lines.append(f'{metric}_count{_format_labels(key)} {histogram.count}')
+
+        # Estatísticas numéricas do Scrapy (itens, respostas, bloqueios...) como gauges
+        if stats is not None:
+            metric = f'{self.prefix}_scrapy_stat'
+            lines.append(f'# TYPE {metric} gauge')
+            for key, value in sorted(stats.get_stats().items()):
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    lines.append(f'{metric}{_format_labels([("key", key)])} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+
+def timed_stage(method):
+    """Decorador para ``process_item``: registra o tempo do pipeline em ``pipeline_seconds``"""
+
+    @functools.wraps(method)
+    def wrapper(self, item, spider):
+        metrics = getattr(spider, 'metrics', None)
+        if metrics is None:
+            return method(self, item, spider)
+        started = time.perf_counter()
+        try:
+            return method(self, item, spider)
+        finally:
+            metrics.observe('pipeline_seconds', time.perf_counter() - started, stage=type(self).__name__)
+
+    return wrapper
+
+
+class MetricsExtension:
+    """
+    Ativado por METRICS_ENABLED. Registra a latência das requisições, expõe o
+    registro ao spider e, com METRICS_PORT, serve ``/metrics`` no reactor.
+    """
+
+    def __init__(self, crawler, host='127.0.0.1', port=None):
+        self.crawler = crawler
+        self.registry = MetricsRegistry()
+        self.host = host
+        self.port = port
+        self.listener = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('METRICS_ENABLED'):
+            raise NotConfigured
+        extension = cls(
+            crawler,
+            host=crawler.settings.get('METRICS_HOST', '127.0.0.1'),
+            port=crawler.settings.getint('METRICS_PORT') or None,
+        )
+        crawler.signals.connect(extension.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(extension.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(extension.response_received, signal=signals.response_received)
+        return extension
+
+    def spider_opened(self, spider):
+        spider.metrics = self.registry
+        if self.port:
+            from twisted.internet import reactor
+            from twisted.web import server
+
+            self.listener = reactor.listenTCP(self.port, server.Site(MetricsResource(self)), interface=self.host)
+            spider.logger.info(f"Métricas disponíveis em http://{self.host}:{self.port}/metrics")
+
+    def spider_closed(self, spider):
+        self.registry.to_stats(self.crawler.stats)
+        if self.listener is not None:
+            self.listener.stopListening()
+            self.listener = None
+
+    def response_received(self, response, request, spider):
+        latency = request.meta.get('download_latency')
+        if latency is not None:
+            self.registry.observe('request_latency_seconds', latency)
+
+    def render(self):
+        return self.registry.render(self.crawler.stats)
+
+
+class MetricsResource(resource.Resource):
+    """``GET /metrics`` (qualquer caminho) servido pelo próprio reactor do Scrapy"""
+
+    isLeaf = True
+
+    def __init__(self, extension):
+        super().__init__()
+        self.extension = extension
+
+    def render_GET(self, request):
+        request.setHeader(b'Content-Type', b'text/plain; version=0.0.4; charset=utf-8')
+        return self.extension.render().encode('utf-8')
@@ -1,22 +1,266 @@
 import random
+import time
 from scrapy.downloadermiddlewares.useragent import UserAgentMiddleware
+from scrapy.exceptions import IgnoreRequest
+from scrapy.utils.defer import maybe_deferred_to_future
+
+from google_business_scraper.blocking import (
+    BLOCK, BLOCK_STATUS, CONSENT, AimdController, classify_response, request_blocked,
+)
+
+USER_AGENTS = [
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:89.0) Gecko/20100101 Firefox/89.0',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/14.1.1 Safari/605.1.15',
+    'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+]
 
 class RotateUserAgentMiddleware(UserAgentMiddleware):
     def __init__(self, user_agent=''):
         self.user_agent = user_agent
-        self.user_agent_list = [
-            'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:89.0) Gecko/20100101 Firefox/89.0',
-            'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/14.1.1 Safari/605.1.15',
-            'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        ]
+        self.user_agent_list = USER_AGENTS
 
     @classmethod
     def from_crawler(cls, crawler):
         return cls(crawler.settings.get('USER_AGENT'))
 
     def process_request(self, request, spider):
+        # Requisições com identidade usam o User-Agent fixo da identidade
+        if 'identity' in request.meta:
+            return None
         ua = random.choice(self.user_agent_list)
         request.headers['User-Agent'] = ua
         return None
+
+
+class PaginationCapMiddleware:
+    """Descarta páginas pendentes de consultas que já atingiram max_results ou ficaram sem resultados"""
+
+    def process_request(self, request, spider):
+        query = request.meta.get('query')
+        if query and request.meta.get('start') and spider.query_finished(query):
+            raise IgnoreRequest(f"Consulta '{query['search_query']}' já concluída: {request.url}")
+        return None
+
+
+class Identity:
+    """Identidade de saída: proxy + User-Agent + cookie jar próprios, com slot de download próprio"""
+
+    def __init__(self, index, proxy=None, user_agent=None):
+        self.name = f"identity-{index}"
+        self.proxy = proxy
+        self.user_agent = user_agent or USER_AGENTS[index % len(USER_AGENTS)]
+        self.active = 0
+        self.last_used = 0.0
+        self.cooldown_until = 0.0
+        self.blocks = 0
+
+    def available(self, now):
+        return self.cooldown_until <= now
+
+
+class IdentityPool:
+    """Escolhe a identidade disponível menos carregada; identidades bloqueadas entram em cooldown"""
+
+    def __init__(self, identities, cooldown=300, max_cooldown=3600):
+        self.identities = identities
+        self.by_name = {identity.name: identity for identity in identities}
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+
+    @classmethod
+    def from_settings(cls, settings):
+        proxies = settings.getlist('IDENTITY_PROXIES') or [None]
+        user_agents = settings.getlist('IDENTITY_USER_AGENTS')
+        identities = [
+            Identity(i, proxy, user_agents[i % len(user_agents)] if user_agents else None)
+            for i, proxy in enumerate(proxies)
+        ]
+        return cls(
+            identities,
+            cooldown=settings.getfloat('IDENTITY_COOLDOWN', 300),
+            max_cooldown=settings.getfloat('IDENTITY_MAX_COOLDOWN', 3600),
+        )
+
+    def acquire(self, now=None):
+        """Retorna (identidade, espera em segundos); espera > 0 só quando todas estão em cooldown"""
+        now = time.time() if now is None else now
+        available = [identity for identity in self.identities if identity.available(now)]
+        if not available:
+            identity = min(self.identities, key=lambda i: i.cooldown_until)
+            return identity, identity.cooldown_until - now
+
+        identity = min(available, key=lambda i: (i.active, i.last_used))
+        identity.active += 1
+        identity.last_used = now
+        return identity, 0.0
+
+    def release(self, identity):
+        identity.active = max(identity.active - 1, 0)
+
+    def block(self, identity, now=None):
+        """Cooldown exponencial: 1x, 2x, 4x... IDENTITY_COOLDOWN, até IDENTITY_MAX_COOLDOWN"""
+        now = time.time() if now is None else now
+        if identity.cooldown_until > now:
+            # Respostas que já estavam em andamento não prolongam o cooldown
+            return identity.cooldown_until - now
+        if now - identity.cooldown_until > self.max_cooldown:
+            # Muito tempo sem bloqueios: recomeçar do cooldown mínimo
+            identity.blocks = 0
+        identity.blocks += 1
+        duration = min(self.cooldown * 2 ** (identity.blocks - 1), self.max_cooldown)
+        identity.cooldown_until = now + duration
+        return duration
+
+
+class IdentityMiddleware:
+    """
+    Atribui a cada requisição uma identidade (proxy + User-Agent + cookie jar).
+    Cada identidade tem seu próprio slot de download, então DOWNLOAD_DELAY e
+    CONCURRENT_REQUESTS_PER_DOMAIN valem por identidade e a vazão cresce com o pool.
+    """
+
+    def __init__(self, crawler, pool):
+        self.crawler = crawler
+        self.pool = pool
+        self.max_retries = crawler.settings.getint('BLOCK_MAX_RETRIES', 3)
+        # Bloqueios detectados pelo conteúdo (BlockDetectionMiddleware) também colocam a identidade em cooldown
+        crawler.signals.connect(self.request_blocked, signal=request_blocked)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler, IdentityPool.from_settings(crawler.settings))
+
+    def is_blocked(self, response):
+        if response.status in BLOCK_STATUS:
+            return True
+        # Google redireciona para a página de CAPTCHA em /sorry/
+        location = response.headers.get('Location', b'').decode('latin-1')
+        return '/sorry/' in response.url or '/sorry/' in location
+
+    async def process_request(self, request, spider):
+        identity = self._identity_for(request)
+        if identity is not None:
+            # Redirecionamentos e retries mantêm a identidade da requisição original
+            identity.active += 1
+            return None
+
+        identity, wait = self.pool.acquire()
+        while wait > 0:
+            # Todas as identidades em cooldown: aguardar sem bloquear o reactor
+            from twisted.internet import reactor
+            from twisted.internet.task import deferLater
+            spider.logger.warning(f"Todas as identidades em cooldown - aguardando {wait:.0f}s")
+            await maybe_deferred_to_future(deferLater(reactor, wait, lambda: None))
+            identity, wait = self.pool.acquire()
+
+        request.meta['identity'] = identity.name
+        request.meta['download_slot'] = identity.name
+        request.meta['cookiejar'] = identity.name
+        if identity.proxy:
+            request.meta['proxy'] = identity.proxy
+        request.headers['User-Agent'] = identity.user_agent
+        return None
+
+    def _identity_for(self, request):
+        return self.pool.by_name.get(request.meta.get('identity'))
+
+    def request_blocked(self, request, response, spider):
+        identity = self._identity_for(request)
+        if identity is None:
+            return
+        duration = self.pool.block(identity)
+        self.crawler.stats.inc_value(f'identity/blocked/{identity.name}')
+        spider.logger.warning(f"{identity.name} bloqueada ({response.status}) - cooldown de {duration:.0f}s")
+
+    def process_response(self, request, response, spider):
+        identity = self._identity_for(request)
+        if identity is None:
+            return response
+        self.pool.release(identity)
+
+        if not self.is_blocked(response):
+            return response
+
+        self.crawler.signals.send_catch_log(signal=request_blocked, request=request,
+                                            response=response, spider=spider)
+        return reissue_blocked(request, self.max_retries)
+
+    def process_exception(self, request, exception, spider):
+        identity = self._identity_for(request)
+        if identity is not None:
+            self.pool.release(identity)
+        return None
+
+
+class BlockDetectionMiddleware:
+    """
+    Classifica cada resposta (resultados, vazia, bloqueio, consentimento) antes do
+    parse. Bloqueios são reenviados e ajustam o delay do slot com AIMD; páginas de
+    bloqueio e de consentimento nunca chegam ao spider.
+    Fica abaixo do HttpCompressionMiddleware para ver o corpo já descomprimido.
+    """
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.controller = AimdController.from_settings(crawler.settings)
+        self.max_retries = crawler.settings.getint('BLOCK_MAX_RETRIES', 3)
+        self.consent_cookies = crawler.settings.getdict('CONSENT_COOKIES')
+        crawler.signals.connect(self.request_blocked, signal=request_blocked)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def _adjust_delay(self, request, adjust):
+        downloader = self.crawler.engine.downloader
+        key = downloader.get_slot_key(request)
+        slot = downloader.slots.get(key)
+        if slot is None:
+            return
+        slot.delay = adjust(slot.delay)
+        self.crawler.stats.set_value(f'backoff/delay/{key}', round(slot.delay, 2))
+
+    def request_blocked(self, request, response, spider):
+        self._adjust_delay(request, self.controller.on_block)
+
+    def process_response(self, request, response, spider):
+        # Apenas as páginas do spider (busca e detalhes); URIs data: e outras requisições passam direto
+        if 'query' not in request.meta or request.url.startswith('data:'):
+            return response
+
+        page_type = classify_response(response)
+        self.crawler.stats.inc_value(f'blocking/{page_type}')
+
+        if page_type == BLOCK:
+            spider.logger.warning(f"Página de bloqueio recebida: {request.url}")
+            self.crawler.signals.send_catch_log(signal=request_blocked, request=request,
+                                                response=response, spider=spider)
+            return reissue_blocked(request, self.max_retries)
+
+        if page_type == CONSENT:
+            # Uma nova tentativa com os cookies de consentimento; depois, desistir
+            if request.meta.get('consent_retry') or not self.consent_cookies:
+                raise IgnoreRequest(f"Página de consentimento: {request.url}")
+            spider.logger.warning(f"Página de consentimento recebida, reenviando com cookies: {request.url}")
+            retry = request.replace(dont_filter=True, cookies=self.consent_cookies)
+            retry.meta['consent_retry'] = True
+            return retry
+
+        self._adjust_delay(request, self.controller.on_success)
+        request.meta['page_type'] = page_type
+        return response
+
+
+def reissue_blocked(request, max_retries):
+    """Reenvia a requisição bloqueada por outra identidade (até ``max_retries`` vezes)"""
+    retries = request.meta.get('block_retries', 0)
+    if retries >= max_retries:
+        raise IgnoreRequest(f"Bloqueada após {retries} reenvios: {request.url}")
+
+    retry = request.replace(dont_filter=True)
+    for key in ('identity', 'download_slot', 'cookiejar', 'proxy'):
+        retry.meta.pop(key, None)
+    retry.meta['block_retries'] = retries + 1
+    return retry
@@ -0,0 +1,193 @@
+"""
+Normalização dos itens para cruzamento com outras bases: endereço em forma
+canônica, cidade e UF conferidas em um gazetteer offline e categoria do cartão
+(ou, sem ela, da consulta sem a cidade).
+
+O gazetteer é uma lista de municípios em CSV (colunas ``municipio`` e ``uf``).
+O ``municipios.csv`` do pacote traz as capitais e as principais cidades; para
+cobrir o país inteiro, aponte NORMALIZE_GAZETTEER para a lista do IBGE no mesmo
+formato. Os nomes ficam em uma trie por palavra (sem acentos): achar a cidade em
+um texto é um único passe pelas palavras. Endereços, cidades e consultas se
+repetem muito entre os itens, então cada texto distinto é resolvido uma única
+vez (cache LRU de NORMALIZE_CACHE_SIZE entradas).
+"""
+
+import csv
+import os
+import re
+from functools import lru_cache
+
+from google_business_scraper.dedup import normalize_text
+
+BUNDLED_GAZETTEER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'municipios.csv')
+
+STATES = {
+    'AC': 'Acre', 'AL': 'Alagoas', 'AP': 'Amapá', 'AM': 'Amazonas', 'BA': 'Bahia', 'CE': 'Ceará',
+    'DF': 'Distrito Federal', 'ES': 'Espírito Santo', 'GO': 'Goiás', 'MA': 'Maranhão', 'MT': 'Mato Grosso',
+    'MS': 'Mato Grosso do Sul', 'MG': 'Minas Gerais', 'PA': 'Pará', 'PB': 'Paraíba', 'PR': 'Paraná',
+    'PE': 'Pernambuco', 'PI': 'Piauí', 'RJ': 'Rio de Janeiro', 'RN': 'Rio Grande do Norte',
+    'RS': 'Rio Grande do Sul', 'RO': 'Rondônia', 'RR': 'Roraima', 'SC': 'Santa Catarina', 'SP': 'São Paulo',
+    'SE': 'Sergipe', 'TO': 'Tocantins',
+}
+_STATE_CODES = {normalize_text(name): code for code, name in STATES.items()}
+
+# Abreviações de logradouro expandidas ("R. X" -> "Rua X", "Av. Y" -> "Avenida Y")
+ABBREVIATIONS = {
+    'r': 'Rua', 'av': 'Avenida', 'al': 'Alameda', 'estr': 'Estrada', 'rod': 'Rodovia', 'tv': 'Travessa',
+    'trav': 'Travessa', 'pç': 'Praça', 'pça': 'Praça', 'lgo': 'Largo', 'jd': 'Jardim', 'vl': 'Vila', 'pq': 'Parque',
+}
+_ABBREVIATION_RE = re.compile(r'\b(' + '|'.join(ABBREVIATIONS) + r')\.\s*', re.IGNORECASE)
+_STREET_TYPES = ('Rua', 'Avenida', 'Alameda', 'Estrada', 'Rodovia', 'Travessa', 'Praça', 'Largo')
+# "63 Rua Peixoto Gomide" (formato dos cartões) -> "Rua Peixoto Gomide, 63"
+_NUMBER_FIRST_RE = re.compile(r'^(?P<number>\d+[A-Za-z]?)\s+(?P<street>(?:' + '|'.join(_STREET_TYPES) + r')\s.+)$')
+# Consultas das células do planejador: "salão de beleza perto de -23.1,-46.5"
+_NEAR_RE = re.compile(r'\s+perto de\s.*$', re.IGNORECASE)
+# Antes de um nome de logradouro, a "cidade" faz parte do endereço ("avenida paulista")
+_STREET_WORDS = {normalize_text(street_type) for street_type in _STREET_TYPES} | set(ABBREVIATIONS)
+# Palavras que sobram no fim da consulta depois de tirar a cidade ("barbearia em atibaia")
+_CONNECTORS = {'em', 'de', 'do', 'da', 'no', 'na', 'perto'}
+
+_END = ''  # Chave dos candidatos no nó da trie (nenhuma palavra é vazia)
+
+
+class Gazetteer:
+    """Municípios indexados em uma trie por palavra (nomes sem acentos e em minúsculas)"""
+
+    def __init__(self, rows):
+        self.root = {}
+        self.size = 0
+        for name, state in rows:
+            node = self.root
+            for token in normalize_text(name).split():
+                node = node.setdefault(token, {})
+            node.setdefault(_END, []).append((name, state.upper()))
+            self.size += 1
+
+    @classmethod
+    def load(cls, path=None):
+        """Lê um CSV com as colunas ``municipio`` e ``uf`` (sem ``path``, o do pacote)"""
+        with open(path or BUNDLED_GAZETTEER, encoding='utf-8', newline='') as f:
+            rows = [(row['municipio'].strip(), row['uf'].strip())
+                    for row in csv.DictReader(f) if row.get('municipio') and row.get('uf')]
+        return cls(rows)
+
+    def lookup(self, text):
+        """Candidatos ``[(município, UF)]`` cujo nome é exatamente o texto"""
+        node = self.root
+        for token in normalize_text(text).split():
+            node = node.get(token)
+            if node is None:
+                return []
+        return node.get(_END, [])
+
+    def matches(self, text):
+        """``(início, fim, candidatos)`` de cada município no texto, em palavras; o nome mais longo vence"""
+        tokens = normalize_text(text).split()
+        position = 0
+        while position < len(tokens):
+            node, end, candidates = self.root, None, None
+            for index in range(position, len(tokens)):
+                node = node.get(tokens[index])
+                if node is None:
+                    break
+                if _END in node:
+                    end, candidates = index + 1, node[_END]
+            if end is None:
+                position += 1
+                continue
+            yield position, end, candidates
+            position = end
+
+
+class Normalizer:
+    """Normaliza endereço, cidade, UF e categoria dos itens, com cache LRU por texto"""
+
+    def __init__(self, gazetteer, cache_size=100_000):
+        self.gazetteer = gazetteer
+        self.resolved = 0       # itens com cidade encontrada no gazetteer
+        self.unresolved = 0     # itens com cidade fora do gazetteer
+        self.address = lru_cache(maxsize=cache_size)(self._address)
+        self.place = lru_cache(maxsize=cache_size)(self._place)
+        self.category = lru_cache(maxsize=cache_size)(self._category)
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(
+            Gazetteer.load(settings.get('NORMALIZE_GAZETTEER')),
+            cache_size=settings.getint('NORMALIZE_CACHE_SIZE', 100_000),
+        )
+
+    def cache_hit_rate(self):
+        hits = misses = 0
+        for cached in (self.address, self.place, self.category):
+            info = cached.cache_info()
+            hits, misses = hits + info.hits, misses + info.misses
+        return hits / (hits + misses) if hits + misses else None
+
+    @staticmethod
+    def _address(address):
+        """ "63 R. Peixoto  Gomide," -> "Rua Peixoto Gomide, 63" """
+        text = ' '.join(address.split()).strip(' ,-')
+        text = _ABBREVIATION_RE.sub(lambda match: ABBREVIATIONS[match.group(1).lower()] + ' ', text)
+        match = _NUMBER_FIRST_RE.match(text)
+        if match:
+            text = f"{match.group('street')}, {match.group('number')}"
+        return text
+
+    def _place(self, city, state):
+        """``(cidade, UF, encontrada)``: nome oficial do município e UF conferida no gazetteer"""
+        state = state.strip()
+        state = state.upper() if state.upper() in STATES else _STATE_CODES.get(normalize_text(state), '')
+        city = ' '.join(city.split())
+        candidates = self.gazetteer.lookup(city) if city else []
+        if state:
+            candidates = [candidate for candidate in candidates if candidate[1] == state]
+        if not candidates:
+            return city, state, False
+        if len({uf for _, uf in candidates}) > 1:
+            # Mesmo nome em mais de uma UF e nenhuma UF no texto: só o nome é conferido
+            return candidates[0][0], '', True
+        return candidates[0][0], candidates[0][1], True
+
+    def strip_place(self, text):
+        """Tira a cidade (e a UF) do fim do texto: "salão de beleza atibaia sp" -> "salão de beleza" """
+        words = text.split()
+        if len(words) > 1 and words[-1].upper() in STATES:
+            words.pop()
+        last = None
+        for last in self.gazetteer.matches(' '.join(words)):
+            pass
+        # Só quando cada palavra vira uma palavra normalizada (as posições coincidem)
+        if (last and 0 < last[0] and last[1] == len(words) == len(normalize_text(' '.join(words)).split())
+                and normalize_text(words[last[0] - 1]) not in _STREET_WORDS):
+            words = words[:last[0]]
+        while len(words) > 1 and words[-1].lower() in _CONNECTORS:
+            words.pop()
+        return ' '.join(words)
+
+    def _category(self, category, query):
+        """Categoria do cartão; sem ela, a consulta sem a cidade. Só a inicial em maiúscula"""
+        text = ' '.join(category.split()) or self.strip_place(_NEAR_RE.sub('', query))
+        return text[:1].upper() + text[1:].lower()
+
+    def normalize(self, item):
+        """Normaliza o item no lugar e o retorna"""
+        address = self.address(item.address) if item.address else ''
+        city, state = item.city, item.state
+        found = False
+        if city or state:
+            city, state, found = self.place(city, state)
+        elif address:
+            # Só a cidade, sem vírgula ("Atibaia"): split_location a deixa no endereço
+            place = self.place(address, '')
+            if place[2]:
+                city, state, found = place
+                address = ''
+        if found:
+            self.resolved += 1
+        elif city:
+            self.unresolved += 1
+
+        item.address, item.city, item.state = address, city, state
+        item.category = self.category(item.category or '', item.query or '')
+        return item
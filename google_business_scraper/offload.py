@@ -0,0 +1,143 @@
+"""
+Extração em processos de trabalho (opcional, ver PARSE_WORKERS).
+
+O corpo bruto da resposta é enviado a um pool de processos, que faz o parse
+do HTML e a extração dos cartões e devolve dicionários simples. O reactor só
+aguarda o resultado, então continua baixando páginas enquanto os núcleos
+extraem. No máximo PARSE_QUEUE_SIZE páginas ficam no pool ao mesmo tempo.
+
+A ordem das cascatas (SELECTOR_STATS) muda durante a execução: cada página
+leva a versão atual da ordem, e o processo que a recebe só reordena os seus
+seletores quando a versão é diferente da última que aplicou.
+"""
+
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from parsel import Selector
+from scrapy.utils.defer import maybe_deferred_to_future
+from twisted.internet import defer
+
+from google_business_scraper.extraction import CompiledExtractor, FallbackExtractor
+from google_business_scraper.parsing import item_fields
+
+# Extratores do processo de trabalho (seletores vencedores valem entre as páginas do mesmo processo)
+_extractor = None
+_fallback = None
+_ranking_version = 0  # versão da ordem das cascatas aplicada em _extractor
+
+
+def _init_worker(fallback_limits=None, ranking=None):
+    global _extractor, _fallback, _ranking_version
+    _extractor = CompiledExtractor()
+    if ranking:
+        _extractor.apply_ranking(ranking)
+    _ranking_version = 0
+    _fallback = FallbackExtractor(**(fallback_limits or {}))
+
+
+def parse_page(body, encoding, search_query, limit, fallback_only=False, ranking=None, ranking_version=0):
+    """
+    Executado no processo de trabalho: HTML -> ``(seletor, campos, vencedores, segundos)``,
+    com ``campos`` uma lista de dicionários prontos para ``BusinessItem(**campos)``.
+    ``fallback_only``: página sem marcadores de resultados, só a extração alternativa.
+    ``ranking``/``ranking_version``: ordem atual das cascatas, aplicada se a versão mudou.
+    """
+    global _ranking_version
+    if _extractor is None:
+        _init_worker()
+    if ranking_version != _ranking_version:
+        _extractor.apply_ranking(ranking or {})
+        _ranking_version = ranking_version
+
+    started = time.perf_counter()
+    root = Selector(text=body.decode(encoding or 'utf-8', 'replace')).root
+    selector, cards = (None, []) if fallback_only else _extractor.find_businesses(root)
+
+    fields = []
+    winners = []
+    for card in cards:
+        if len(fields) >= limit:
+            break
+        values, card_winners = _extractor.extract(card)
+        name = values['name'] or _extractor.fallback_name(card)
+        if not name:
+            continue
+        fields.append(item_fields(values, name, search_query))
+        winners.append(card_winners)
+
+    if selector is None:
+        # Extração alternativa, com confiança baixa
+        fields = [item_fields(values, name, search_query, 'low') for name, values in _fallback.extract(root, limit)]
+
+    return selector, fields, winners, time.perf_counter() - started
+
+
+def _deferred_from_future(future):
+    """Deferred disparado no reactor quando o ``concurrent.futures.Future`` terminar"""
+    from twisted.internet import reactor
+
+    deferred = defer.Deferred()
+
+    def done(future):
+        if future.cancelled():
+            reactor.callFromThread(deferred.cancel)
+        elif future.exception() is not None:
+            reactor.callFromThread(deferred.errback, future.exception())
+        else:
+            reactor.callFromThread(deferred.callback, future.result())
+
+    future.add_done_callback(done)
+    return deferred
+
+
+class ParsePool:
+    """Pool de processos de extração com fila limitada (contrapressão sobre o parse)"""
+
+    def __init__(self, workers, queue_size=None, fallback_limits=None, ranking=None):
+        self.workers = workers
+        self.queue_size = queue_size or workers * 2
+        # 'spawn': o processo do Scrapy tem threads (DNS, snapshots), e fork com threads é inseguro
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(fallback_limits, ranking),
+        )
+        self.semaphore = defer.DeferredSemaphore(self.queue_size)
+        # A ordem inicial vai nos initargs (versão 0); as seguintes, com cada página
+        self.ranking = None
+        self.ranking_version = 0
+
+    def update_ranking(self, ranking):
+        """Nova ordem das cascatas: os processos a aplicam na próxima página que receberem"""
+        self.ranking = ranking
+        self.ranking_version += 1
+
+    @classmethod
+    def from_settings(cls, settings, ranking=None):
+        """``ranking``: ordem das cascatas vinda das estatísticas de seletores (SELECTOR_STATS)"""
+        workers = settings.getint('PARSE_WORKERS', 0)
+        if workers < 0:
+            workers = os.cpu_count() or 1
+        if not workers:
+            return None
+        fallback = FallbackExtractor.from_settings(settings)
+        fallback_limits = {'max_items': fallback.max_items, 'max_nodes': fallback.max_nodes,
+                           'time_budget': fallback.time_budget}
+        return cls(workers, settings.getint('PARSE_QUEUE_SIZE', 0) or None, fallback_limits, ranking)
+
+    async def parse(self, body, encoding, search_query, limit, fallback_only=False):
+        # Fila cheia: a página aguarda aqui, sem ocupar o reactor
+        await maybe_deferred_to_future(self.semaphore.acquire())
+        try:
+            future = self.executor.submit(parse_page, body, encoding, search_query, limit, fallback_only,
+                                          self.ranking, self.ranking_version)
+            return await maybe_deferred_to_future(_deferred_from_future(future))
+        finally:
+            self.semaphore.release()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,124 @@
+"""
+Conversão dos textos extraídos para valores nativos, no formato pt-BR do Google:
+"4,9" -> 4.9, "(1.234)" -> 1234, "(1,5 mil)" -> 1500,
+"R. X, 10 - Centro, Atibaia - SP" -> ("R. X, 10 - Centro", "Atibaia", "SP") e
+linhas do cartão -> categoria e localização.
+"""
+
+import re
+
+_RATING_RE = re.compile(r'\d+(?:[.,]\d+)?')
+_COUNT_RE = re.compile(r'(\d+(?:[.,\s]\d+)*)\s*(mil|mi|k|m)?\b', re.IGNORECASE)
+_NON_DIGIT_RE = re.compile(r'\D')
+_MULTIPLIERS = {'mil': 1_000, 'k': 1_000, 'mi': 1_000_000, 'm': 1_000_000}
+
+# "Cidade - UF" no fim da localização
+_CITY_STATE_RE = re.compile(r'^(?P<city>[^,\d]+?)\s*[-,]\s*(?P<state>[A-Z]{2})$')
+
+# Linhas do cartão: trechos separados por "·" ou "⋅"
+_SEGMENT_RE = re.compile(r'\s*[·⋅]\s*')
+_YEARS_RE = re.compile(r'^(?:mais de )?\d+ anos? no mercado$', re.IGNORECASE)
+_PRICE_PREFIXES = ('R$', '$')
+# Linhas que não trazem localização: horário, telefone, trechos de avaliações, "Serviço: ..."
+_NOT_LOCATION_PREFIXES = ('Aberto', 'Fechado', 'Fecha', 'Abre', 'Atende', '"', '“', '(')
+
+
+def parse_rating(text):
+    """ "4,9" -> 4.9 (None se não houver número)"""
+    if not text:
+        return None
+    match = _RATING_RE.search(text)
+    return float(match.group().replace(',', '.')) if match else None
+
+
+def parse_review_count(text):
+    """ "(1.234)" -> 1234, "1,5 mil" -> 1500, "2 mi" -> 2000000 (None se não houver número)"""
+    if not text:
+        return None
+    # Em "4,9 (1.234)" o número de avaliações é o que está entre parênteses
+    if '(' in text:
+        text = text[text.index('(') + 1:]
+    match = _COUNT_RE.search(text)
+    if not match:
+        return None
+
+    number, suffix = match.group(1), match.group(2)
+    if suffix:
+        # Com sufixo, o separador é decimal: "1,5 mil"
+        return int(round(float(number.replace(',', '.').replace(' ', '')) * _MULTIPLIERS[suffix.lower()]))
+    # Sem sufixo, pontos, vírgulas e espaços são separadores de milhar
+    return int(_NON_DIGIT_RE.sub('', number))
+
+
+def split_location(text):
+    """Separa a localização em (endereço, cidade, UF); partes ausentes ficam vazias"""
+    if not text:
+        return '', '', ''
+    # Descartar informações extras após "·" (telefone, horário...)
+    text = text.split('·')[0].strip().strip(',').strip()
+
+    # "Cidade - UF" ou "Cidade, UF"
+    match = _CITY_STATE_RE.match(text)
+    if match:
+        return '', match.group('city').strip(), match.group('state')
+
+    if ',' not in text:
+        return text, '', ''
+
+    address, last = (part.strip() for part in text.rsplit(',', 1))
+    match = _CITY_STATE_RE.match(last)
+    if match:
+        return address, match.group('city').strip(), match.group('state')
+    # Último trecho com números é parte do endereço ("R. X, 100")
+    if any(char.isdigit() for char in last):
+        return text, '', ''
+    return address, last, ''
+
+
+def parse_card_lines(lines, name=''):
+    """
+    Categoria e localização a partir das linhas do cartão, por exemplo
+    ["4,9(118) · Salão de Beleza", "Mais de 3 anos no mercado · Atibaia - SP", "Aberto ⋅ Fecha às 18:00"]
+    -> ("Salão de Beleza", "Atibaia - SP"). Partes não encontradas ficam vazias.
+    """
+    name = name.strip()
+    lines = [line for line in lines or () if line and line != name]
+    if not lines:
+        return '', ''
+
+    # Primeira linha: avaliação, faixa de preço e categoria (o último trecho sem números)
+    category = ''
+    for segment in _SEGMENT_RE.split(lines[0]):
+        if segment and not segment.startswith(_PRICE_PREFIXES) and not any(char.isdigit() for char in segment):
+            category = segment
+
+    # Localização: último trecho da primeira linha seguinte que não é horário, telefone ou avaliação
+    location = ''
+    for line in lines[1:] if category or '(' in lines[0] else lines:
+        if line.startswith(_NOT_LOCATION_PREFIXES) or ':' in line:
+            continue
+        segments = [segment for segment in _SEGMENT_RE.split(line) if segment and not _YEARS_RE.match(segment)]
+        if segments:
+            location = segments[-1]
+            break
+    return category, location
+
+
+def item_fields(values, name, search_query, confidence='high'):
+    """Campos do BusinessItem a partir dos textos extraídos de um cartão"""
+    category, location = parse_card_lines(values.get('lines'), name)
+    address, city, state = split_location(values.get('location') or location)
+    return {
+        'name': name.strip(),
+        'rating': parse_rating(values.get('rating')),
+        'review_count': parse_review_count(values.get('review_count')),
+        'address': address,
+        'city': city,
+        'state': state,
+        # Vazia quando o cartão não mostra a categoria (a normalização usa a consulta)
+        'category': category,
+        'url': '',
+        'cid': values.get('cid'),
+        'query': search_query,
+        'confidence': confidence,
+    }
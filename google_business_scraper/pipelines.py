@@ -1,93 +1,247 @@
-import openpyxl
-from openpyxl import Workbook
 import os
-from itemadapter import ItemAdapter
+from operator import attrgetter
+from google_business_scraper.dedup import DedupIndex, business_key
+from google_business_scraper.exporters import SINKS
+from google_business_scraper.metrics import timed_stage
+from google_business_scraper.normalization import Normalizer
+from google_business_scraper.queries import safe_filename
 
 class ValidationPipeline:
+    @timed_stage
     def process_item(self, item, spider):
-        adapter = ItemAdapter(item)
-
         # Validar se os campos obrigatórios estão presentes
-        if not adapter.get('name'):
+        if not item.name:
             spider.logger.warning(f"Item sem nome descartado: {item}")
             return None
 
         return item
 
-class ExcelExportPipeline:
+class NormalizationPipeline:
+    """Endereço canônico, cidade e UF conferidas no gazetteer offline e categoria do cartão"""
+
+    def __init__(self):
+        self.normalizer = None
+
+    def open_spider(self, spider):
+        self.normalizer = Normalizer.from_settings(spider.settings)
+        spider.logger.info(f"Normalização ativada - gazetteer com {self.normalizer.gazetteer.size} municípios")
+
+    def close_spider(self, spider):
+        normalizer = self.normalizer
+        if getattr(spider, 'crawler', None):
+            spider.crawler.stats.set_value('normalize/resolved', normalizer.resolved)
+            spider.crawler.stats.set_value('normalize/unresolved', normalizer.unresolved)
+        hit_rate = normalizer.cache_hit_rate()
+        if hit_rate is not None:
+            spider.logger.info(f"Normalização: {normalizer.resolved} cidades encontradas no gazetteer, "
+                               f"{normalizer.unresolved} fora dele (cache: {hit_rate:.0%} de acertos)")
+
+    @timed_stage
+    def process_item(self, item, spider):
+        if item:
+            self.normalizer.normalize(item)
+        return item
+
+class DeduplicationPipeline:
+    """Descarta negócios já vistos (mesmo CID, ou mesmo nome + localização)"""
+
+    def __init__(self):
+        self.index = None
+        self.duplicates = 0
+
+    def open_spider(self, spider):
+        path = spider.settings.get('DEDUP_INDEX')
+        self.index = DedupIndex(
+            path=path,
+            bloom_capacity=spider.settings.getint('DEDUP_BLOOM_CAPACITY', 0),
+            batch_size=spider.settings.getint('EXPORT_BATCH_SIZE', 500),
+        )
+        if path:
+            spider.logger.info(f"Deduplicação entre execuções ativada - índice em {path}")
+
+    def close_spider(self, spider):
+        self.index.close()
+        if self.duplicates:
+            spider.logger.info(f"Itens duplicados descartados: {self.duplicates}")
+
+    @timed_stage
+    def process_item(self, item, spider):
+        if not item:
+            return item
+
+        key = business_key(item.cid, item.name, item.location)
+        if not self.index.check_and_add(key, item.query):
+            self.duplicates += 1
+            if getattr(spider, 'crawler', None):
+                spider.crawler.stats.inc_value('dedup/duplicates')
+            spider.logger.debug(f"Item duplicado descartado: {item.name} ({key})")
+            return None
+
+        return item
+
+
+class ExportPipeline:
+    """Exporta os itens no formato de EXPORT_FORMAT (xlsx, csv, jsonl, parquet, sqlite)"""
+
+    format = None  # None = usar EXPORT_FORMAT
+
     def __init__(self):
-        self.workbook = None
-        self.worksheet = None
-        self.row_count = 1
         self.filename = None
+        self.batch_size = 500
+        self.sink_class = None
+        self.row = None
+        # Modo lote: um arquivo por consulta (nome do arquivo -> saída)
+        self.outputs = {}
+        self.routes = {}
+        # Job com checkpoint (JOBDIR): IDs dos itens já exportados, inclusive em execuções anteriores
+        self.checkpoint = None
+        self.exported = set()
+
+    def _output_filename(self, name):
+        return f"data/{name}.{self.sink_class.extension}"
+
+    def _create_output(self, spider, filename):
+        sink = self.sink_class(filename, spider.logger)
+        sink.open(resume=bool(self.checkpoint and self.checkpoint.resumed))
+        output = {'sink': sink, 'buffer': [], 'items': 0}
+        self.outputs[filename] = output
+        return output
+
+    def _flush(self, output):
+        """Grava o lote em memória de uma só vez no sink"""
+        if output['buffer']:
+            output['sink'].write_rows(output['buffer'])
+            output['buffer'] = []
+
+    def flush_outputs(self):
+        for output in self.outputs.values():
+            self._flush(output)
 
     def open_spider(self, spider):
         # Criar diretório data se não existir
         os.makedirs('data', exist_ok=True)
 
+        export_format = self.format or spider.settings.get('EXPORT_FORMAT', 'xlsx')
+        if export_format not in SINKS:
+            raise ValueError(f"Formato de exportação desconhecido: {export_format} (opções: {', '.join(SINKS)})")
+        self.sink_class = SINKS[export_format]
+        # Linha do sink lida direto dos atributos do item (tupla na ordem de ``fields``)
+        self.row = attrgetter(*self.sink_class.fields)
+        self.batch_size = max(spider.settings.getint('EXPORT_BATCH_SIZE', 500), 1)
+
+        # O checkpoint grava os lotes pendentes antes de registrar o progresso
+        self.checkpoint = getattr(spider, 'checkpoint', None)
+        if self.checkpoint:
+            self.checkpoint.flushers.append(self.flush_outputs)
+            if self.checkpoint.resumed:
+                self.exported = self.checkpoint.load_emitted()
+                spider.logger.info(f"Job retomado - {len(self.exported)} itens já exportados")
+
         # Determinar nome do arquivo baseado na busca
         search_query = getattr(spider, 'search_query', 'salao_de_beleza_atibaia')
 
-        # Limpar o nome do arquivo
-        safe_filename = search_query.replace(' ', '_').replace(',', '').replace('/', '_').lower()
-        safe_filename = ''.join(c for c in safe_filename if c.isalnum() or c in ('_', '-'))
-
         # Usar configuração do settings se disponível
-        settings_filename = spider.settings.get('EXCEL_FILENAME')
+        settings_filename = spider.settings.get('EXPORT_FILENAME')
+        if not settings_filename and export_format == 'xlsx':
+            settings_filename = spider.settings.get('EXCEL_FILENAME')
         if settings_filename:
             self.filename = f"data/{settings_filename}"
         else:
-            self.filename = f"data/{safe_filename}.xlsx"
-
-        # Criar workbook
-        self.workbook = Workbook()
-        self.worksheet = self.workbook.active
-        self.worksheet.title = "Resultados da Busca"
-
-        # Adicionar cabeçalhos
-        headers = ['Nome', 'Avaliação', 'Número de Avaliações', 'Localização', 'Categoria', 'URL']
-        for col, header in enumerate(headers, 1):
-            self.worksheet.cell(row=1, column=col, value=header)
-
-        spider.logger.info(f"Pipeline Excel iniciado - arquivo será salvo em {self.filename}")
+            self.filename = self._output_filename(safe_filename(search_query))
+
+        # Rotas por consulta: no modo lote cada consulta tem seu próprio arquivo
+        # (as células do planejador vão todas para o arquivo da região)
+        queries = getattr(spider, 'queries', [])
+        if getattr(spider, 'planner', None):
+            queries = []
+        for query in queries:
+            if query.get('output'):
+                self.routes[query['search_query']] = self._output_filename(query['output'])
+            elif len(queries) > 1:
+                self.routes[query['search_query']] = self._output_filename(safe_filename(query['search_query']))
+
+        # As saídas são criadas no primeiro item: consultas puladas pelo cache de
+        # frescor não sobrescrevem o arquivo da execução anterior
+        if self.routes:
+            spider.logger.info(f"Pipeline de exportação ({export_format}) iniciado - {len(set(self.routes.values()))} arquivos em data/")
+        else:
+            spider.logger.info(f"Pipeline de exportação ({export_format}) iniciado - arquivo será salvo em {self.filename}")
 
     def close_spider(self, spider):
-        if self.workbook and self.filename:
+        # Consultas buscadas sem resultados também geram o arquivo (vazio)
+        skipped = getattr(spider, 'skipped_queries', set())
+        queries = getattr(spider, 'queries', [])
+        for query in queries:
+            filename = self.routes.get(query['search_query'], self.filename)
+            if filename not in self.outputs and query['search_query'] not in skipped:
+                self._create_output(spider, filename)
+        if not queries and self.filename not in self.outputs:
+            self._create_output(spider, self.filename)
+
+        if self.checkpoint:
+            # Último commit com os sinks ainda abertos
+            self.flush_outputs()
+            self.checkpoint.flushers.remove(self.flush_outputs)
+            self.checkpoint.commit()
+
+        for filename, output in self.outputs.items():
             try:
-                self.workbook.save(self.filename)
-                spider.logger.info(f"Arquivo Excel salvo com sucesso: {self.filename}")
-                spider.logger.info(f"Total de itens salvos: {self.row_count - 1}")
+                self._flush(output)
+                output['sink'].close()
+            except Exception as e:
+                spider.logger.error(f"Erro ao salvar arquivo {filename}: {e}")
+                continue
 
-                # Verificar se o arquivo foi criado
-                if os.path.exists(self.filename):
-                    file_size = os.path.getsize(self.filename)
-                    spider.logger.info(f"Arquivo confirmado - Tamanho: {file_size} bytes")
-                else:
-                    spider.logger.error(f"Arquivo não encontrado após salvamento: {self.filename}")
+            spider.logger.info(f"Arquivo salvo com sucesso: {filename}")
+            spider.logger.info(f"Total de itens salvos: {output['items']}")
 
-            except Exception as e:
-                spider.logger.error(f"Erro ao salvar arquivo Excel: {e}")
-                # Tentar salvar no diretório raiz como fallback
-                try:
-                    fallback_filename = os.path.basename(self.filename)
-                    self.workbook.save(fallback_filename)
-                    spider.logger.info(f"Arquivo salvo no diretório raiz: {fallback_filename}")
-                except Exception as e2:
-                    spider.logger.error(f"Erro ao salvar no diretório raiz: {e2}")
+            # Verificar se o arquivo foi criado
+            if os.path.exists(filename):
+                file_size = os.path.getsize(filename)
+                spider.logger.info(f"Arquivo confirmado - Tamanho: {file_size} bytes")
+            else:
+                spider.logger.error(f"Arquivo não encontrado após salvamento: {filename}")
 
+    @timed_stage
     def process_item(self, item, spider):
         if item:
-            adapter = ItemAdapter(item)
-            self.row_count += 1
+            key = None
+            if self.checkpoint:
+                # Páginas refeitas após uma interrupção não duplicam linhas já exportadas
+                key = business_key(item.cid, item.name, item.location)
+                if key in self.exported:
+                    spider.crawler.stats.inc_value('checkpoint/already_exported')
+                    return None
+                self.exported.add(key)
+
+            filename = self.routes.get(item.query, self.filename)
+            output = self.outputs.get(filename) or self._create_output(spider, filename)
+            output['items'] += 1
+
+            # Linha inteira de uma vez; gravada no sink a cada EXPORT_BATCH_SIZE itens
+            output['buffer'].append(self.row(item))
+            if len(output['buffer']) >= self.batch_size:
+                self._flush(output)
+            if key is not None:
+                self.checkpoint.stage_emitted(key)
+
+            spider.logger.debug(f"Item adicionado à exportação: {item.name}")
+
+        return item
 
-            # Adicionar dados à planilha
-            self.worksheet.cell(row=self.row_count, column=1, value=adapter.get('name', ''))
-            self.worksheet.cell(row=self.row_count, column=2, value=adapter.get('rating', ''))
-            self.worksheet.cell(row=self.row_count, column=3, value=adapter.get('review_count', ''))
-            self.worksheet.cell(row=self.row_count, column=4, value=adapter.get('location', ''))
-            self.worksheet.cell(row=self.row_count, column=5, value=adapter.get('category', ''))
-            self.worksheet.cell(row=self.row_count, column=6, value=adapter.get('url', ''))
 
-            spider.logger.info(f"Item adicionado à planilha: {adapter.get('name', 'Nome não encontrado')}")
+class ExcelExportPipeline(ExportPipeline):
+    """Exportação sempre em .xlsx (independente de EXPORT_FORMAT)"""
 
+    format = 'xlsx'
+
+
+class SharedSinkPipeline:
+    """Modo distribuído: envia os itens ao destino compartilhado da fila (ver DISTRIBUTED_QUEUE)"""
+
+    @timed_stage
+    def process_item(self, item, spider):
+        if item:
+            # Gravados em lotes de EXPORT_BATCH_SIZE e sempre antes de a consulta ser concluída
+            spider.task_queue.push_item(item)
         return item
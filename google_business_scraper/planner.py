@@ -0,0 +1,124 @@
+"""
+Planejador de consultas por região: expande uma categoria + região em
+subconsultas por bairro ou por células de uma grade de latitude/longitude.
+
+Células da grade que atingem o limite de resultados (a busca foi cortada, há mais
+negócios ali) são divididas em 4, mas só se trouxeram negócios novos em relação
+ao conjunto de deduplicação; células que só repetem negócios já vistos ou que
+esgotaram os resultados não são divididas. Assim a cidade é coberta com o
+mínimo de requisições, sem amostrar a grade inteira em alta resolução.
+
+Plano (dicionário ou arquivo JSON):
+
+    {"category": "salão de beleza", "region": "Atibaia, SP",
+     "bbox": [-23.17, -46.62, -23.07, -46.50], "grid": 2, "max_depth": 3}
+
+ou, por bairros (sem subdivisão):
+
+    {"category": "salão de beleza", "region": "Atibaia, SP",
+     "neighborhoods": ["Centro", "Jardim Cerejeiras", "Alvinópolis"]}
+"""
+
+import base64
+import json
+import math
+
+from google_business_scraper.queries import make_query
+
+# Metros por grau de latitude (aproximação esférica)
+METERS_PER_DEGREE = 111_320
+
+
+def uule(lat, lng, radius):
+    """Parâmetro ``uule`` do Google: localização do dispositivo em (lat, lng), raio em metros"""
+    text = (
+        "role: CURRENT_LOCATION\n"
+        "producer: DEVICE_LOCATION\n"
+        f"radius: {int(radius)}\n"
+        "latlng <\n"
+        f"  latitude_e7: {round(lat * 1e7)}\n"
+        f"  longitude_e7: {round(lng * 1e7)}\n"
+        ">"
+    )
+    return 'a ' + base64.b64encode(text.encode('utf-8')).decode('ascii')
+
+
+def load_plan(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+class GeoGridPlanner:
+    """Gera as células iniciais e decide, ao fim de cada célula, se ela deve ser dividida"""
+
+    def __init__(self, category, region='', bbox=None, neighborhoods=(), grid=2, max_depth=3,
+                 max_results=50, min_new=1, output=None):
+        if not bbox and not neighborhoods:
+            raise ValueError("O plano precisa de 'bbox' (sul, oeste, norte, leste) ou de 'neighborhoods'")
+        self.category = category
+        self.region = region
+        self.bbox = tuple(bbox) if bbox else None
+        self.neighborhoods = list(neighborhoods)
+        self.grid = max(int(grid), 1)
+        self.max_depth = int(max_depth)
+        self.max_results = int(max_results)
+        self.min_new = int(min_new)
+        self.output = output
+        self.stats = {'cells': 0, 'subdivided': 0, 'pruned': 0, 'exhausted': 0}
+
+    @property
+    def name(self):
+        return f"{self.category} {self.region}".strip()
+
+    def initial_queries(self):
+        if self.neighborhoods:
+            return [self._query(f"{self.category} {neighborhood} {self.region}".strip())
+                    for neighborhood in self.neighborhoods]
+
+        south, west, north, east = self.bbox
+        lat_step = (north - south) / self.grid
+        lng_step = (east - west) / self.grid
+        return [
+            self.cell_query((south + i * lat_step, west + j * lng_step,
+                             south + (i + 1) * lat_step, west + (j + 1) * lng_step), depth=0)
+            for i in range(self.grid) for j in range(self.grid)
+        ]
+
+    def _query(self, search_query, cell=None):
+        self.stats['cells'] += 1
+        query = make_query(search_query, self.max_results, self.output)
+        if cell is not None:
+            query['cell'] = cell
+        return query
+
+    def cell_query(self, box, depth):
+        south, west, north, east = box
+        lat, lng = (south + north) / 2, (west + east) / 2
+        # Raio: meia diagonal da célula
+        height = (north - south) * METERS_PER_DEGREE
+        width = (east - west) * METERS_PER_DEGREE * math.cos(math.radians(lat))
+        cell = {'box': [south, west, north, east], 'depth': depth,
+                'lat': lat, 'lng': lng, 'radius': math.hypot(height, width) / 2}
+        # As coordenadas no texto tornam cada célula uma consulta distinta (pagination, cache, fila)
+        return self._query(f"{self.category} perto de {lat:.5f},{lng:.5f}", cell)
+
+    def expand(self, query, saturated, new_items):
+        """
+        Chamado quando a célula termina: retorna as subcélulas a buscar (lista vazia
+        se a célula esgotou os resultados, não trouxe nada novo ou já está na profundidade máxima)
+        """
+        if not saturated:
+            self.stats['exhausted'] += 1
+            return []
+        if new_items < self.min_new:
+            self.stats['pruned'] += 1
+            return []
+        cell = query.get('cell')
+        if cell is None or cell['depth'] >= self.max_depth:
+            return []
+
+        self.stats['subdivided'] += 1
+        south, west, north, east = cell['box']
+        lat, lng = cell['lat'], cell['lng']
+        boxes = [(south, west, lat, lng), (south, lng, lat, east), (lat, west, north, lng), (lat, lng, north, east)]
+        return [self.cell_query(box, cell['depth'] + 1) for box in boxes]
@@ -0,0 +1,71 @@
+"""
+Leitura de arquivos de consultas para o modo lote.
+
+Formato (uma consulta por linha, campos separados por ``|``):
+
+    # comentários e linhas vazias são ignorados
+    salão de beleza atibaia
+    academia rio de janeiro | 75
+    restaurante italiano são paulo | 100 | italianos_sp
+
+O segundo campo é o ``max_results`` da consulta e o terceiro o nome do
+arquivo de saída (sem extensão). Ambos são opcionais. Cada consulta só pode
+aparecer uma vez: o estado do lote (páginas, checkpoints, cache) é indexado
+pelo termo de busca.
+"""
+
+import sys
+
+
+def safe_filename(search_query):
+    """Converte um termo de busca em um nome de arquivo seguro (sem extensão)"""
+    safe = search_query.replace(' ', '_').replace(',', '').replace('/', '_').lower()
+    return ''.join(c for c in safe if c.isalnum() or c in ('_', '-'))
+
+
+def make_query(search_query, max_results=50, output=None):
+    """Cria o dicionário de uma consulta no formato usado pelo spider"""
+    return {
+        'search_query': search_query,
+        'max_results': int(max_results),
+        'output': output or None,
+    }
+
+
+def parse_queries(lines, default_max_results=50):
+    """Interpreta as linhas de um arquivo de consultas"""
+    queries = []
+    seen = {}   # termo de busca -> linha
+    for line_number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+
+        parts = [part.strip() for part in line.split('|')]
+        if len(parts) > 3 or not parts[0]:
+            raise ValueError(f"Linha {line_number} inválida: {line}")
+
+        max_results = default_max_results
+        if len(parts) > 1 and parts[1]:
+            try:
+                max_results = int(parts[1])
+            except ValueError:
+                raise ValueError(f"Linha {line_number}: max_results inválido '{parts[1]}'")
+
+        if parts[0] in seen:
+            raise ValueError(f"Linha {line_number}: consulta repetida '{parts[0]}' (já na linha {seen[parts[0]]})")
+        seen[parts[0]] = line_number
+
+        output = parts[2] if len(parts) > 2 else None
+        queries.append(make_query(parts[0], max_results, output))
+
+    return queries
+
+
+def load_queries(path, default_max_results=50):
+    """Carrega consultas de um arquivo (``-`` lê da entrada padrão)"""
+    if path == '-':
+        return parse_queries(sys.stdin, default_max_results)
+
+    with open(path, encoding='utf-8') as f:
+        return parse_queries(f, default_max_results)
@@ -0,0 +1,279 @@
+"""
+Replay offline de páginas salvas e benchmark do parse.
+
+Alimenta ``BusinessSpider.parse`` com fixtures HTML (``debug_page.html``,
+snapshots ``.html.gz``...) ou com as páginas do cache HTTP (``--cache``)
+usando ``HtmlResponse`` falsos, sem rede.
+
+Uso:
+    python -m google_business_scraper.replay debug_page.html
+    python -m google_business_scraper.replay --cache .scrapy/httpcache/business.sqlite --output data/reextraido.csv
+    python -m google_business_scraper.replay debug_page.html --benchmark --save bench.json
+    python -m google_business_scraper.replay debug_page.html --benchmark --compare bench.json
+"""
+
+import argparse
+import gzip
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+import urllib.parse
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from scrapy import Request
+from scrapy.http import HtmlResponse
+
+from google_business_scraper.exporters import SINKS, export_unique
+from google_business_scraper.extraction import FIELD_SELECTORS, CompiledExtractor
+from google_business_scraper.httpcache import iter_cached_responses
+from google_business_scraper.items import BusinessItem
+from google_business_scraper.normalization import Gazetteer, Normalizer
+from google_business_scraper.queries import make_query
+
+DEFAULT_QUERY = "salão de beleza atibaia"
+
+
+def load_fixture(path):
+    """Lê um fixture HTML (aceita arquivos ``.gz``)"""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as f:
+        return f.read()
+
+
+def make_response(body, search_query=DEFAULT_QUERY, max_results=1000, start=0, url=None):
+    """Cria um HtmlResponse ligado a uma requisição falsa, como o Scrapy faria"""
+    from google_business_scraper.spiders.business_spider import BusinessSpider
+
+    query = make_query(search_query, max_results)
+    url = url or BusinessSpider.build_search_url(search_query, start)
+    request = Request(url, meta={'query': query, 'start': start})
+    return HtmlResponse(url=url, body=body, encoding='utf-8', request=request,
+                        headers={'Content-Type': 'text/html; charset=UTF-8'})
+
+
+def make_spider(search_query=DEFAULT_QUERY, max_results=1000):
+    from google_business_scraper.spiders.business_spider import BusinessSpider
+
+    return BusinessSpider(search_query=search_query, max_results=max_results)
+
+
+def replay_page(spider, response):
+    """Executa o parse de uma página e retorna apenas os itens (ignora paginação)"""
+    spider.pagination.clear()
+    return [result for result in spider.parse(response) if isinstance(result, (BusinessItem, dict))]
+
+
+def replay_fixtures(paths, search_query=DEFAULT_QUERY, max_results=1000, spider=None):
+    """Executa o parse sobre cada fixture e retorna todos os itens extraídos"""
+    spider = spider or make_spider(search_query, max_results)
+    items = []
+    for path in paths:
+        response = make_response(load_fixture(path), search_query, max_results)
+        items.extend(replay_page(spider, response))
+    return items
+
+
+def cached_pages(path, max_results=1000):
+    """Páginas de busca do cache HTTP, com a consulta e o offset tirados da URL"""
+    for cached in iter_cached_responses(path):
+        params = urllib.parse.parse_qs(urllib.parse.urlparse(cached.url).query)
+        if 'q' not in params:
+            continue
+        start = int(params.get('start', ['0'])[0])
+        yield make_response(cached.body, params['q'][0], max_results, start, url=cached.url)
+
+
+def reextract_cache(path, max_results=1000, spider=None, stats=None):
+    """Executa o parse atual sobre todas as páginas do cache e gera os itens"""
+    spider = spider or make_spider(max_results=max_results)
+    for response in cached_pages(path, max_results):
+        if stats is not None:
+            stats['pages'] = stats.get('pages', 0) + 1
+        yield from replay_page(spider, response)
+
+
+def _field_timings(bodies, rounds):
+    """Tempo de extração por campo: um extrator compilado só com os seletores de cada campo"""
+    from parsel import Selector
+
+    cards = []
+    finder = CompiledExtractor()
+    for body in bodies:
+        _, businesses = finder.find_businesses(Selector(text=body.decode('utf-8', 'replace')).root)
+        cards.extend(businesses)
+
+    timings = {}
+    for field, selectors in FIELD_SELECTORS.items():
+        extractor = CompiledExtractor(field_selectors={field: selectors}, attribute_fields={})
+        started = time.perf_counter()
+        for _ in range(rounds):
+            for card in cards:
+                extractor.extract(card)
+        elapsed = time.perf_counter() - started
+        timings[field] = elapsed / max(rounds * len(cards), 1) * 1e6  # µs por cartão
+    return timings
+
+
+def benchmark(paths, rounds=20, search_query=DEFAULT_QUERY, max_results=1000):
+    """Mede páginas/s, itens/s, tempo por campo e pico de memória do parse"""
+    bodies = [load_fixture(path) for path in paths]
+    spider = make_spider(search_query, max_results)
+
+    # Aquecimento (seletores vencedores já aprendidos, como em uma execução real)
+    for body in bodies:
+        replay_page(spider, make_response(body, search_query, max_results))
+
+    pages = items = 0
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for body in bodies:
+            items += len(replay_page(spider, make_response(body, search_query, max_results)))
+            pages += 1
+    elapsed = time.perf_counter() - started
+
+    # Pico de memória medido em uma rodada separada (tracemalloc distorce o tempo)
+    tracemalloc.start()
+    for body in bodies:
+        replay_page(spider, make_response(body, search_query, max_results))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'fixtures': [os.path.basename(path) for path in paths],
+        'rounds': rounds,
+        'pages': pages,
+        'items': items,
+        'seconds': elapsed,
+        'pages_per_sec': pages / elapsed if elapsed else 0.0,
+        'items_per_sec': items / elapsed if elapsed else 0.0,
+        'ms_per_page': elapsed / pages * 1000 if pages else 0.0,
+        'field_us_per_card': _field_timings(bodies, rounds),
+        'peak_memory_mb': peak / (1024 * 1024),
+        # tracemalloc não enxerga as alocações do lxml; RSS máximo do processo como complemento
+        'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 if resource else None,
+    }
+
+
+def compare(current, baseline, tolerance=0.10):
+    """Compara duas execuções; retorna as regressões acima da tolerância"""
+    regressions = []
+    for metric in ('pages_per_sec', 'items_per_sec'):
+        if baseline.get(metric) and current[metric] < baseline[metric] * (1 - tolerance):
+            regressions.append(f"{metric}: {current[metric]:.1f} < {baseline[metric]:.1f} (-{tolerance:.0%})")
+    if baseline.get('items') and current['items'] < baseline['items'] and current['rounds'] == baseline['rounds']:
+        regressions.append(f"items: {current['items']} < {baseline['items']}")
+    return regressions
+
+
+def print_report(result, baseline=None):
+    print(f"📄 Páginas: {result['pages']} ({len(result['fixtures'])} fixtures x {result['rounds']} rodadas)")
+    print(f"📦 Itens: {result['items']}")
+    print(f"⚡ {result['pages_per_sec']:.1f} páginas/s | {result['items_per_sec']:.1f} itens/s | "
+          f"{result['ms_per_page']:.2f} ms/página")
+    print(f"🧠 Pico de memória: {result['peak_memory_mb']:.1f} MB (Python)", end='')
+    print(f" | RSS máximo: {result['max_rss_mb']:.1f} MB" if result.get('max_rss_mb') else '')
+    print("⏱️  Extração por campo (µs/cartão):")
+    for field, micros in result['field_us_per_card'].items():
+        line = f"   {field:<14} {micros:8.1f}"
+        if baseline and field in baseline.get('field_us_per_card', {}):
+            line += f"  (antes: {baseline['field_us_per_card'][field]:.1f})"
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay offline e benchmark do parse')
+    parser.add_argument('fixtures', nargs='*', help='Arquivos HTML (ou .html.gz) salvos')
+    parser.add_argument('--cache', metavar='ARQUIVO',
+                        help='Reextrair todas as páginas do cache HTTP (ex: .scrapy/httpcache/business.sqlite)')
+    parser.add_argument('--output', '-o', metavar='ARQUIVO',
+                        help='Com --cache: gravar os itens, sem duplicatas, em um arquivo (formato pela extensão)')
+    parser.add_argument('--search', '-s', default=DEFAULT_QUERY, help='Termo de busca associado às páginas')
+    parser.add_argument('--benchmark', action='store_true', help='Medir desempenho do parse')
+    parser.add_argument('--rounds', type=int, default=20, help='Rodadas do benchmark (padrão: 20)')
+    parser.add_argument('--save', metavar='ARQUIVO', help='Salvar o resultado do benchmark em JSON')
+    parser.add_argument('--compare', metavar='ARQUIVO', help='Comparar com um benchmark salvo (sai com erro em regressão)')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='Queda tolerada na comparação (padrão: 0.10)')
+    parser.add_argument('--verbose', '-v', action='store_true', help='Mostrar os logs do spider')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+
+    if args.cache:
+        return reextract(args.cache, args.output)
+    if not args.fixtures:
+        parser.error('informe os fixtures ou --cache')
+
+    if not args.benchmark:
+        items = replay_fixtures(args.fixtures, args.search)
+        for item in items:
+            print(json.dumps(dict(item), ensure_ascii=False))
+        print(f"✅ {len(items)} itens extraídos de {len(args.fixtures)} páginas", file=sys.stderr)
+        return 0
+
+    result = benchmark(args.fixtures, args.rounds, args.search)
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    print_report(result, baseline)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+        print(f"📁 Resultado salvo: {args.save}")
+
+    if baseline:
+        regressions = compare(result, baseline, args.tolerance)
+        if regressions:
+            print("❌ Regressão de desempenho:")
+            for regression in regressions:
+                print(f"   {regression}")
+            return 1
+        print("✅ Sem regressões em relação ao baseline")
+
+    return 0
+
+
+def reextract(path, output=None):
+    """Modo --cache: parse de todas as páginas do cache, para stdout (JSONL) ou para ``output``"""
+    sinks = {sink.extension: sink for sink in SINKS.values()}
+    extension = os.path.splitext(output)[1].lstrip('.') if output else None
+    if output and extension not in sinks:
+        print(f"❌ Extensão não suportada: {output} (use {', '.join(sorted(sinks))})", file=sys.stderr)
+        return 2
+
+    stats = {}
+    started = time.perf_counter()
+    try:
+        # Mesma normalização do NormalizationPipeline (gazetteer do pacote)
+        items = map(Normalizer(Gazetteer.load()).normalize, reextract_cache(path, stats=stats))
+        if output:
+            count = export_unique(items, sinks[extension], output, logging.getLogger('replay'))
+        else:
+            count = 0
+            for item in items:
+                print(json.dumps(dict(item), ensure_ascii=False))
+                count += 1
+    except (FileNotFoundError, RuntimeError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+    elapsed = time.perf_counter() - started
+
+    pages = stats.get('pages', 0)
+    print(f"✅ {count} itens extraídos de {pages} páginas do cache em {elapsed:.1f}s "
+          f"({pages / elapsed if elapsed else 0:.1f} páginas/s)", file=sys.stderr)
+    if output:
+        print(f"📁 Arquivo salvo: {output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
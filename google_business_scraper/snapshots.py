@@ -0,0 +1,114 @@
+"""
+Armazenamento opcional de snapshots HTML para depuração.
+
+Substitui a gravação de ``debug_page.html`` a cada resposta: os snapshots são
+comprimidos (gzip), nomeados pela URL + hash do conteúdo, gravados fora da
+thread do reactor e limitados a ``SNAPSHOT_MAX_BYTES`` em disco.
+"""
+
+import gzip
+import hashlib
+import logging
+import os
+import random
+import re
+import threading
+import urllib.parse
+
+logger = logging.getLogger(__name__)
+
+_SLUG_RE = re.compile(r'[^\w-]+')
+
+
+def snapshot_filename(url, body):
+    """Nome do snapshot: parte legível da URL + hash do conteúdo (endereçado por conteúdo)"""
+    parsed = urllib.parse.urlparse(url)
+    params = urllib.parse.parse_qs(parsed.query)
+    readable = ' '.join(params.get('q', [parsed.path])) + ' ' + ' '.join(params.get('start', []))
+    slug = _SLUG_RE.sub('_', readable.strip().lower()).strip('_')[:80] or 'pagina'
+    digest = hashlib.sha1(body).hexdigest()[:16]
+    return f"{slug}-{digest}.html.gz"
+
+
+class SnapshotStore:
+    """Guarda páginas com falha de extração (e uma amostra das demais), com limite de disco"""
+
+    def __init__(self, directory='snapshots', sample_rate=0.0, max_bytes=100 * 1024 * 1024):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._files = None  # nome -> (mtime, tamanho), carregado na primeira gravação
+        self._total_bytes = 0
+
+    @classmethod
+    def from_settings(cls, settings):
+        if not settings.getbool('SNAPSHOT_ENABLED'):
+            return None
+        return cls(
+            directory=settings.get('SNAPSHOT_DIR', 'snapshots'),
+            sample_rate=settings.getfloat('SNAPSHOT_SAMPLE_RATE', 0.0),
+            max_bytes=settings.getint('SNAPSHOT_MAX_BYTES', 100 * 1024 * 1024),
+        )
+
+    def should_save(self, failed):
+        return failed or (self.sample_rate > 0 and random.random() < self.sample_rate)
+
+    def maybe_save(self, response, failed=False):
+        """Agenda a gravação do snapshot se a página falhou ou caiu na amostra"""
+        if not self.should_save(failed):
+            return None
+
+        from twisted.internet import reactor, threads
+        from twisted.python import threadable
+        # deferToThread só pode ser chamado na thread do reactor (fora dela, ex. replay, grava direto)
+        if reactor.running and threadable.isInIOThread():
+            return threads.deferToThread(self.save, response.url, response.body)
+        return self.save(response.url, response.body)
+
+    def _load_index(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._files = {}
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith('.html.gz'):
+                stat = entry.stat()
+                self._files[entry.name] = (stat.st_mtime, stat.st_size)
+        self._total_bytes = sum(size for _, size in self._files.values())
+
+    def save(self, url, body):
+        """Grava o snapshot comprimido (executado em uma thread do pool)"""
+        name = snapshot_filename(url, body)
+        compressed = gzip.compress(body, compresslevel=6)
+
+        with self._lock:
+            if self._files is None:
+                self._load_index()
+            if name in self._files:
+                return None  # Conteúdo idêntico já armazenado
+
+            path = os.path.join(self.directory, name)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(compressed)
+            os.replace(tmp_path, path)
+
+            self._files[name] = (os.path.getmtime(path), len(compressed))
+            self._total_bytes += len(compressed)
+            self._evict()
+
+        logger.debug(f"Snapshot salvo: {path}")
+        return path
+
+    def _evict(self):
+        """Remove os snapshots mais antigos até voltar ao limite de disco"""
+        if self._total_bytes <= self.max_bytes:
+            return
+        for name, (_, size) in sorted(self._files.items(), key=lambda entry: entry[1][0]):
+            if self._total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            del self._files[name]
+            self._total_bytes -= size
@@ -1,48 +1,464 @@
 import scrapy
+from scrapy import signals
+from scrapy.exceptions import DontCloseSpider
+from twisted.internet import task
+from google_business_scraper.blocking import RESULTS
+from google_business_scraper.checkpoints import CheckpointStore
+from google_business_scraper.distributed import task_queue_from_settings
+from google_business_scraper.enrichment import DetailCache, detail_url, extract_details, has_details, merge_details
 from google_business_scraper.items import BusinessItem
+from google_business_scraper.extraction import CompiledExtractor, FallbackExtractor
+from google_business_scraper.freshness import FreshnessCache
+from google_business_scraper.health import CARD_FIELD, SelectorStats
+from google_business_scraper.metrics import COUNT_BUCKETS
+from google_business_scraper.offload import ParsePool
+from google_business_scraper.parsing import item_fields
+from google_business_scraper.planner import GeoGridPlanner, load_plan, uule
+from google_business_scraper.queries import load_queries, make_query
+from google_business_scraper.snapshots import SnapshotStore
+from collections import deque
+from lxml import etree
 import urllib.parse
+import logging
+import math
 import json
+import time
 
 class BusinessSpider(scrapy.Spider):
     name = 'business'
     allowed_domains = ['google.com']
 
-    def __init__(self, search_query=None, max_results=50, *args, **kwargs):
+    def __init__(self, search_query=None, max_results=50, queries=None, plan=None, *args, **kwargs):
         super(BusinessSpider, self).__init__(*args, **kwargs)
 
         # Usar parâmetro passado ou valor padrão
         self.search_query = search_query or "salão de beleza atibaia"
         self.max_results = int(max_results)
 
-        self.start_urls = [
-            f'https://www.google.com/search?q={urllib.parse.quote(self.search_query)}&tbm=lcl'
-        ]
+        # Planejador por região: células de uma grade ou bairros (dicionário ou arquivo JSON)
+        self.planner = None
+        if plan:
+            if isinstance(plan, str):
+                plan = load_plan(plan)
+            self.planner = GeoGridPlanner(**{'max_results': self.max_results, **plan})
+
+        # Modo lote: lista de consultas ou caminho de um arquivo de consultas
+        if isinstance(queries, str):
+            queries = load_queries(queries, self.max_results)
+        if self.planner:
+            self.queries = self.planner.initial_queries()
+            self.search_query = self.planner.name
+        elif queries:
+            self.queries = [make_query(**q) for q in queries]
+            self.search_query = self.queries[0]['search_query']
+        else:
+            self.queries = [make_query(self.search_query, self.max_results)]
+
+        # Seletores compilados uma única vez por spider
+        self.extractor = CompiledExtractor()
+        # Extração alternativa, limitada, para páginas em que nenhum seletor de cartão funciona
+        self.fallback = FallbackExtractor()
+        # Acertos por seletor entre execuções, que definem a ordem das cascatas (opcional, ver SELECTOR_STATS)
+        self.selector_stats = None
+
+        # Estado de paginação por consulta (itens emitidos, próximo offset...)
+        self.pagination = {}
+
+        # Snapshots HTML para depuração (opcional, ver SNAPSHOT_ENABLED)
+        self.snapshots = None
+
+        # Métricas do caminho crítico (preenchido pelo MetricsExtension, ver METRICS_ENABLED)
+        self.metrics = None
+
+        # Pool de processos de extração (opcional, ver PARSE_WORKERS)
+        self.parse_pool = None
+
+        # Cache de frescor por consulta (opcional, ver FRESHNESS_CACHE)
+        self.freshness = None
+        self.skipped_queries = set()
+
+        # Fila compartilhada entre nós (opcional, ver DISTRIBUTED_QUEUE)
+        self.task_queue = None
+        self.lease_renewal = None
+
+        # Checkpoint do job para retomar execuções interrompidas (opcional, ver JOBDIR)
+        self.checkpoint = None
+
+        # Cache de detalhes por CID do enriquecimento (opcional, ver ENRICH_ENABLED)
+        self.details = None
+        self.detail_waiters = {}  # CID em busca -> consultas com itens aguardando esse mesmo CID
+
+        self.start_urls = [self.build_search_url(q['search_query'], cell=q.get('cell')) for q in self.queries]
+
+        if self.planner:
+            self.logger.info(f"Planejador: {len(self.queries)} consultas iniciais para '{self.planner.name}'")
+        elif len(self.queries) > 1:
+            self.logger.info(f"Modo lote: {len(self.queries)} consultas")
+        else:
+            self.logger.info(f"Configurado para buscar: {self.search_query}")
+            self.logger.info(f"Máximo de resultados: {self.max_results}")
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        spider.snapshots = SnapshotStore.from_settings(crawler.settings)
+        spider.fallback = FallbackExtractor.from_settings(crawler.settings)
+        spider.freshness = FreshnessCache.from_settings(crawler.settings)
+        if crawler.settings.getbool('ENRICH_ENABLED'):
+            spider.details = DetailCache.from_settings(crawler.settings)
+        ranking = None
+        spider.selector_stats = SelectorStats.from_settings(crawler.settings, alert=spider.selector_alert)
+        if spider.selector_stats:
+            ranking = spider.selector_stats.ranking()
+            spider.extractor.apply_ranking(ranking)
+        spider.parse_pool = ParsePool.from_settings(crawler.settings, ranking)
+        if spider.parse_pool:
+            spider.logger.info(f"Extração em {spider.parse_pool.workers} processos de trabalho")
+        spider.task_queue = task_queue_from_settings(crawler.settings)
+        if spider.task_queue:
+            crawler.signals.connect(spider.spider_idle, signal=signals.spider_idle)
+            spider.logger.info(f"Modo distribuído: nó {spider.task_queue.node} - fila {crawler.settings.get('DISTRIBUTED_QUEUE')}")
+        else:
+            # No modo distribuído a própria fila faz o papel do checkpoint
+            spider.checkpoint = CheckpointStore.from_settings(crawler.settings)
+        if spider.task_queue or spider.checkpoint or spider.planner or spider.freshness:
+            for signal in (signals.item_scraped, signals.item_dropped, signals.item_error):
+                crawler.signals.connect(spider.item_processed, signal=signal)
+        return spider
+
+    def closed(self, reason):
+        if self.lease_renewal is not None and self.lease_renewal.running:
+            self.lease_renewal.stop()
+        if self.task_queue:
+            # Itens pendentes vão para o destino; consultas não concluídas voltam para a fila
+            self.task_queue.close()
+        if self.checkpoint:
+            self.checkpoint.close()
+        if self.planner:
+            for name, value in self.planner.stats.items():
+                self.crawler.stats.set_value(f'planner/{name}', value)
+        if self.parse_pool:
+            self.parse_pool.close()
+        if self.details:
+            self.details.close()
+        if self.selector_stats:
+            self.selector_stats.close()
+        if self.freshness:
+            unchanged = self.freshness.close()
+            self.logger.info(f"Cache de frescor atualizado - {unchanged} consultas sem alterações")
+
+    @staticmethod
+    def build_search_url(search_query, start=0, cell=None):
+        url = f'https://www.google.com/search?q={urllib.parse.quote(search_query)}&tbm=lcl'
+        if start:
+            url += f'&start={start}'
+        if cell:
+            # Célula do planejador: buscar como se o dispositivo estivesse no centro dela
+            url += f"&uule={urllib.parse.quote_plus(uule(cell['lat'], cell['lng'], cell['radius']))}"
+        return url
+
+    def _setting_int(self, name, default):
+        settings = getattr(self, 'settings', None)
+        return settings.getint(name, default) if settings is not None else default
+
+    def identity_count(self):
+        settings = getattr(self, 'settings', None)
+        return max(len(settings.getlist('IDENTITY_PROXIES')), 1) if settings is not None else 1
+
+    def _page_state(self, query):
+        state = self.pagination.get(query['search_query'])
+        if state is None:
+            state = {'items': 0, 'next_start': 0, 'in_flight': 0, 'done': False, 'unexported': 0, 'pages': set(),
+                     'new': 0, 'saturated': False, 'details_in_flight': 0, 'details_waiting': deque(), 'details_parked': {}}
+            self.pagination[query['search_query']] = state
+        return state
+
+    def query_finished(self, query):
+        """Indica se a consulta já atingiu o limite de itens ou ficou sem resultados"""
+        state = self.pagination.get(query['search_query'])
+        return bool(state and state['done'])
+
+    def search_request(self, query, start=0):
+        """Cria a requisição de uma página de resultados (``start`` = offset)"""
+        state = self._page_state(query)
+        state['in_flight'] += 1
+        state['next_start'] = max(state['next_start'], start + self._setting_int('RESULTS_PAGE_SIZE', 20))
+
+        return scrapy.Request(
+            url=self.build_search_url(query['search_query'], start, query.get('cell')),
+            callback=self.parse_offloaded if self.parse_pool else self.parse,
+            errback=self.page_failed,
+            headers={
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+                'Accept-Language': 'pt-BR,pt;q=0.9,en;q=0.8',
+                'Accept-Encoding': 'gzip, deflate',  # Remover br (brotli) temporariamente
+                'DNT': '1',
+                'Connection': 'keep-alive',
+                'Upgrade-Insecure-Requests': '1',
+            },
+            meta={'query': query, 'start': start},
+            # Com checkpoint, a paginação é retomada dele (as páginas já vistas estão no requests.seen)
+            dont_filter=self.checkpoint is not None,
+        )
+
+    def next_pages(self, query, page_items, start=None):
+        """
+        Janela deslizante de paginação: ao terminar uma página (``start``), agenda novas
+        páginas (em paralelo, até ``PAGINATION_CONCURRENCY``) somente enquanto
+        o limite de itens da consulta não for atingido.
+        """
+        state = self._page_state(query)
+        state['in_flight'] = max(state['in_flight'] - 1, 0)
+        if start is not None:
+            state['pages'].add(start)
+
+        if not state['done'] and (state['items'] >= query['max_results'] or not page_items):
+            state['done'] = True
+            # Encerrada pelo limite, não por falta de resultados: há mais negócios do que a busca trouxe
+            state['saturated'] = bool(page_items)
+            self.logger.info(f"Paginação encerrada para '{query['search_query']}' ({state['items']} itens)")
+        self.checkpoint_query(query)
+        if state['done']:
+            if not state['in_flight']:
+                yield from self.query_settled(query)
+            return
 
-        self.logger.info(f"Configurado para buscar: {self.search_query}")
-        self.logger.info(f"Máximo de resultados: {self.max_results}")
+        page_size = self._setting_int('RESULTS_PAGE_SIZE', 20)
+        window = self._setting_int('PAGINATION_CONCURRENCY',
+                                   self._setting_int('CONCURRENT_REQUESTS_PER_DOMAIN', 1) * self.identity_count())
+        max_pages = self._setting_int('PAGINATION_MAX_PAGES', 10)
+
+        # Páginas já em andamento devem cobrir parte dos itens restantes
+        remaining = query['max_results'] - state['items']
+        wanted = math.ceil(remaining / page_size) - state['in_flight']
+        slots = max(window, 1) - state['in_flight']
+
+        for _ in range(min(wanted, slots)):
+            start = state['next_start']
+            if start >= max_pages * page_size:
+                break
+            self.logger.info(f"Agendando página start={start} para '{query['search_query']}'")
+            yield self.search_request(query, start)
+
+        # Limite de páginas atingido sem nenhuma página em andamento: consulta encerrada
+        if not state['in_flight']:
+            state['done'] = True
+            state['saturated'] = True
+            yield from self.query_settled(query)
+
+    def query_settled(self, query):
+        """Consulta encerrada e sem páginas em andamento"""
+        state = self._page_state(query)
+        if not (self.task_queue or self.planner or self.freshness) or state.get('settled'):
+            return
+        state['settled'] = True
+        # Itens ainda nos pipelines: a consulta é concluída quando o último deles sair (item_processed)
+        if not state['unexported']:
+            yield from self.query_completed(query)
+
+    def query_completed(self, query):
+        """Consulta encerrada e com todos os itens já processados pelos pipelines"""
+        state = self._page_state(query)
+        # Só consultas buscadas (não servidas do cache) e sem páginas com falha ficam frescas
+        if self.freshness and state['pages'] and not state.get('failed'):
+            self.freshness.complete(query['search_query'])
+        if self.planner:
+            yield from self.expand_query(query)
+        if self.task_queue:
+            yield from self.complete_query(query['search_query'])
+
+    def expand_query(self, query):
+        """Planejador: divide a célula que atingiu o limite e trouxe negócios novos"""
+        state = self._page_state(query)
+        children = self.planner.expand(query, state['saturated'], state['new'])
+        if not children:
+            return
+        self.logger.info(f"'{query['search_query']}' atingiu o limite com {state['new']} negócios novos - "
+                         f"dividida em {len(children)} células")
+        if self.task_queue:
+            # Modo distribuído: as subcélulas vão para a fila compartilhada
+            self.task_queue.enqueue(children)
+            return
+        for child in children:
+            self.queries.append(child)
+            yield from self.query_requests(child)
+            self.checkpoint_query(child)
+
+    def complete_query(self, key):
+        """Conclui a tarefa na fila (depois de gravar os seus itens) e pega a próxima consulta"""
+        self.task_queue.complete(key)
+        self.crawler.stats.inc_value('distributed/completed')
+        yield from self.claim_requests(1)
+
+    def item_processed(self, item, response=None, **kwargs):
+        """Sinais item_scraped/item_dropped/item_error: mais um item da consulta saiu dos pipelines"""
+        # Itens emitidos por um errback chegam com a Failure no lugar da resposta
+        request = getattr(response, 'request', None)
+        query = getattr(request, 'meta', {}).get('query')
+        state = self.pagination.get(query['search_query']) if query else None
+        if state is None:
+            return
+        # Negócio novo: exportado, sem ter sido descartado como duplicado (pipelines retornam None)
+        if item and 'exception' not in kwargs and 'failure' not in kwargs:
+            state['new'] += 1
+        state['unexported'] -= 1
+        if state['unexported']:
+            return
+        self.checkpoint_query(query)
+        if state.get('settled'):
+            for request in self.query_completed(query):
+                self.crawler.engine.crawl(request)
+
+    def checkpoint_query(self, query):
+        """Registra o estado da consulta no checkpoint, se todos os seus itens já saíram dos pipelines"""
+        state = self._page_state(query)
+        if self.checkpoint is not None and not state['unexported']:
+            self.checkpoint.stage_state(query, state)
+
+    def resume_query(self, query, saved):
+        """Retoma a consulta do checkpoint: refaz as páginas pendentes e segue a paginação"""
+        state = self._page_state(query)
+        state.update(items=saved['items'], next_start=saved['next_start'], done=saved['done'],
+                     pages=set(saved['pages']))
+        if state['done']:
+            return
+
+        page_size = self._setting_int('RESULTS_PAGE_SIZE', 20)
+        pending = [start for start in range(0, state['next_start'], page_size) if start not in state['pages']]
+        self.logger.info(f"Retomando '{query['search_query']}' do checkpoint ({state['items']} itens, "
+                         f"{len(pending)} páginas pendentes)")
+        for start in pending:
+            yield self.search_request(query, start)
+        if not pending:
+            yield from self.next_pages(query, page_items=state['items'] or 1)
+
+    def distributed_concurrency(self):
+        """Consultas simultâneas por nó (padrão: uma por identidade)"""
+        return max(self._setting_int('DISTRIBUTED_CONCURRENCY', self.identity_count()), 1)
+
+    def claim_requests(self, count):
+        """Modo distribuído: pega até ``count`` consultas da fila e gera as suas requisições iniciais"""
+        claimed = 0
+        while claimed < count:
+            query, resumed = self.task_queue.claim()
+            if query is None:
+                return
+            if resumed:
+                self.logger.warning(f"Retomando consulta abandonada por outro nó: {query['search_query']}")
+                self.pagination.pop(query['search_query'], None)
+                self.crawler.stats.inc_value('distributed/resumed')
+
+            requests = list(self.query_requests(query))
+            if not requests:
+                # Pulada pelo cache de frescor
+                self.task_queue.complete(query['search_query'])
+                self.crawler.stats.inc_value('distributed/completed')
+                continue
+            claimed += 1
+            yield from requests
+
+    def spider_idle(self):
+        """Sem requisições pendentes: pega mais consultas e, se outros nós ainda trabalham, espera"""
+        requests = list(self.claim_requests(self.distributed_concurrency()))
+        for request in requests:
+            self.crawler.engine.crawl(request)
+        # Consultas de outros nós podem voltar à fila se o lease expirar (nó morto)
+        if requests or self.task_queue.unfinished():
+            raise DontCloseSpider
+
+    def page_failed(self, failure):
+        """Errback das páginas: libera a vaga na janela e continua a paginação"""
+        request = failure.request
+        query = request.meta.get('query') or self.queries[0]
+        if not self.query_finished(query):
+            self.logger.warning(f"Falha ao obter página {request.url}: {failure.value}")
+            self._page_state(query)['failed'] = True
+        yield from self.next_pages(query, page_items=1, start=request.meta.get('start'))
+
+    def query_for(self, response):
+        """Retorna a consulta associada à resposta (a primeira, se não houver request)"""
+        try:
+            return response.meta.get('query') or self.queries[0]
+        except AttributeError:
+            return self.queries[0]
+
+    @staticmethod
+    def page_start(response):
+        """Offset da página da resposta (None se não houver request)"""
+        try:
+            return response.meta.get('start')
+        except AttributeError:
+            return None
+
+    async def start(self):
+        # Scrapy >= 2.13 usa start(); start_requests() continua valendo para versões anteriores
+        for request in self.start_requests():
+            yield request
 
     def start_requests(self):
-        for url in self.start_urls:
-            self.logger.info(f"Iniciando busca: {url}")
-            yield scrapy.Request(
-                url=url,
-                callback=self.parse,
-                headers={
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                    'Accept-Language': 'pt-BR,pt;q=0.9,en;q=0.8',
-                    'Accept-Encoding': 'gzip, deflate',  # Remover br (brotli) temporariamente
-                    'DNT': '1',
-                    'Connection': 'keep-alive',
-                    'Upgrade-Insecure-Requests': '1',
-                },
-                meta={'dont_cache': True}
-            )
+        if self.task_queue:
+            # Renovar os leases enquanto o nó trabalha (um nó morto deixa o lease expirar)
+            self.lease_renewal = task.LoopingCall(self.task_queue.renew)
+            self.lease_renewal.start(self.task_queue.lease / 3, now=False)
+            yield from self.claim_requests(self.distributed_concurrency())
+            return
 
-    def parse(self, response):
+        saved = {}
+        if self.checkpoint:
+            self.checkpoint.start()
+            if self.checkpoint.resumed:
+                saved = self.checkpoint.load_states()
+                done = sum(1 for state in saved.values() if state['done'])
+                self.logger.info(f"Retomando job (execução {self.checkpoint.run}): {done} consultas concluídas, "
+                                 f"{len(saved) - done} em andamento")
+
+        for query in self.queries:
+            if query['search_query'] in saved:
+                yield from self.resume_query(query, saved.pop(query['search_query']))
+            else:
+                yield from self.query_requests(query)
+
+        # Consultas criadas durante a execução anterior (células do planejador)
+        for state in saved.values():
+            self.queries.append(state['query'])
+            yield from self.resume_query(state['query'], state)
+
+    def query_requests(self, query):
+        """Requisições iniciais de uma consulta (nenhuma se pulada pelo cache de frescor)"""
+        if self.freshness and self.freshness.is_fresh(query['search_query']):
+            if self.freshness.mode == 'serve':
+                self.logger.info(f"Consulta dentro do TTL, servida do cache: {query['search_query']}")
+                # URI data: não gera tráfego de rede; os itens saem do cache no callback
+                yield scrapy.Request('data:,', callback=self.serve_cached, dont_filter=True,
+                                     meta={'query': query, 'dont_cache': True}, cb_kwargs={'query': query})
+            else:
+                self.logger.info(f"Consulta dentro do TTL, pulada: {query['search_query']}")
+                self.skipped_queries.add(query['search_query'])
+            return
+
+        self.logger.info(f"Iniciando busca: {self.build_search_url(query['search_query'], cell=query.get('cell'))}")
+        yield self.search_request(query)
+
+    def serve_cached(self, response, query):
+        """Emite os itens da última busca da consulta a partir do cache de frescor"""
+        state = self._page_state(query)
+        state['done'] = True
+        for data in self.freshness.cached_items(query['search_query'])[:query['max_results']]:
+            item = BusinessItem(**{field: value for field, value in data.items() if field in BusinessItem.fields})
+            item.query = query['search_query']
+            state['unexported'] += 1
+            yield item
+        self.checkpoint_query(query)
+        yield from self.query_settled(query)
+
+    def check_page(self, response, decode=True):
+        """Verificações anteriores à extração; retorna False se a página não deve ser extraída"""
         self.logger.info(f"Processando página: {response.url}")
-        self.logger.info(f"Status da resposta: {response.status}")
-        self.logger.info(f"Tipo de conteúdo: {response.headers.get('content-type', b'').decode()}")
+        debug = self.logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            self.logger.debug(f"Status da resposta: {response.status}")
+            self.logger.debug(f"Tipo de conteúdo: {response.headers.get('content-type', b'').decode()}")
 
         # Verificar se o conteúdo é texto
         try:
@@ -50,210 +466,308 @@ class BusinessSpider(scrapy.Spider):
             if 'text/html' not in content_type:
                 self.logger.warning(f"Tipo de conteúdo inesperado: {content_type}")
 
-            # Tentar decodificar o conteúdo
-            if hasattr(response, 'text'):
-                html_content = response.text
-                self.logger.info(f"Conteúdo HTML obtido - tamanho: {len(html_content)} caracteres")
-            else:
+            # Tentar decodificar o conteúdo (no modo PARSE_WORKERS, a decodificação fica com o worker)
+            if not hasattr(response, 'text'):
                 self.logger.error("Não foi possível obter o conteúdo HTML")
-                return
+                return False
+            if decode:
+                html_content = response.text
+                if debug:
+                    self.logger.debug(f"Conteúdo HTML obtido - tamanho: {len(html_content)} caracteres")
 
         except Exception as e:
             self.logger.error(f"Erro ao processar resposta: {e}")
             # Salvar conteúdo bruto para debug
-            with open('debug_raw_response.html', 'wb') as f:
-                f.write(response.body)
+            if self.snapshots:
+                self.snapshots.maybe_save(response, failed=True)
+            return False
+
+        # Página sem nenhum marcador de resultados (BlockDetectionMiddleware): a cascata de
+        # seletores não roda (os genéricos, .g e [data-ved], gerariam itens falsos), só a
+        # extração alternativa, limitada e com confiança baixa (ver extract_page)
+        if self.empty_page(response):
+            self.logger.warning(f"Página sem marcadores de resultados: {response.url}")
+
+        return True
+
+    @staticmethod
+    def empty_page(response):
+        return response.meta.get('page_type') == 'empty'
+
+    def parse(self, response):
+        query = self.query_for(response)
+        if not self.check_page(response):
+            yield from self.next_pages(query, page_items=0, start=self.page_start(response))
+            return
+
+        # Extração completa da página antes de emitir os itens (o tempo medido não inclui os pipelines)
+        started = time.perf_counter()
+        selector, items = self.extract_page(response, query)
+        if self.metrics is not None:
+            self.metrics.observe('parse_seconds', time.perf_counter() - started)
+
+        yield from self.finish_page(response, query, selector, items)
+
+    async def parse_offloaded(self, response):
+        """Como ``parse``, mas a extração roda em um processo de trabalho (PARSE_WORKERS)"""
+        query = self.query_for(response)
+        if not self.check_page(response, decode=False):
+            for request in self.next_pages(query, page_items=0, start=self.page_start(response)):
+                yield request
             return
 
-        # Seletores para diferentes layouts do Google
-        business_selectors = [
-            'div[data-cid]',  # Seletor principal
-            '.VkpGBb',        # Seletor alternativo
-            '.rllt__details', # Outro seletor
-            'div.VkpGBb',     # Variação
-            '.g',             # Seletor genérico do Google
-            '[data-ved]',     # Elementos com data-ved
+        limit = query['max_results'] - self._page_state(query)['items']
+        try:
+            selector, fields, winners, elapsed = await self.parse_pool.parse(
+                response.body, response.encoding, query['search_query'], limit,
+                fallback_only=self.empty_page(response))
+        except Exception as e:
+            self.logger.error(f"Erro no processo de extração: {e}")
+            selector, fields, winners, elapsed = None, [], [], 0.0
+
+        items = [BusinessItem(**item_fields) for item_fields in fields]
+        if self.metrics is not None:
+            self.metrics.observe('parse_seconds', elapsed)
+        for item_winners in winners:
+            self.record_selector_hits(item_winners)
+
+        for result in self.finish_page(response, query, selector, items):
+            yield result
+
+    def extract_page(self, response, query):
+        """Extrai os itens da página no processo atual; retorna (seletor de cartão ou None, itens)"""
+        debug = self.logger.isEnabledFor(logging.DEBUG)
+        limit = query['max_results'] - self._page_state(query)['items']
+        selector = None
+        items = []
+
+        try:
+            if self.empty_page(response):
+                return None, self.extract_fallback(response, query, limit)
+
+            selector, businesses = self.extractor.find_businesses(response.selector.root)
+            if businesses:
+                self.logger.info(f"Encontrados {len(businesses)} elementos com seletor: {selector}")
+
+                for i, business in enumerate(businesses):
+                    if len(items) >= limit:
+                        break
+                    if debug:
+                        self.logger.debug(f"Processando elemento {i+1}/{len(businesses)}")
+                    item = self.extract_business_data(business, response, selector)
+                    if item:
+                        items.append(item)
+            else:
+                items = self.extract_fallback(response, query, limit)
+        except Exception as e:
+            self.logger.error(f"Erro ao processar seletores de negócio: {e}")
+
+        return selector, items
+
+    def extract_fallback(self, response, query, limit):
+        """Extração alternativa (nenhum seletor de cartão funcionou): itens com confiança baixa"""
+        return [
+            BusinessItem(**item_fields(values, name, query['search_query'], 'low'))
+            for name, values in self.fallback.extract(response.selector.root, limit)
         ]
 
-        businesses_found = False
-        items_count = 0
-
-        # Salvar HTML para debug
-        with open('debug_page.html', 'w', encoding='utf-8') as f:
-            f.write(response.text)
-        self.logger.info("HTML da página salvo em debug_page.html")
-
-        for selector in business_selectors:
-            try:
-                businesses = response.css(selector)
-                if businesses:
-                    self.logger.info(f"Encontrados {len(businesses)} elementos com seletor: {selector}")
-                    businesses_found = True
-
-                    for i, business in enumerate(businesses[:self.max_results]):
-                        self.logger.info(f"Processando elemento {i+1}/{len(businesses)}")
-                        item = self.extract_business_data(business, response, selector)
-                        if item:
-                            items_count += 1
-                            yield item
-
-                            if items_count >= self.max_results:
-                                self.logger.info(f"Limite de {self.max_results} resultados atingido")
-                                break
-                    break
-            except Exception as e:
-                self.logger.error(f"Erro ao processar seletor {selector}: {e}")
+    def finish_page(self, response, query, selector, items):
+        """Contabiliza os itens da página, emite os novos/alterados e agenda as próximas páginas"""
+        state = self._page_state(query)
+        max_results = query['max_results']
+        businesses_found = selector is not None
+        # Página sem marcadores de resultados não é falha dos seletores de cartão
+        if self.selector_stats is not None and not self.empty_page(response):
+            self.selector_stats.record_page(selector, len(items))
+
+        # Outras páginas da consulta podem ter completado o limite enquanto esta era extraída
+        items = items[:max(max_results - state['items'], 0)]
+        items_count = len(items)
+        state['items'] += items_count
+        if items_count and state['items'] >= max_results:
+            self.logger.info(f"Limite de {max_results} resultados atingido")
+
+        if self.metrics is not None:
+            self.metrics.observe('items_per_page', items_count, buckets=COUNT_BUCKETS)
+
+        for item in items:
+            # Recrawl incremental: emitir apenas negócios novos ou alterados
+            if self.freshness and not self.freshness.record(query['search_query'], item):
                 continue
+            state['unexported'] += 1
+            if self.details is not None:
+                yield from self.enrich(item, query)
+            else:
+                yield item
 
         if not businesses_found:
-            self.logger.warning("Nenhum negócio encontrado com os seletores disponíveis")
-            # Tentar extrair qualquer texto que pareça ser nome de negócio
-            items_count = self.try_alternative_extraction(response)
+            self.logger.warning(f"Nenhum negócio encontrado com os seletores disponíveis - "
+                                f"extração alternativa: {items_count} itens com confiança baixa")
+            if hasattr(self, 'crawler'):  # no replay o spider não tem crawler
+                self.crawler.stats.inc_value('fallback/pages')
+                self.crawler.stats.inc_value('fallback/items', items_count)
 
         self.logger.info(f"Total de itens extraídos: {items_count}")
 
+        # Salvar HTML para debug (falhas de extração e amostra das demais páginas)
+        if self.snapshots:
+            self.snapshots.maybe_save(response, failed=not businesses_found)
+
+        # Próximas páginas (start=20, 40...) até atingir max_results
+        yield from self.next_pages(query, page_items=items_count, start=self.page_start(response))
+
+    def enrich(self, item, query):
+        """Enriquecimento (ENRICH_ENABLED): o item aguarda a sua página de detalhes na fila da consulta"""
+        if not item.cid:
+            yield item
+            return
+        fields = self.details.get(item.cid)
+        if fields is not None:
+            self.crawler.stats.inc_value('enrich/cached')
+            yield merge_details(item, fields)
+            return
+        self._page_state(query)['details_waiting'].append(item)
+        yield from self.next_details(query)
+
+    def next_details(self, query):
+        """Agenda páginas de detalhes da consulta, até ENRICH_CONCURRENCY ao mesmo tempo"""
+        state = self._page_state(query)
+        window = max(self._setting_int('ENRICH_CONCURRENCY', 2), 1)
+        waiting = state['details_waiting']
+        while waiting and state['details_in_flight'] < window:
+            item = waiting.popleft()
+            # Outra consulta pode ter buscado o mesmo CID enquanto o item aguardava
+            fields = self.details.get(item.cid)
+            if fields is not None:
+                self.crawler.stats.inc_value('enrich/cached')
+                yield merge_details(item, fields)
+                continue
+            if item.cid in self.detail_waiters:
+                # Já em busca (células vizinhas do planejador se sobrepõem): aguardar o resultado
+                state['details_parked'].setdefault(item.cid, []).append(item)
+                self.detail_waiters[item.cid].append(query)
+                continue
+            self.detail_waiters[item.cid] = []
+            state['details_in_flight'] += 1
+            self.crawler.stats.inc_value('enrich/requests')
+            # dont_filter: quem evita buscas repetidas é o cache de detalhes (o dupefilter do JOBDIR
+            # descartaria a requisição de um item retomado, e o item se perderia)
+            yield scrapy.Request(
+                url=detail_url(item.cid),
+                callback=self.parse_detail,
+                errback=self.detail_failed,
+                priority=self._setting_int('ENRICH_PRIORITY', -10),
+                meta={'query': query, 'item': item},
+                dont_filter=True,
+            )
+
+    def parse_detail(self, response):
+        """Página de detalhes: mescla telefone, site, horário e coordenadas no item"""
+        item = response.meta['item']
+        fields = extract_details(response)
+        # Página de resultados ou sem nenhum detalhe (interstício, redirecionamento inesperado):
+        # o item segue como veio do cartão e o CID não entra no cache
+        if response.meta.get('page_type') == RESULTS or not has_details(fields):
+            self.logger.warning(f"Página de detalhes sem dados: {response.url}")
+            self.crawler.stats.inc_value('enrich/empty')
+            yield item
+        else:
+            self.details.put(item.cid, fields)
+            yield merge_details(item, fields)
+        yield from self.detail_done(response.meta['query'], item.cid)
+
+    def detail_failed(self, failure):
+        """Errback das páginas de detalhes: o item segue sem os detalhes"""
+        request = failure.request
+        self.logger.warning(f"Falha ao obter detalhes {request.url}: {failure.value}")
+        self.crawler.stats.inc_value('enrich/failed')
+        yield request.meta['item']
+        yield from self.detail_done(request.meta['query'], request.meta['item'].cid)
+
+    def detail_done(self, query, cid):
+        """Libera a vaga na janela e os itens que aguardavam o mesmo CID"""
+        self._page_state(query)['details_in_flight'] -= 1
+        woken = {query['search_query']}
+        for waiting_query in self.detail_waiters.pop(cid, []):
+            if waiting_query['search_query'] not in woken:
+                woken.add(waiting_query['search_query'])
+                # Os itens de outra consulta saem por uma requisição dela (contabilidade por consulta)
+                yield scrapy.Request('data:,', callback=self.resume_details, dont_filter=True,
+                                     priority=self._setting_int('ENRICH_PRIORITY', -10),
+                                     meta={'query': waiting_query, 'dont_cache': True}, cb_kwargs={'cid': cid})
+        yield from self.resume_details(None, cid, query)
+
+    def resume_details(self, response, cid, query=None):
+        """Devolve à fila da consulta os itens que aguardavam ``cid`` (agora no cache, se a busca deu certo)"""
+        query = query or response.meta['query']
+        state = self._page_state(query)
+        state['details_waiting'].extendleft(reversed(state['details_parked'].pop(cid, [])))
+        yield from self.next_details(query)
+
+    def record_selector_hits(self, winners):
+        if self.selector_stats is not None and self.selector_stats.record_card(self.extractor.fields, winners):
+            # Fim de uma janela: cascatas reordenadas pelos acertos acumulados (também nos processos de extração)
+            ranking = self.selector_stats.ranking()
+            self.extractor.apply_ranking(ranking)
+            if self.parse_pool:
+                self.parse_pool.update_ranking(ranking)
+        if self.metrics is None:
+            return
+        for field in self.extractor.fields:
+            if field in winners:
+                self.metrics.inc('selector_hits_total', field=field, selector=winners[field])
+            else:
+                self.metrics.inc('selector_misses_total', field=field)
+
+    def selector_alert(self, field, rate, baseline):
+        """Taxa de acerto de um campo despencou em relação às execuções anteriores"""
+        what = 'seletores de cartão' if field == CARD_FIELD else f"campo '{field}'"
+        self.logger.error(f"Alerta de seletores: taxa de acerto do {what} caiu para {rate:.0%} "
+                          f"(histórico: {baseline:.0%}) - o layout do Google pode ter mudado")
+        self.crawler.stats.inc_value('selectors/alerts')
+        self.crawler.stats.set_value(f'selectors/alert/{field}', round(rate, 3))
+        if self.metrics is not None:
+            self.metrics.inc('selector_alerts_total', field=field)
+
     def extract_business_data(self, business, response, used_selector):
         try:
-            # Log do HTML do elemento para debug
-            element_html = business.get()
-            self.logger.debug(f"HTML do elemento (primeiros 200 chars): {element_html[:200]}...")
-
-            # Extrair nome - múltiplas tentativas
-            name_selectors = [
-                '.OSrXXb::text',
-                'h3::text',
-                '.BNeawe.vvjwJb.AP7Wnd::text',
-                '.LC20lb.MBeuO.DKV0Md::text',
-                'a h3::text',
-                '.r a h3::text',
-                'h3.LC20lb::text',
-                '.yuRUbf h3::text',
-            ]
-
-            name = None
-            for selector in name_selectors:
-                try:
-                    name = business.css(selector).get()
-                    if name and name.strip():
-                        self.logger.info(f"Nome encontrado com seletor '{selector}': {name}")
-                        break
-                except:
-                    continue
+            # Aceita tanto um Selector do parsel quanto um elemento lxml
+            card = getattr(business, 'root', business)
 
-            # Se não encontrou nome, tentar extrair qualquer texto
-            if not name:
-                all_texts = business.css('::text').getall()
-                for text in all_texts:
-                    if text and len(text.strip()) > 3 and not text.strip().isdigit():
-                        name = text.strip()
-                        self.logger.info(f"Nome extraído de texto geral: {name}")
-                        break
+            # Logs por item só em DEBUG (e sem formatar as mensagens quando desativado)
+            debug = self.logger.isEnabledFor(logging.DEBUG)
+            if debug:
+                element_html = etree.tostring(card, encoding='unicode')
+                self.logger.debug(f"HTML do elemento (primeiros 200 chars): {element_html[:200]}...")
+
+            query = self.query_for(response)
+
+            # Todos os campos em um único percurso do cartão
+            values, winners = self.extractor.extract(card)
+
+            self.record_selector_hits(winners)
+
+            name = values['name']
+            if name:
+                if debug:
+                    self.logger.debug(f"Nome encontrado com seletor '{winners['name']}': {name}")
+            else:
+                # Se não encontrou nome, tentar extrair qualquer texto
+                name = self.extractor.fallback_name(card)
+                if name and debug:
+                    self.logger.debug(f"Nome extraído de texto geral: {name}")
 
             if not name:
                 self.logger.warning(f"Nenhum nome encontrado para elemento com seletor {used_selector}")
                 return None
 
-            # Extrair outros dados com tentativas múltiplas
-            rating_selectors = [
-                '.BTtC6e::text',
-                'span.yi40Hd.YrbPuc::text',
-                '.AJLUJb::text',
-                '.fTKmHE99XE4__star-rating::text',
-            ]
-
-            rating = None
-            for selector in rating_selectors:
-                try:
-                    rating = business.css(selector).get()
-                    if rating:
-                        break
-                except:
-                    continue
-
-            # Extrair número de avaliações
-            review_selectors = [
-                '.RDApEe.YrbPuc::text',
-                'span.RDApEe::text',
-                '.YrbPuc::text',
-            ]
-
-            review_count = None
-            for selector in review_selectors:
-                try:
-                    review_count = business.css(selector).get()
-                    if review_count and '(' in review_count:
-                        review_count = review_count.strip('()')
-                        break
-                except:
-                    continue
-
-            # Extrair localização
-            location_selectors = [
-                '.UaQhfb::text',
-                '.rllt__details .UaQhfb::text',
-                '.VkpGBb .UaQhfb::text',
-            ]
-
-            location = None
-            for selector in location_selectors:
-                try:
-                    location = business.css(selector).get()
-                    if location:
-                        break
-                except:
-                    continue
-
-            # Criar item
-            item = BusinessItem()
-            item['name'] = name.strip() if name else ''
-            item['rating'] = rating.strip() if rating else ''
-            item['review_count'] = review_count.strip() if review_count else ''
-            item['location'] = location.strip() if location else ''
-            item['category'] = self.search_query.split()[0].title()
-            item['url'] = ''
-
-            self.logger.info(f"Item criado: {item['name']}")
+            # Criar item, já com os valores convertidos ("4,9" -> 4.9, "(1.234)" -> 1234)
+            item = BusinessItem(**item_fields(values, name, query['search_query']))
+
+            if debug:
+                self.logger.debug(f"Item criado: {item.name}")
             return item
 
         except Exception as e:
             self.logger.error(f"Erro ao extrair dados do negócio: {e}")
             return None
-
-    def try_alternative_extraction(self, response):
-        """Método alternativo para tentar extrair dados quando os seletores principais falham"""
-        self.logger.info("Tentando extração alternativa...")
-        items_count = 0
-
-        try:
-            # Procurar por qualquer texto que pareça ser nome de negócio
-            potential_names = response.css('h3::text, .BNeawe::text, .OSrXXb::text, a::text').getall()
-
-            # Filtrar nomes válidos
-            valid_names = []
-            for name in potential_names:
-                if (name and 
-                    len(name.strip()) > 3 and 
-                    not name.strip().isdigit() and
-                    'Google' not in name and
-                    'Maps' not in name):
-                    valid_names.append(name.strip())
-
-            self.logger.info(f"Encontrados {len(valid_names)} nomes potenciais")
-
-            for name in valid_names[:min(10, self.max_results)]:
-                item = BusinessItem()
-                item['name'] = name
-                item['rating'] = ''
-                item['review_count'] = ''
-                item['location'] = ''
-                item['category'] = self.search_query.split()[0].title()
-                item['url'] = ''
-
-                self.logger.info(f"Item alternativo extraído: {item['name']}")
-                items_count += 1
-                yield item
-
-        except Exception as e:
-            self.logger.error(f"Erro na extração alternativa: {e}")
-
-        return items_count
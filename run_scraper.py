@@ -4,30 +4,161 @@ Script para executar o Google Business Scraper com parâmetros personalizados
 """
 
 import argparse
+import logging
 import sys
 import os
-from scrapy.crawler import CrawlerProcess
-from scrapy.utils.project import get_project_settings
+import time
 
 # Adicionar o diretório do projeto ao path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-def main():
-    parser = argparse.ArgumentParser(description='Google Business Scraper')
-    parser.add_argument('--search', '-s', required=True, 
-                       help='Termo de busca (ex: "salão de beleza atibaia")')
-    parser.add_argument('--max-results', '-m', type=int, default=50,
+# Apenas módulos leves no topo: o Scrapy (e o Twisted, o lxml...) só é importado
+# pelo subcomando crawl, de modo que --help, validate, --enqueue e --collect
+# iniciam rápido
+from google_business_scraper.exporters import SINKS
+from google_business_scraper.planner import GeoGridPlanner, load_plan
+from google_business_scraper.queries import load_queries, make_query, safe_filename
+
+def build_parser():
+    options = argparse.ArgumentParser(add_help=False)
+    options.add_argument('--max-results', '-m', type=int, default=50,
                        help='Número máximo de resultados (padrão: 50)')
-    parser.add_argument('--output', '-o', 
+    options.add_argument('--output', '-o', 
                        help='Nome do arquivo de saída (sem extensão)')
-    parser.add_argument('--verbose', '-v', action='store_true',
+    options.add_argument('--format', '-f', default='xlsx',
+                       choices=list(SINKS),
+                       help='Formato de saída (padrão: xlsx; parquet requer pyarrow)')
+
+    crawl_options = argparse.ArgumentParser(add_help=False, parents=[options])
+    crawl_options.add_argument('--dedup-index', metavar='ARQUIVO',
+                       help='Índice SQLite de deduplicação entre execuções (ex: data/dedup.sqlite)')
+    crawl_options.add_argument('--freshness-cache', metavar='ARQUIVO',
+                       help='Cache de frescor por consulta para recrawl incremental (ex: data/freshness.sqlite)')
+    crawl_options.add_argument('--ttl', type=float, default=24,
+                       help='Horas em que uma consulta é considerada fresca (padrão: 24)')
+    crawl_options.add_argument('--serve-cached', action='store_true',
+                       help='Servir do cache as consultas frescas, em vez de pulá-las')
+    crawl_options.add_argument('--selector-stats', metavar='ARQUIVO',
+                       help='Acertos por seletor entre execuções, que definem a ordem das cascatas (ex: data/selectors.sqlite)')
+    crawl_options.add_argument('--http-cache', action='store_true',
+                       help='Cache HTTP em .scrapy/httpcache (desenvolvimento: repetir a busca não acessa o Google)')
+    crawl_options.add_argument('--enrich', action='store_true',
+                       help='Buscar a página de detalhes de cada negócio (telefone, site, horário e coordenadas)')
+    crawl_options.add_argument('--metrics-port', type=int, metavar='PORTA',
+                       help='Expor métricas no formato Prometheus em http://127.0.0.1:PORTA/metrics')
+    crawl_options.add_argument('--job', metavar='ID',
+                       help='Job retomável: o progresso fica em jobs/ID; repetir o comando com o mesmo ID continua de onde parou')
+    crawl_options.add_argument('--queue', metavar='URL',
+                       help='Fila compartilhada do modo distribuído (sqlite:///data/fila.sqlite ou redis://host:6379/0)')
+    mode = crawl_options.add_mutually_exclusive_group()
+    mode.add_argument('--enqueue', action='store_true',
+                       help='Adicionar as consultas de --search/--batch à fila e sair')
+    mode.add_argument('--worker', action='store_true',
+                       help='Executar como nó: consumir consultas da fila até ela esvaziar')
+    mode.add_argument('--collect', action='store_true',
+                       help='Exportar para data/ os itens gravados na fila pelos nós')
+    crawl_options.add_argument('--verbose', '-v', action='store_true',
                        help='Modo verboso (mais logs)')
 
-    args = parser.parse_args()
+    parser = argparse.ArgumentParser(
+        description='Google Business Scraper',
+        epilog='Sem subcomando, as opções valem para o crawl (ex: run_scraper.py --search "...")',
+    )
+    commands = parser.add_subparsers(dest='command', metavar='COMANDO')
+
+    crawl_parser = commands.add_parser('crawl', parents=[crawl_options], help='Executar uma busca, um lote ou um plano')
+    source = crawl_parser.add_mutually_exclusive_group()
+    source.add_argument('--search', '-s',
+                       help='Termo de busca (ex: "salão de beleza atibaia")')
+    source.add_argument('--batch', '-b', metavar='ARQUIVO',
+                       help='Arquivo de consultas, uma por linha: "busca | max | saida" ("-" lê da entrada padrão)')
+    source.add_argument('--plan', '-p', metavar='ARQUIVO',
+                       help='Plano JSON de cobertura de uma região (categoria + grade lat/long ou bairros)')
+
+    batch_parser = commands.add_parser('batch', parents=[crawl_options], help='Executar um arquivo de consultas')
+    batch_parser.add_argument('batch', metavar='ARQUIVO',
+                       help='Arquivo de consultas, uma por linha: "busca | max | saida" ("-" lê da entrada padrão)')
+    batch_parser.set_defaults(search=None, plan=None)
+
+    # As opções do replay são tratadas pelo próprio módulo (ver main)
+    commands.add_parser('replay', add_help=False, help='Replay offline, benchmark do parse e reextração do cache HTTP')
+
+    validate_parser = commands.add_parser('validate', parents=[options],
+                       help='Conferir um arquivo de consultas ou um plano .json sem acessar a rede')
+    validate_parser.add_argument('file', metavar='ARQUIVO',
+                       help='Arquivo de consultas ou plano JSON (pela extensão .json)')
+    return parser
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    # Compatibilidade: "run_scraper.py --search ..." continua sendo um crawl
+    if argv and argv[0].startswith('-') and argv[0] not in ('-h', '--help'):
+        argv.insert(0, 'crawl')
+
+    if argv and argv[0] == 'replay':
+        from google_business_scraper.replay import main as replay_main
+        return replay_main(argv[1:])
+
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.print_help()
+        return 2
+    if args.command == 'validate':
+        return validate(args)
+    return crawl(parser, args)
+
+def crawl(parser, args):
+    """Subcomandos crawl e batch (e os modos --enqueue, --worker e --collect)"""
+    if (args.enqueue or args.worker or args.collect) and not args.queue:
+        parser.error('--enqueue, --worker e --collect requerem --queue')
+    if not (args.search or args.batch or args.plan) and not (args.worker or args.collect):
+        parser.error('informe --search, --batch ou --plan')
+    queries = None
+    if args.batch:
+        try:
+            queries = load_queries(args.batch, args.max_results)
+        except (OSError, ValueError) as e:
+            print(f"❌ Erro ao ler arquivo de consultas: {e}")
+            sys.exit(1)
+        if not queries:
+            print("❌ Nenhuma consulta encontrada no arquivo")
+            sys.exit(1)
+
+    plan = None
+    planner = None
+    if args.plan:
+        try:
+            plan = load_plan(args.plan)
+            if args.output:
+                plan.setdefault('output', args.output)
+            planner = GeoGridPlanner(**{'max_results': args.max_results, **plan})
+        except (OSError, ValueError, TypeError) as e:
+            print(f"❌ Erro ao ler o plano: {e}")
+            sys.exit(1)
+
+    if args.enqueue:
+        if planner:
+            queries = planner.initial_queries()
+        enqueue(args.queue, queries or [make_query(args.search, args.max_results, args.output)])
+        return
+    if args.collect:
+        collect_items(args.queue, args.format, args.output)
+        return
 
     print(f"🚀 Iniciando scraper...")
-    print(f"📍 Busca: {args.search}")
-    print(f"📊 Max resultados: {args.max_results}")
+    if args.worker:
+        print(f"🛰️  Nó do modo distribuído - fila: {args.queue}")
+    elif planner:
+        print(f"🗺️  Plano: {planner.name} ({len(planner.initial_queries())} consultas iniciais)")
+    elif queries:
+        print(f"📋 Modo lote: {len(queries)} consultas")
+    else:
+        print(f"📍 Busca: {args.search}")
+        print(f"📊 Max resultados: {args.max_results}")
+
+    from scrapy.crawler import CrawlerProcess
+    from scrapy.utils.project import get_project_settings
 
     try:
         # Configurar settings
@@ -38,33 +169,190 @@ def main():
         else:
             settings.set('LOG_LEVEL', 'INFO')
 
-        # Configurar nome do arquivo de saída
-        if args.output:
-            output_filename = f"{args.output}.xlsx"
+        if args.dedup_index:
+            settings.set('DEDUP_INDEX', args.dedup_index)
+
+        if args.metrics_port:
+            settings.set('METRICS_PORT', args.metrics_port)
+
+        if args.selector_stats:
+            # Caminho relativo ao diretório atual, como os demais arquivos da linha de comando
+            settings.set('SELECTOR_STATS', os.path.abspath(args.selector_stats))
+
+        if args.http_cache:
+            settings.set('HTTPCACHE_ENABLED', True)
+
+        if args.enrich:
+            settings.set('ENRICH_ENABLED', True)
+
+        if args.job:
+            settings.set('JOBDIR', os.path.join('jobs', safe_filename(args.job)))
+
+        if args.worker:
+            settings.set('DISTRIBUTED_QUEUE', args.queue)
+            settings.set('DUPEFILTER_CLASS', 'google_business_scraper.distributed.SharedDupeFilter')
+            # Itens vão para o destino compartilhado; o --collect gera o arquivo final
+            pipelines = dict(settings.getdict('ITEM_PIPELINES'))
+            pipelines.pop('google_business_scraper.pipelines.ExportPipeline', None)
+            pipelines['google_business_scraper.pipelines.SharedSinkPipeline'] = 400
+            settings.set('ITEM_PIPELINES', pipelines)
+
+        if args.freshness_cache:
+            settings.set('FRESHNESS_CACHE', args.freshness_cache)
+            settings.set('FRESHNESS_TTL', args.ttl * 3600)
+            settings.set('FRESHNESS_MODE', 'serve' if args.serve_cached else 'skip')
+
+        # Configurar formato e nome do arquivo de saída
+        settings.set('EXPORT_FORMAT', args.format)
+        extension = SINKS[args.format].extension
+
+        if args.worker:
+            output_filenames = []
+        elif planner:
+            output_filename = f"{planner.output or safe_filename(planner.name)}.{extension}"
+            settings.set('EXPORT_FILENAME', output_filename)
+            output_filenames = [output_filename]
+        elif queries:
+            output_filenames = [query_filename(q, extension) for q in queries]
         else:
-            # Criar nome baseado na busca
-            safe_search = args.search.replace(' ', '_').replace(',', '').lower()
-            output_filename = f"{safe_search}.xlsx"
+            if args.output:
+                output_filename = f"{args.output}.{extension}"
+            else:
+                # Criar nome baseado na busca
+                safe_search = args.search.replace(' ', '_').replace(',', '').lower()
+                output_filename = f"{safe_search}.{extension}"
 
-        settings.set('EXCEL_FILENAME', output_filename)
+            settings.set('EXPORT_FILENAME', output_filename)
+            output_filenames = [output_filename]
 
-        # Executar o crawler
+        # Executar o crawler (um único processo para todas as consultas)
         process = CrawlerProcess(settings)
 
         # O nome do spider é 'business' (definido no business_spider.py)
-        process.crawl('business', 
+        crawler = process.create_crawler('business')
+        process.crawl(crawler,
                      search_query=args.search,
-                     max_results=args.max_results)
+                     max_results=args.max_results,
+                     queries=queries,
+                     plan=plan)
 
+        started = time.monotonic()
         process.start()
+        elapsed = time.monotonic() - started
+
+        if args.job and crawler.stats.get_value('finish_reason') != 'finished':
+            print(f"⏸️  Execução interrompida - repita o comando com --job {args.job} para continuar")
+        else:
+            print(f"✅ Scraping concluído!")
+        for output_filename in sorted(set(output_filenames)):
+            print(f"📁 Arquivo salvo: data/{output_filename}")
 
-        print(f"✅ Scraping concluído!")
-        print(f"📁 Arquivo salvo: data/{output_filename}")
+        # Resumo de vazão
+        query_count = len(queries) if queries else 1
+        if planner:
+            query_count = len(crawler.spider.queries)
+        if args.worker:
+            query_count = crawler.stats.get_value('distributed/completed', 0)
+        item_count = crawler.stats.get_value('item_scraped_count', 0)
+        if elapsed > 0:
+            print(f"⏱️  Tempo total: {elapsed:.1f}s")
+            print(f"📈 Vazão: {query_count / elapsed:.2f} consultas/s | {item_count / elapsed:.2f} itens/s "
+                  f"({item_count} itens)")
+        if planner:
+            print(f"🗺️  Células: {crawler.stats.get_value('planner/cells', 0)} | "
+                  f"{crawler.stats.get_value('planner/subdivided', 0)} subdivididas | "
+                  f"{crawler.stats.get_value('planner/pruned', 0)} sem novidades | "
+                  f"{crawler.stats.get_value('planner/exhausted', 0)} esgotadas")
+        if args.enrich:
+            print(f"🔎 Detalhes: {crawler.stats.get_value('enrich/requests', 0)} buscados | "
+                  f"{crawler.stats.get_value('enrich/cached', 0)} do cache | "
+                  f"{crawler.stats.get_value('enrich/failed', 0)} falhas")
+        parse_avg = crawler.stats.get_value('metrics/parse_seconds/avg')
+        if parse_avg is not None:
+            print(f"🔬 Parse: {parse_avg * 1000:.1f} ms/página")
 
     except Exception as e:
         print(f"❌ Erro durante execução:")
         print(str(e))
         sys.exit(1)
 
+def query_filename(query, extension):
+    return f"{query['output'] or safe_filename(query['search_query'])}.{extension}"
+
+def validate(args):
+    """Subcomando validate: confere o arquivo e lista as saídas, sem importar o Scrapy"""
+    extension = SINKS[args.format].extension
+    if args.file.endswith('.json'):
+        try:
+            plan = load_plan(args.file)
+            if args.output:
+                plan.setdefault('output', args.output)
+            planner = GeoGridPlanner(**{'max_results': args.max_results, **plan})
+            queries = planner.initial_queries()
+        except (OSError, ValueError, TypeError) as e:
+            print(f"❌ Plano inválido: {e}")
+            return 1
+        print(f"✅ Plano: {planner.name} ({len(queries)} consultas iniciais, até {planner.max_depth} subdivisões)")
+        for query in queries:
+            print(f"   • {query['search_query']} (max {query['max_results']})")
+        print(f"📁 Saída: data/{planner.output or safe_filename(planner.name)}.{extension}")
+        return 0
+
+    try:
+        queries = load_queries(args.file, args.max_results)
+    except (OSError, ValueError) as e:
+        print(f"❌ Arquivo de consultas inválido: {e}")
+        return 1
+    if not queries:
+        print("❌ Nenhuma consulta encontrada no arquivo")
+        return 1
+
+    print(f"✅ {len(queries)} consultas")
+    outputs = {}
+    for query in queries:
+        filename = query_filename(query, extension)
+        outputs.setdefault(filename, []).append(query['search_query'])
+        print(f"   • {query['search_query']} (max {query['max_results']}) → data/{filename}")
+    for filename, searches in outputs.items():
+        if len(searches) > 1:
+            print(f"⚠️  {len(searches)} consultas gravam em data/{filename}: {', '.join(searches)}")
+    return 0
+
+def enqueue(url, queries):
+    """Adiciona as consultas à fila compartilhada"""
+    from google_business_scraper.distributed import open_task_queue
+
+    try:
+        task_queue = open_task_queue(url)
+        added = task_queue.enqueue(queries)
+        counts = task_queue.counts()
+        task_queue.close()
+    except (RuntimeError, ValueError) as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    print(f"📥 {added} consultas adicionadas ({len(queries) - added} já estavam na fila)")
+    print(f"📋 Fila: {counts.get('pending', 0)} pendentes | {counts.get('running', 0)} em andamento | "
+          f"{counts.get('done', 0)} concluídas")
+
+def collect_items(url, export_format, output):
+    """Exporta os itens gravados pelos nós para um único arquivo em data/"""
+    from google_business_scraper.distributed import collect, open_task_queue
+
+    try:
+        task_queue = open_task_queue(url)
+    except (RuntimeError, ValueError) as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    sink_class = SINKS[export_format]
+    os.makedirs('data', exist_ok=True)
+    filename = f"data/{output or 'distribuido'}.{sink_class.extension}"
+    unfinished = task_queue.unfinished()
+    rows = collect(task_queue, sink_class, filename, logging.getLogger('collect'))
+    task_queue.close()
+    print(f"✅ {rows} itens exportados")
+    print(f"📁 Arquivo salvo: {filename}")
+    if unfinished:
+        print(f"⚠️  {unfinished} consultas ainda não concluídas na fila")
+
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
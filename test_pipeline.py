@@ -70,9 +70,10 @@ def test_scrapy_items():
         # Criar item de teste
         item = BusinessItem()
         item['name'] = 'Salão Teste'
-        item['rating'] = '4.5'
-        item['review_count'] = '(100)'
-        item['location'] = 'Atibaia, SP'
+        item['rating'] = 4.5
+        item['review_count'] = 100
+        item['city'] = 'Atibaia'
+        item['state'] = 'SP'
         item['category'] = 'Salão de Beleza'
         item['url'] = 'https://example.com'
 
@@ -85,6 +86,1253 @@ def test_scrapy_items():
         print("💡 Verifique se o arquivo items.py tem todos os campos definidos")
         return False
 
+def test_replay_debug_page():
+    """Teste offline do parse sobre o debug_page.html (sem rede)"""
+    print("\n🧪 Testando replay do debug_page.html...")
+
+    from google_business_scraper.replay import replay_fixtures
+
+    fixture = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'debug_page.html')
+    items = replay_fixtures([fixture], search_query='barbearia são paulo', max_results=50)
+
+    assert len(items) == 22, f"Esperados 22 itens, obtidos {len(items)}"
+    first = dict(items[0])
+    assert first['name'] == 'Barbearia Black Zone Peixoto Gomide'
+    assert first['rating'] == 4.9
+    assert first['review_count'] == 1500, "'1,5 mil' avaliações deveria virar 1500"
+    assert first['category'] == 'Barbearia'
+
+    # Extração em processo de trabalho (PARSE_WORKERS) deve produzir os mesmos itens
+    from google_business_scraper.items import BusinessItem
+    from google_business_scraper.offload import parse_page
+    from google_business_scraper.replay import load_fixture
+    _, fields, _, _ = parse_page(load_fixture(fixture), 'utf-8', 'barbearia são paulo', 50)
+    assert [dict(BusinessItem(**f)) for f in fields] == [dict(item) for item in items], \
+        "Extração do worker difere da extração no spider"
+
+    # Primeiro elemento do seletor sem texto direto: vale o próximo, como em css('::text').get()
+    from scrapy import Selector
+    from google_business_scraper.extraction import FIELD_SELECTORS, CompiledExtractor
+    card = Selector(text='<div class="VkpGBb"><div class="OSrXXb"><b>Ícone</b></div>'
+                         '<div class="OSrXXb">Barbearia Y</div><h3>Título</h3>'
+                         '<span class="BTtC6e"><i></i></span><span class="BTtC6e">4,7</span></div>').css('.VkpGBb')[0]
+    values, winners = CompiledExtractor().extract(card.root)
+    for field in ('name', 'rating'):
+        expected = next((text for text in (card.css(css).get() for css in FIELD_SELECTORS[field]) if text), None)
+        assert values[field] == expected, f"{field}: {values[field]!r} != {expected!r}"
+    assert values['name'] == 'Barbearia Y' and winners['name'] == '.OSrXXb::text'
+
+    print(f"✅ {len(items)} itens extraídos do debug_page.html")
+    return True
+
+def test_identity_pool():
+    """Teste do rodízio de identidades e do cooldown após bloqueio"""
+    print("\n🧪 Testando pool de identidades...")
+
+    from google_business_scraper.middlewares import Identity, IdentityPool
+
+    pool = IdentityPool([Identity(0, 'http://p0:8080'), Identity(1, 'http://p1:8080')], cooldown=60)
+    first, wait = pool.acquire(now=0)
+    second, _ = pool.acquire(now=0)
+    assert wait == 0 and first is not second, "Identidades livres devem ser usadas antes de repetir"
+
+    # Identidade bloqueada fica fora do rodízio até o fim do cooldown (que dobra)
+    pool.release(first)
+    pool.release(second)
+    assert pool.block(first, now=0) == 60
+    assert pool.acquire(now=1)[0] is second
+    assert pool.block(second, now=1) == 60
+    identity, wait = pool.acquire(now=2)
+    assert identity is first and wait == 58, "Todas em cooldown: esperar a primeira liberar"
+    assert pool.block(first, now=60) == 120
+
+    print("✅ Rodízio e cooldown de identidades OK")
+    return True
+
+def test_block_detection():
+    """Teste da classificação de páginas e do controle AIMD"""
+    print("\n🧪 Testando detecção de bloqueio...")
+
+    from scrapy.http import HtmlResponse
+    from google_business_scraper.blocking import AimdController, classify_response
+    from google_business_scraper.replay import load_fixture
+
+    fixture = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'debug_page.html')
+    url = 'https://www.google.com/search?q=teste&tbm=lcl'
+    pages = {
+        'results': HtmlResponse(url, body=load_fixture(fixture)),
+        'block': HtmlResponse(url, body=b'<form id="captcha-form"></form>'),
+        'consent': HtmlResponse('https://consent.google.com/ml?continue=x', body=b'<html></html>'),
+        'empty': HtmlResponse(url, body=b'<html><div class="g" data-ved="x">Anuncio</div></html>'),
+    }
+    for expected, response in pages.items():
+        assert classify_response(response) == expected, f"Página '{expected}' classificada errado"
+
+    controller = AimdController(min_delay=1.0, max_delay=10.0, decrease=0.5, factor=2.0)
+    assert controller.on_success(2.0) == 1.5 and controller.on_success(1.2) == 1.0
+    assert controller.on_block(3.0) == 6.0 and controller.on_block(8.0) == 10.0
+
+    print("✅ Classificação de páginas e AIMD OK")
+    return True
+
+def test_distributed_queue():
+    """Teste da fila compartilhada (SQLite): claim, retomada após lease vencido e impressões digitais"""
+    print("\n🧪 Testando fila distribuída...")
+
+    import tempfile
+    from google_business_scraper.distributed import SqliteTaskQueue
+    from google_business_scraper.items import BusinessItem
+    from google_business_scraper.queries import make_query
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'fila.sqlite')
+        # Nó "a" com lease já vencido: simula um nó que morreu no meio da consulta
+        node_a = SqliteTaskQueue(path, lease=-1)
+        node_b = SqliteTaskQueue(path, lease=60)
+        node_a.node, node_b.node = 'a', 'b'
+
+        assert node_a.enqueue([make_query('barbearia atibaia'), make_query('padaria atibaia')]) == 2
+        assert node_b.enqueue([make_query('barbearia atibaia')]) == 0, "Consulta repetida não entra na fila"
+
+        query, resumed = node_a.claim()
+        assert query['search_query'] == 'barbearia atibaia' and not resumed
+        assert not node_a.seen('barbearia atibaia', 'fp1') and node_b.seen('barbearia atibaia', 'fp1')
+
+        # O nó "b" retoma primeiro a consulta abandonada, que volta a ser buscada do zero
+        query, resumed = node_b.claim()
+        assert query['search_query'] == 'barbearia atibaia' and resumed
+        assert not node_b.seen('barbearia atibaia', 'fp1'), "Retomada deve esquecer as impressões digitais"
+
+        node_b.push_item(BusinessItem(name='Barbearia X', query='barbearia atibaia'))
+        node_b.complete('barbearia atibaia')
+        assert [item['name'] for item in node_b.iter_items()] == ['Barbearia X']
+        assert node_b.claim()[0]['search_query'] == 'padaria atibaia'
+        assert node_b.claim() == (None, False)
+        assert node_b.counts() == {'done': 1, 'running': 1}
+
+        # Encerramento normal devolve à fila as consultas não concluídas
+        from scrapy import Request
+        from scrapy.utils.request import RequestFingerprinter
+        from google_business_scraper.distributed import SharedDupeFilter
+        first_page = Request('https://www.google.com/search?q=padaria+atibaia',
+                             meta={'query': make_query('padaria atibaia')})
+        assert not SharedDupeFilter(node_b, RequestFingerprinter()).request_seen(first_page)
+        node_b.close()
+        assert node_a.counts() == {'done': 1, 'pending': 1}
+
+        # Outro nó pega a consulta devolvida (sem lease vencido): a primeira página não é filtrada
+        node_c = SqliteTaskQueue(path, lease=60)
+        node_c.node = 'c'
+        query, resumed = node_c.claim()
+        assert query['search_query'] == 'padaria atibaia' and not resumed
+        assert not SharedDupeFilter(node_c, RequestFingerprinter()).request_seen(first_page), \
+            "Consulta devolvida deve recomeçar sem as impressões digitais do nó anterior"
+        node_c.close()
+        node_a.close()
+
+    print("✅ Fila distribuída OK")
+    return True
+
+def test_checkpoint_resume():
+    """Teste do checkpoint: gravação em lote, retomada e páginas pendentes refeitas"""
+    print("\n🧪 Testando checkpoint de jobs...")
+
+    import tempfile
+    from google_business_scraper.checkpoints import CheckpointStore
+    from google_business_scraper.queries import make_query
+    from google_business_scraper.spiders.business_spider import BusinessSpider
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'checkpoint.sqlite')
+        store = CheckpointStore(path)
+        flushed = []
+        store.flushers.append(lambda: flushed.append(True))
+        assert not store.resumed
+
+        # Páginas 0 e 40 concluídas; a página 20 estava em andamento quando o job parou
+        query = make_query('barbearia atibaia', 100)
+        store.stage_state(query, {'items': 40, 'next_start': 60, 'done': False, 'pages': {0, 40}})
+        store.stage_emitted('cid:1')
+        store.close()
+        assert flushed, "Os sinks devem gravar os lotes antes do checkpoint"
+
+        store = CheckpointStore(path)
+        assert store.resumed and store.run == 2
+        saved = store.load_states()['barbearia atibaia']
+        assert store.load_emitted() == {'cid:1'}
+        store.close()
+
+    spider = BusinessSpider(queries=[query])
+    requests = list(spider.resume_query(query, saved))
+    assert [request.meta['start'] for request in requests] == [20], "Só a página pendente deve ser refeita"
+    state = spider.pagination['barbearia atibaia']
+    assert state['items'] == 40 and state['next_start'] == 60 and state['in_flight'] == 1
+
+    print("✅ Checkpoint e retomada OK")
+    return True
+
+def test_geo_planner():
+    """Teste do planejador: grade inicial, uule e subdivisão adaptativa das células"""
+    print("\n🧪 Testando planejador por grade geográfica...")
+
+    from google_business_scraper.planner import GeoGridPlanner
+    from google_business_scraper.spiders.business_spider import BusinessSpider
+
+    planner = GeoGridPlanner('barbearia', 'Atibaia', bbox=[-23.2, -46.7, -23.0, -46.5], grid=2, max_depth=1)
+    cells = planner.initial_queries()
+    assert len(cells) == 4 and len({q['search_query'] for q in cells}) == 4
+    assert '&uule=a+' in BusinessSpider.build_search_url(cells[0]['search_query'], cell=cells[0]['cell'])
+
+    # Célula saturada com negócios novos: dividida em 4 no nível seguinte
+    children = planner.expand(cells[0], saturated=True, new_items=20)
+    assert len(children) == 4 and all(child['cell']['depth'] == 1 for child in children)
+    # Esgotada, sem nada novo ou na profundidade máxima: não divide
+    assert planner.expand(cells[1], saturated=False, new_items=20) == []
+    assert planner.expand(cells[2], saturated=True, new_items=0) == []
+    assert planner.expand(children[0], saturated=True, new_items=20) == []
+    assert planner.stats == {'cells': 8, 'subdivided': 1, 'pruned': 1, 'exhausted': 1}
+
+    print("✅ Planejador OK")
+    return True
+
+def test_async_api():
+    """Teste da API assíncrona: buscas seguidas no mesmo reactor, servidas por um proxy local"""
+    print("\n🧪 Testando API assíncrona...")
+
+    import asyncio
+    import http.server
+    import threading
+    from google_business_scraper.api import ScraperRunner
+
+    fixture = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'debug_page.html')
+    with open(fixture, 'rb') as f:
+        body = f.read()
+
+    class FixtureProxy(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=UTF-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), FixtureProxy)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    # http:// para o proxy local responder sem túnel CONNECT
+    runner = ScraperRunner({'IDENTITY_PROXIES': [f'http://127.0.0.1:{server.server_address[1]}'],
+                            'DOWNLOAD_DELAY': 0, 'BACKOFF_MIN_DELAY': 0, 'LOG_LEVEL': 'WARNING'})
+    from google_business_scraper.spiders.business_spider import BusinessSpider
+    build_search_url = BusinessSpider.build_search_url
+    BusinessSpider.build_search_url = staticmethod(
+        lambda query, start=0, cell=None: build_search_url(query, start, cell).replace('https://', 'http://'))
+
+    async def collect(query):
+        return [item async for item in runner.scrape(query, max_results=20)]
+
+    try:
+        first = asyncio.run(collect('barbearia são paulo'))
+        second = asyncio.run(collect('barbearia atibaia'))
+    finally:
+        BusinessSpider.build_search_url = staticmethod(build_search_url)
+        runner.stop()
+        server.shutdown()
+
+    assert len(first) == 20 and len(second) == 20, f"Esperados 20 itens por busca, obtidos {len(first)} e {len(second)}"
+    assert first[0].name == 'Barbearia Black Zone Peixoto Gomide'
+    assert second[0].query == 'barbearia atibaia'
+
+    print("✅ API assíncrona OK")
+    return True
+
+def test_http_cache():
+    """Teste do cache HTTP em SQLite: compressão, TTL, limite de tamanho e reextração"""
+    print("\n🧪 Testando cache HTTP...")
+
+    import tempfile
+    import time
+    from types import SimpleNamespace
+    import scrapy
+    from scrapy.http import HtmlResponse
+    from scrapy.settings import Settings
+    from scrapy.utils.request import RequestFingerprinter
+    from google_business_scraper.httpcache import SqliteCacheStorage
+    from google_business_scraper.replay import load_fixture, make_response, reextract_cache
+
+    body = load_fixture(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'debug_page.html'))
+    with tempfile.TemporaryDirectory() as directory:
+        settings = Settings({'HTTPCACHE_DIR': directory, 'HTTPCACHE_EXPIRATION_SECS': 3600,
+                             'HTTPCACHE_MAX_BYTES': 0, 'HTTPCACHE_COMPRESSION': 'gzip'})
+        spider = SimpleNamespace(name='business', crawler=SimpleNamespace(request_fingerprinter=RequestFingerprinter()),
+                                 logger=SimpleNamespace(info=print))
+        storage = SqliteCacheStorage(settings)
+        storage.open_spider(spider)
+        first = make_response(body, 'barbearia são paulo', start=0)
+        second = make_response(body, 'barbearia são paulo', start=20)
+        storage.store_response(spider, first.request, first)
+        storage.store_response(spider, second.request, second)
+
+        cached = storage.retrieve_response(spider, first.request)
+        assert cached is not None and cached.body == body and cached.url == first.url
+        assert storage.total_bytes < len(body), "O corpo deve ser gravado comprimido"
+
+        # Redirecionamento (maps?cid= -> /maps/place/...): a requisição original também é servida pelo cache
+        original = scrapy.Request('https://www.google.com/maps?cid=123&hl=pt-BR')
+        redirected = original.replace(url='https://www.google.com/maps/place/Loja/@-23.1,-46.5,17z')
+        redirected.meta['redirect_urls'] = [original.url]
+        storage.store_response(spider, redirected, HtmlResponse(url=redirected.url, body=b'<html>loja</html>',
+                                                                encoding='utf-8', request=redirected))
+        cached = storage.retrieve_response(spider, original)
+        assert cached is not None and cached.url == redirected.url and cached.body == b'<html>loja</html>'
+
+        # Acima do limite, as respostas mais antigas saem primeiro
+        storage.max_bytes = storage.total_bytes - 1
+        storage.evict()
+        assert storage.retrieve_response(spider, first.request) is None
+        assert storage.retrieve_response(spider, second.request) is not None
+        # Fora do TTL a resposta é ignorada
+        storage.expiration_secs = 1
+        storage.connection.execute("UPDATE responses SET stored_at = ?", (time.time() - 10,))
+        assert storage.retrieve_response(spider, second.request) is None
+        storage.close_spider(spider)
+
+        items = list(reextract_cache(os.path.join(directory, 'business.sqlite')))
+        assert len(items) == 22 and items[0].query == 'barbearia são paulo'
+
+    print("✅ Cache HTTP OK")
+    return True
+
+def test_fallback_extraction():
+    """Teste da extração alternativa (nenhum seletor de cartão funciona): limites e confiança baixa"""
+    print("\n🧪 Testando extração alternativa...")
+
+    from scrapy import Selector
+    from google_business_scraper.extraction import FallbackExtractor
+    from google_business_scraper.items import BusinessItem
+    from google_business_scraper import offload
+    from google_business_scraper.replay import load_fixture, make_response, make_spider, replay_page
+
+    body = load_fixture(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'debug_page.html'))
+    root = Selector(text=body.decode('utf-8')).root
+
+    results = FallbackExtractor().extract(root)
+    assert len(results) == 20, f"Padrão de FALLBACK_MAX_ITEMS é 20, obtidos {len(results)}"
+    assert len(FallbackExtractor(max_items=50).extract(root)) == 22
+    name, values = results[0]
+    assert name == 'Barbearia Black Zone Peixoto Gomide'
+    assert values['rating'] == '4,9' and values['location'] == '63 Rua Peixoto Gomide'
+    assert len(FallbackExtractor().extract(root, limit=5)) == 5
+    assert len(FallbackExtractor(max_nodes=10).extract(root)) < 20, "max_nodes deve limitar o percurso"
+    assert FallbackExtractor(time_budget=0).extract(root) == [], "Orçamento esgotado: o percurso para logo no início"
+
+    # Spider sem nenhum seletor de cartão: itens saem da extração alternativa, marcados como 'low'
+    spider = make_spider('barbearia são paulo', max_results=50)
+    spider.extractor.business_xpaths = []
+    items = replay_page(spider, make_response(body, 'barbearia são paulo', 50))
+    assert len(items) == 20 and all(item.confidence == 'low' for item in items)
+    assert items[0].name == name and items[0].rating == 4.9
+
+    # O mesmo no processo de trabalho (PARSE_WORKERS)
+    offload._init_worker()
+    offload._extractor.business_xpaths = []
+    selector, fields, _, _ = offload.parse_page(body, 'utf-8', 'barbearia são paulo', 50)
+    assert selector is None and [dict(BusinessItem(**f)) for f in fields] == [dict(item) for item in items]
+    offload._init_worker()
+
+    # Página sem os marcadores de resultados: classificada como vazia, mas ainda passa pela
+    # extração alternativa (e não pela cascata de seletores)
+    from google_business_scraper.blocking import EMPTY, classify_response
+    unmarked = body.replace(b'data-cid', b'data-xid').replace(b'VkpGBb', b'XxYyZz').replace(b'rllt__details', b'rllt__x')
+    response = make_response(unmarked, 'barbearia são paulo', 50)
+    assert classify_response(response) == EMPTY
+    response.meta['page_type'] = EMPTY
+    spider = make_spider('barbearia são paulo', max_results=50)
+    assert spider.check_page(response)
+    items = replay_page(spider, response)
+    assert len(items) == 20 and all(item.confidence == 'low' for item in items)
+    _, fields, _, _ = offload.parse_page(unmarked, 'utf-8', 'barbearia são paulo', 5, fallback_only=True)
+    assert len(fields) == 5 and fields[0]['confidence'] == 'low'
+
+    print(f"✅ {len(items)} itens de confiança baixa")
+    return True
+
+def test_detail_enrichment():
+    """Teste do enriquecimento: extração dos detalhes, janela por consulta e cache por CID"""
+    print("\n🧪 Testando enriquecimento com detalhes...")
+
+    import tempfile
+    import scrapy
+    from scrapy.http import HtmlResponse
+    from scrapy.utils.test import get_crawler
+    from twisted.python.failure import Failure
+    from google_business_scraper.enrichment import DetailCache
+    from google_business_scraper.items import BusinessItem
+    from google_business_scraper.queries import make_query
+    from google_business_scraper.replay import load_fixture, make_response
+    from google_business_scraper.spiders.business_spider import BusinessSpider
+
+    detail_html = (
+        '<html><body><h1>Barbearia Black Zone</h1>'
+        '<button data-item-id="phone:tel:+5511999990000">(11) 99999-0000</button>'
+        '<a data-item-id="authority" href="https://blackzone.com.br/">blackzone.com.br</a>'
+        '<table class="eK4R0e"><tr><td>segunda-feira</td><td>09:00–19:00</td></tr>'
+        '<tr><td>domingo</td><td>Fechado</td></tr></table></body></html>'
+    ).encode('utf-8')
+    place_url = 'https://www.google.com/maps/place/Barbearia+Black+Zone/@-23.5611,-46.6693,17z'
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache_path = os.path.join(directory, 'details.sqlite')
+        crawler = get_crawler(BusinessSpider, {'ENRICH_ENABLED': True, 'ENRICH_CACHE': cache_path,
+                                               'ENRICH_CONCURRENCY': 2})
+        spider = BusinessSpider.from_crawler(crawler, search_query='barbearia são paulo', max_results=50)
+
+        body = load_fixture(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'debug_page.html'))
+        output = list(spider.parse(make_response(body, 'barbearia são paulo', 50)))
+        details = [r for r in output if isinstance(r, scrapy.Request) and '/maps' in r.url]
+        assert not any(isinstance(r, BusinessItem) for r in output), "Itens com CID aguardam os detalhes"
+        assert len(details) == 2, f"Janela de ENRICH_CONCURRENCY=2 por consulta, obtidas {len(details)}"
+        assert all(r.priority < 0 for r in details), "Detalhes abaixo das páginas de busca na fila"
+
+        # Página de detalhes (após o redirecionamento para /maps/place/...@lat,lng)
+        first = details[0]
+        response = HtmlResponse(url=place_url, body=detail_html, encoding='utf-8', request=first)
+        output = list(spider.parse_detail(response))
+        item = output[0]
+        assert isinstance(item, BusinessItem) and item.phone == '+5511999990000'
+        assert item.website == 'https://blackzone.com.br/' and item.url == place_url
+        assert item.hours == 'segunda-feira 09:00–19:00; domingo Fechado'
+        assert (item.latitude, item.longitude) == (-23.5611, -46.6693)
+        assert len(output) == 2 and isinstance(output[1], scrapy.Request), "Próxima página de detalhes da fila"
+        next_detail = output[1]
+
+        # Mesmo CID em outra consulta enquanto a página está em busca: aguarda, sem nova requisição
+        other = make_query('barbearia pinheiros', 50)
+        parked = BusinessItem(name='Barbearia Black Zone', cid=details[1].meta['item'].cid)
+        assert list(spider.enrich(parked, other)) == []
+
+        # Falha: o item segue sem os detalhes e a outra consulta é acordada
+        failure = Failure(Exception('timeout'))
+        failure.request = details[1]
+        output = list(spider.detail_failed(failure))
+        assert output[0].cid == details[1].meta['item'].cid and output[0].phone == ''
+        assert any(r.url == 'data:,' and r.meta['query'] is other for r in output[1:])
+        assert crawler.stats.get_value('enrich/failed') == 1
+
+        # Página sem detalhes (ou de resultados): o item segue como veio e o CID não entra no cache
+        empty_cid = next_detail.meta['item'].cid
+        response = HtmlResponse(url='https://www.google.com/', body=b'<html><body>Google</body></html>',
+                                encoding='utf-8', request=next_detail)
+        output = list(spider.parse_detail(response))
+        assert output[0].cid == empty_cid and output[0].url != 'https://www.google.com/'
+        assert spider.details.get(empty_cid) is None, "Página sem detalhes não pode entrar no cache"
+        assert crawler.stats.get_value('enrich/empty') == 1
+        spider.details.close()
+
+        # Outra execução: o CID já enriquecido dentro do TTL não é buscado de novo
+        cache = DetailCache(cache_path)
+        cid = first.meta['item'].cid
+        assert cache.get(cid)['phone'] == '+5511999990000'
+        cache.ttl = 0
+        assert cache.get(cid) is None, "Fora do TTL o CID deve ser buscado de novo"
+        cache.close()
+
+    print("✅ Enriquecimento OK")
+    return True
+
+def test_selector_health():
+    """Teste das estatísticas de seletores: persistência, reordenação das cascatas e alertas"""
+    print("\n🧪 Testando saúde dos seletores...")
+
+    import tempfile
+    from scrapy.utils.test import get_crawler
+    from google_business_scraper import offload
+    from google_business_scraper.extraction import CompiledExtractor
+    from google_business_scraper.health import CARD_FIELD, SelectorStats
+    from google_business_scraper.replay import load_fixture
+    from google_business_scraper.spiders.business_spider import BusinessSpider
+
+    fields = ['name', 'rating', 'review_count', 'location']
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'selectors.sqlite')
+        stats = SelectorStats(path, window=50)
+        for _ in range(100):
+            stats.record_card(fields, {'name': 'h3::text', 'rating': '.BTtC6e::text'})
+        stats.record_card(fields, {'name': '.OSrXXb::text'})
+        stats.record_page('.VkpGBb', 20)
+        stats.close()
+
+        # Próxima execução: contagens anteriores com metade do peso, cascatas reordenadas
+        alerts = []
+        stats = SelectorStats(path, decay=0.5, window=50, alert=lambda *args: alerts.append(args))
+        ranking = stats.ranking()
+        assert ranking['name'] == ['h3::text', '.OSrXXb::text'] and ranking[CARD_FIELD] == ['.VkpGBb']
+        assert stats.selectors[('name', 'h3::text')][0] == 50
+        extractor = CompiledExtractor()
+        extractor.apply_ranking(ranking)
+        assert [s.css for s in extractor.compiled['name'][:2]] == ['h3::text', '.OSrXXb::text']
+        assert extractor.business_xpaths[0][0] == '.VkpGBb'
+        assert extractor.compiled['name'][2].css == '.BNeawe.vvjwJb.AP7Wnd::text', "Sem acertos: ordem original"
+
+        # Avaliação some dos cartões: um alerta por queda (não a cada janela)
+        for _ in range(100):
+            stats.record_card(fields, {'name': 'h3::text'})
+        assert len(alerts) == 1 and alerts[0][0] == 'rating' and alerts[0][1] == 0
+        stats.close()
+
+        # PARSE_WORKERS: a reordenação do fim de cada janela também vale para os processos de extração
+        crawler = get_crawler(BusinessSpider, {'SELECTOR_STATS': path, 'SELECTOR_ALERT_WINDOW': 10,
+                                               'PARSE_WORKERS': 1})
+        spider = BusinessSpider.from_crawler(crawler, search_query='barbearia são paulo')
+        for _ in range(10):
+            spider.record_selector_hits({'name': '.OSrXXb::text'})
+        pool = spider.parse_pool
+        assert pool.ranking_version == 1 and pool.ranking['name'][0] == 'h3::text'
+        pool.close()
+        spider.selector_stats.close()
+
+    # Padrão do projeto: desativado, o crawl não grava estado entre execuções
+    from google_business_scraper import settings as project_settings
+    assert project_settings.SELECTOR_STATS is None
+    spider = BusinessSpider.from_crawler(get_crawler(BusinessSpider, {'SELECTOR_STATS': None}),
+                                         search_query='barbearia são paulo')
+    assert spider.selector_stats is None
+
+    # No processo de trabalho, a ordem recebida com a página é aplicada uma vez por versão
+    body = load_fixture(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'debug_page.html'))
+    offload._init_worker()
+    last = '.BNeawe.vvjwJb.AP7Wnd::text'
+    assert offload._extractor.compiled['name'][0].css != last
+    offload.parse_page(body, 'utf-8', 'barbearia são paulo', 5, ranking={'name': [last]}, ranking_version=1)
+    assert offload._extractor.compiled['name'][0].css == last
+    offload.parse_page(body, 'utf-8', 'barbearia são paulo', 5, ranking={'name': ['h3::text']}, ranking_version=1)
+    assert offload._extractor.compiled['name'][0].css == last, "Mesma versão: nada a reaplicar"
+    offload._init_worker()
+
+    print("✅ Saúde dos seletores OK")
+    return True
+
+def test_normalization():
+    """Teste da normalização: linhas do cartão, gazetteer em trie, endereço canônico e cache"""
+    print("\n🧪 Testando normalização e gazetteer...")
+
+    import tempfile
+    from google_business_scraper.items import BusinessItem
+    from google_business_scraper.normalization import Gazetteer, Normalizer
+    from google_business_scraper.replay import replay_fixtures
+
+    # Categoria e localização saem das linhas do cartão, não da consulta
+    fixture = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'debug_page.html')
+    items = replay_fixtures([fixture], search_query='barbearia são paulo', max_results=50)
+    assert (items[1].category, items[1].address) == ('Clínica de Fisioterapia', '18 Rua Luiz Alberto Vieira dos Santos')
+    assert (items[2].category, items[2].city, items[2].state) == ('Salão de Beleza', 'Atibaia', 'SP')
+
+    gazetteer = Gazetteer.load()
+    assert gazetteer.lookup('sao paulo') == [('São Paulo', 'SP')]
+    matches = [(start, end) for start, end, _ in gazetteer.matches('loja em Santana de Parnaíba SP')]
+    assert matches == [(2, 5)], "O nome mais longo (Santana de Parnaíba) deve vencer Santana"
+
+    normalizer = Normalizer(gazetteer, cache_size=100)
+    first = normalizer.normalize(items[0])
+    assert (first.address, first.category) == ('Rua Peixoto Gomide, 63', 'Barbearia')
+    item = normalizer.normalize(BusinessItem(name='X', address='Av.  Brasil, 10 - Centro', city='bragança paulista',
+                                             state='São Paulo', query='salão de beleza em atibaia'))
+    assert (item.address, item.city, item.state) == ('Avenida Brasil, 10 - Centro', 'Bragança Paulista', 'SP')
+    assert item.category == 'Salão de beleza', "Sem categoria no cartão: a consulta sem a cidade"
+    for item in items[2:]:
+        normalizer.normalize(item)
+    assert normalizer.resolved == 21
+    assert normalizer.place.cache_info().hits == 19, "Mesma cidade e UF: resolvidas uma única vez"
+
+    # Gazetteer próprio (ex: lista do IBGE) no mesmo formato
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'municipios.csv')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write("municipio,uf\nBom Jesus,PI\nBom Jesus,RS\n")
+        normalizer = Normalizer(Gazetteer.load(path))
+        assert normalizer.place('bom jesus', '') == ('Bom Jesus', '', True), "Nome em duas UFs: UF fica vazia"
+        assert normalizer.place('Bom Jesus', 'rs') == ('Bom Jesus', 'RS', True)
+        assert normalizer.place('Atibaia', 'SP') == ('Atibaia', 'SP', False)
+
+    print("✅ Normalização OK")
+    return True
+
+def test_lazy_cli():
+    """Teste da CLI: validate sem importar o Scrapy e tempo de importação do run_scraper"""
+    print("\n🧪 Testando inicialização da CLI...")
+
+    import subprocess
+    import tempfile
+
+    root = os.path.dirname(os.path.abspath(__file__))
+    heavy = ['scrapy', 'twisted', 'openpyxl', 'lxml']
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'consultas.txt')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write("# lote\nsalão de beleza atibaia\nacademia rio | 75 | academias\n")
+
+        code = (
+            "import sys, run_scraper\n"
+            f"code = run_scraper.main(['validate', {path!r}])\n"
+            f"print(sorted(m for m in {heavy!r} if m in sys.modules))\n"
+            "sys.exit(code)"
+        )
+        result = subprocess.run([sys.executable, '-c', code], cwd=root, capture_output=True, text=True)
+        assert result.returncode == 0, result.stdout + result.stderr
+        assert 'data/academias.xlsx' in result.stdout
+        assert result.stdout.strip().splitlines()[-1] == '[]', f"Módulos pesados importados: {result.stdout}"
+
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write("busca | não é número\n")
+        result = subprocess.run([sys.executable, 'run_scraper.py', 'validate', path], cwd=root,
+                                capture_output=True, text=True)
+        assert result.returncode == 1 and 'inválido' in result.stdout
+
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write("academia rio\nacademia rio | 75\n")
+        result = subprocess.run([sys.executable, 'run_scraper.py', 'validate', path], cwd=root,
+                                capture_output=True, text=True)
+        assert result.returncode == 1 and 'consulta repetida' in result.stdout
+
+    # Benchmark de inicialização: tempo acumulado de "import run_scraper" (-X importtime, em µs)
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import run_scraper'], cwd=root,
+                            capture_output=True, text=True)
+    line = [line for line in result.stderr.splitlines() if line.rstrip().endswith('| run_scraper')][-1]
+    milliseconds = int(line.split('|')[1]) / 1000
+    assert milliseconds < 300, f"run_scraper leva {milliseconds:.0f} ms para importar"
+
+    print(f"✅ CLI OK (import em {milliseconds:.0f} ms)")
+    return True
+
+def test_xlsx_journal():
+    """Teste do diário do XlsxSink: execução morta no meio, recuperação e tipos numéricos"""
+    print("\n🧪 Testando diário do XLSX...")
+
+    import logging
+    import tempfile
+    from openpyxl import load_workbook
+    from google_business_scraper.exporters import XlsxSink, _read_journal
+
+    logger = logging.getLogger('test')
+
+    def row(name, rating, reviews):
+        return [name, rating, reviews, 'Rua A, 1', 'Atibaia', 'SP', 'Salão', '', '', '', '', -23.1, -46.5, 'high']
+
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'saloes.xlsx')
+        sink = XlsxSink(filename, logger)
+        sink.open()
+        sink.write_rows([row('Salão A', 5.0, 12), row('Salão B', 4.5, 3)])
+        # Processo morto no meio de uma gravação: diário com a última linha truncada, sem .xlsx
+        with open(sink.journal, 'a', encoding='utf-8') as f:
+            f.write('"Salão C",4.')
+        assert not os.path.exists(filename) and os.path.exists(sink.journal), "O diário é o arquivo parcial"
+
+        # Retomada: a linha truncada sai, o diário continua e o .xlsx final tem as linhas de antes e de depois
+        resumed = XlsxSink(filename, logger)
+        resumed.open(resume=True)
+        resumed.write_rows([row('Salão C', 4.8, 40)])
+        rows = list(_read_journal(resumed.journal, XlsxSink.TYPES))
+        assert [r[:3] for r in rows] == [['Salão A', 5.0, 12], ['Salão B', 4.5, 3], ['Salão C', 4.8, 40]]
+        assert isinstance(rows[0][1], float) and isinstance(rows[0][2], int), "5.0 deve continuar float"
+        resumed.close()
+        workbook = load_workbook(filename, read_only=True)
+        assert [r[0] for r in workbook.active.iter_rows(min_row=2, values_only=True)] == ['Salão A', 'Salão B',
+                                                                                            'Salão C']
+        workbook.close()
+        assert not os.path.exists(resumed.journal)
+
+        # Nova execução (sem retomada) depois de outra interrupção: diário convertido em .parcial.xlsx
+        sink = XlsxSink(filename, logger)
+        sink.open()
+        sink.write_rows([row('Salão D', 4.0, 7)])
+        XlsxSink(filename, logger).open()
+        partial = os.path.join(directory, 'saloes.parcial.xlsx')
+        workbook = load_workbook(partial, read_only=True)
+        assert [r[:3] for r in workbook.active.iter_rows(min_row=2, values_only=True)] == [('Salão D', 4, 7)]
+        workbook.close()
+        assert not os.path.exists(sink.journal)
+
+    print("✅ Diário do XLSX OK")
+    return True
+
+def test_batch_queries():
+    """Teste do modo lote: arquivo de consultas, requisições iniciais e um arquivo de saída por consulta"""
+    print("\n🧪 Testando modo lote...")
+
+    import csv
+    import tempfile
+    from scrapy.utils.test import get_crawler
+    from google_business_scraper.items import BusinessItem
+    from google_business_scraper.pipelines import ExportPipeline
+    from google_business_scraper.queries import parse_queries
+    from google_business_scraper.replay import load_fixture, make_response
+    from google_business_scraper.spiders.business_spider import BusinessSpider
+
+    body = load_fixture(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'debug_page.html'))
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'consultas.txt')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write("# lote\n\nbarbearia atibaia\nbarbearia são paulo | 5 | barbearias_sp\n")
+
+        crawler = get_crawler(BusinessSpider, {'EXPORT_FORMAT': 'csv'})
+        spider = BusinessSpider.from_crawler(crawler, queries=path, max_results=30)
+        assert [(q['search_query'], q['max_results'], q['output']) for q in spider.queries] == [
+            ('barbearia atibaia', 30, None), ('barbearia são paulo', 5, 'barbearias_sp')]
+        requests = list(spider.start_requests())
+        assert [r.meta['query']['search_query'] for r in requests] == ['barbearia atibaia', 'barbearia são paulo']
+
+        try:
+            parse_queries(["busca | 10 | saida | extra"])
+            assert False, "Linha com campos demais deve ser rejeitada"
+        except ValueError as e:
+            assert 'Linha 1' in str(e)
+        try:
+            parse_queries(["barbearia atibaia", "# comentário", "barbearia atibaia | 10"])
+            assert False, "Consulta repetida deve ser rejeitada"
+        except ValueError as e:
+            assert 'Linha 3' in str(e) and 'linha 1' in str(e)
+
+        # Cada consulta vai para o seu arquivo, respeitando o max_results da linha
+        os.chdir(directory)
+        try:
+            pipeline = ExportPipeline()
+            pipeline.open_spider(spider)
+            for query in spider.queries:
+                for result in spider.parse(make_response(body, query['search_query'], query['max_results'])):
+                    if isinstance(result, BusinessItem):
+                        pipeline.process_item(result, spider)
+            pipeline.close_spider(spider)
+            counts = {}
+            for filename in ('barbearia_atibaia.csv', 'barbearias_sp.csv'):
+                with open(os.path.join('data', filename), encoding='utf-8') as f:
+                    counts[filename] = len(list(csv.reader(f))) - 1
+        finally:
+            os.chdir(cwd)
+        assert counts == {'barbearia_atibaia.csv': 22, 'barbearias_sp.csv': 5}, counts
+
+    print("✅ Modo lote OK")
+    return True
+
+def test_concurrent_pagination():
+    """Teste da paginação concorrente: janela de páginas, limite de itens e descarte após o limite"""
+    print("\n🧪 Testando paginação concorrente...")
+
+    import scrapy
+    from scrapy.exceptions import IgnoreRequest
+    from scrapy.utils.test import get_crawler
+    from google_business_scraper.items import BusinessItem
+    from google_business_scraper.middlewares import PaginationCapMiddleware
+    from google_business_scraper.queries import make_query
+    from google_business_scraper.replay import load_fixture, make_response
+    from google_business_scraper.spiders.business_spider import BusinessSpider
+
+    body = load_fixture(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'debug_page.html'))
+    crawler = get_crawler(BusinessSpider, {'PAGINATION_CONCURRENCY': 3})
+    spider = BusinessSpider.from_crawler(crawler, search_query='barbearia são paulo', max_results=50)
+    assert [r.meta['start'] for r in spider.start_requests()] == [0]
+
+    def parse(start):
+        output = list(spider.parse(make_response(body, 'barbearia são paulo', 50, start=start)))
+        items = [r for r in output if isinstance(r, BusinessItem)]
+        return len(items), [r.meta['start'] for r in output if isinstance(r, scrapy.Request)]
+
+    # Faltam 28 itens: só duas páginas em paralelo, mesmo com janela de 3
+    assert parse(0) == (22, [20, 40])
+    # A página 40, já em andamento, cobre os 6 itens restantes: nada novo é agendado
+    assert parse(20) == (22, [])
+    assert parse(40) == (6, []), "O limite de max_results vale para a consulta inteira"
+    state = spider.pagination['barbearia são paulo']
+    assert state['done'] and state['items'] == 50 and state['in_flight'] == 0
+
+    # Página pendente de uma consulta concluída é descartada antes do download
+    middleware = PaginationCapMiddleware()
+    late = spider.search_request(make_query('barbearia são paulo', 50), 60)
+    try:
+        middleware.process_request(late, spider)
+        assert False, "Página após o limite deveria ser descartada"
+    except IgnoreRequest:
+        pass
+    other = spider.search_request(make_query('barbearia atibaia', 50), 20)
+    assert middleware.process_request(other, spider) is None
+
+    print("✅ Paginação concorrente OK")
+    return True
+
+def test_xlsx_streaming():
+    """Teste da exportação em .xlsx: lotes gravados no diário durante a execução e workbook no fechamento"""
+    print("\n🧪 Testando exportação XLSX em lotes...")
+
+    import tempfile
+    from openpyxl import load_workbook
+    from scrapy.utils.test import get_crawler
+    from google_business_scraper.exporters import XlsxSink, _read_journal
+    from google_business_scraper.pipelines import ExcelExportPipeline
+    from google_business_scraper.replay import load_fixture, make_response, replay_page
+    from google_business_scraper.spiders.business_spider import BusinessSpider
+
+    body = load_fixture(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'debug_page.html'))
+    # EXPORT_FORMAT é ignorado: o ExcelExportPipeline grava sempre .xlsx
+    crawler = get_crawler(BusinessSpider, {'EXPORT_BATCH_SIZE': 10, 'EXPORT_FORMAT': 'csv'})
+    spider = BusinessSpider.from_crawler(crawler, search_query='barbearia são paulo', max_results=50)
+    items = replay_page(spider, make_response(body, 'barbearia são paulo', 50))
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            pipeline = ExcelExportPipeline()
+            pipeline.open_spider(spider)
+            for item in items:
+                pipeline.process_item(item, spider)
+            # 22 itens com lotes de 10: 20 já no diário, 2 em memória e nenhum .xlsx ainda
+            journal = 'data/barbearia_são_paulo.xlsx.parcial.csv'
+            assert len(list(_read_journal(journal, XlsxSink.TYPES))) == 20
+            assert not os.path.exists('data/barbearia_são_paulo.xlsx')
+            pipeline.close_spider(spider)
+
+            workbook = load_workbook('data/barbearia_são_paulo.xlsx', read_only=True)
+            rows = list(workbook.active.iter_rows(values_only=True))
+            workbook.close()
+        finally:
+            os.chdir(cwd)
+        assert not os.path.exists(os.path.join(directory, journal)), "O diário sai depois do .xlsx gerado"
+
+    assert rows[0][:3] == ('Nome', 'Avaliação', 'Número de Avaliações') and len(rows) == 23
+    assert rows[1][:3] == ('Barbearia Black Zone Peixoto Gomide', 4.9, 1500)
+
+    print("✅ Exportação XLSX em lotes OK")
+    return True
+
+def test_export_sinks():
+    """Teste dos sinks CSV, JSONL, SQLite e Parquet: lotes, retomada e tipos das colunas"""
+    print("\n🧪 Testando formatos de exportação...")
+
+    import csv
+    import json
+    import logging
+    import sqlite3
+    import tempfile
+    from operator import attrgetter
+    from google_business_scraper.exporters import SINKS
+    from google_business_scraper.replay import replay_fixtures
+
+    fixture = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'debug_page.html')
+    items = replay_fixtures([fixture], search_query='barbearia são paulo', max_results=50)
+    logger = logging.getLogger('test')
+    formats = ['csv', 'jsonl', 'sqlite']
+    try:
+        import pyarrow.parquet as pq
+        formats.append('parquet')
+    except ImportError:
+        print("⚠️  pyarrow não instalado - Parquet não testado")
+
+    def read(export_format, filename):
+        """Nomes e avaliação da primeira linha, como lidos do arquivo"""
+        if export_format == 'csv':
+            with open(filename, newline='', encoding='utf-8') as f:
+                rows = list(csv.DictReader(f))
+            return [row['name'] for row in rows], float(rows[0]['rating'])
+        if export_format == 'jsonl':
+            with open(filename, encoding='utf-8') as f:
+                rows = [json.loads(line) for line in f]
+            return [row['name'] for row in rows], rows[0]['rating']
+        if export_format == 'sqlite':
+            with sqlite3.connect(filename) as connection:
+                rows = connection.execute("SELECT name, rating FROM businesses").fetchall()
+            connection.close()
+            return [name for name, _ in rows], rows[0][1]
+        table = pq.read_table(filename)
+        return table.column('name').to_pylist(), table.column('rating').to_pylist()[0]
+
+    with tempfile.TemporaryDirectory() as directory:
+        for export_format in formats:
+            sink_class = SINKS[export_format]
+            row = attrgetter(*sink_class.fields)
+            filename = os.path.join(directory, f'saida.{sink_class.extension}')
+
+            sink = sink_class(filename, logger)
+            sink.open()
+            sink.write_rows([row(item) for item in items[:10]])
+            sink.write_rows([row(item) for item in items[10:20]])
+            sink.close()
+            # Job retomado: as linhas da execução anterior são mantidas
+            sink = sink_class(filename, logger)
+            sink.open(resume=True)
+            sink.write_rows([row(item) for item in items[20:]])
+            sink.close()
+
+            names, rating = read(export_format, filename)
+            assert names == [item.name for item in items], f"{export_format}: linhas perdidas ou fora de ordem"
+            assert rating == 4.9 and isinstance(rating, float), f"{export_format}: avaliação {rating!r}"
+            if export_format == 'parquet':
+                assert pq.ParquetFile(filename).num_row_groups == 3, "Um row group por lote"
+
+            # Nova execução (sem retomada) recomeça o arquivo
+            sink = sink_class(filename, logger)
+            sink.open()
+            sink.write_rows([row(items[0])])
+            sink.close()
+            assert read(export_format, filename)[0] == [items[0].name], export_format
+
+    print("✅ Formatos de exportação OK")
+    return True
+
+def test_snapshot_store():
+    """Teste dos snapshots: nada gravado por padrão, só falhas gravadas, conteúdo único e limite de disco"""
+    print("\n🧪 Testando snapshots HTML...")
+
+    import tempfile
+    import time
+    from scrapy.utils.test import get_crawler
+    from google_business_scraper.replay import load_fixture, make_response, replay_fixtures
+    from google_business_scraper.snapshots import SnapshotStore
+    from google_business_scraper.spiders.business_spider import BusinessSpider
+
+    fixture = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'debug_page.html')
+    body = load_fixture(fixture)
+    empty = b'<html><body><div id="search">Nenhum resultado</div></body></html>'
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            # Sem SNAPSHOT_ENABLED o parse não grava nada em disco
+            spider = BusinessSpider.from_crawler(get_crawler(BusinessSpider), search_query='barbearia são paulo')
+            assert spider.snapshots is None
+            list(spider.parse(make_response(body, 'barbearia são paulo', 50)))
+            assert os.listdir(directory) == [], f"Arquivos gravados no caminho crítico: {os.listdir(directory)}"
+        finally:
+            os.chdir(cwd)
+
+        snapshot_dir = os.path.join(directory, 'snapshots')
+        crawler = get_crawler(BusinessSpider, {'SNAPSHOT_ENABLED': True, 'SNAPSHOT_DIR': snapshot_dir})
+        spider = BusinessSpider.from_crawler(crawler, search_query='barbearia são paulo')
+        list(spider.parse(make_response(body, 'barbearia são paulo', 50)))
+        assert not os.path.exists(snapshot_dir), "Página com resultados fora da amostra não é gravada"
+        list(spider.parse(make_response(empty, 'barbearia são paulo', 50, start=20)))
+        names = os.listdir(snapshot_dir)
+        assert len(names) == 1 and names[0].startswith('barbearia_são_paulo_20-') and names[0].endswith('.html.gz')
+        assert load_fixture(os.path.join(snapshot_dir, names[0])) == empty
+
+        # Endereçado por conteúdo: a mesma página não é gravada duas vezes
+        store = SnapshotStore(snapshot_dir, max_bytes=10 ** 9)
+        url = make_response(body, 'barbearia são paulo', 50).url
+        path = store.save(url, body)
+        assert store.save(url, body) is None
+        assert len(replay_fixtures([path], search_query='barbearia são paulo', max_results=50)) == 22
+
+        # Acima de SNAPSHOT_MAX_BYTES os snapshots mais antigos saem primeiro
+        os.utime(path, (time.time() - 60, time.time() - 60))
+        store = SnapshotStore(snapshot_dir, max_bytes=os.path.getsize(path) + 1024)
+        newest = store.save(url, body + b'<!-- outra versao -->')
+        assert not os.path.exists(path) and os.path.exists(newest) and len(os.listdir(snapshot_dir)) == 2
+
+    print("✅ Snapshots OK")
+    return True
+
+def test_dedup_across_runs():
+    """Teste da deduplicação: chave por CID ou nome + localização e índice persistido entre execuções"""
+    print("\n🧪 Testando deduplicação entre execuções...")
+
+    import tempfile
+    from scrapy.utils.test import get_crawler
+    from google_business_scraper.dedup import business_key
+    from google_business_scraper.items import BusinessItem
+    from google_business_scraper.pipelines import DeduplicationPipeline
+    from google_business_scraper.replay import replay_fixtures
+    from google_business_scraper.spiders.business_spider import BusinessSpider
+
+    fixture = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'debug_page.html')
+    items = replay_fixtures([fixture], search_query='barbearia são paulo', max_results=50)
+    assert business_key(None, 'Salão Bela & Cia', 'Atibaia, SP') == business_key(None, 'salao bela cia', 'atibaia sp')
+    assert business_key('123', 'Outro nome') == 'cid:123', "Com CID, nome e localização não importam"
+
+    with tempfile.TemporaryDirectory() as directory:
+        settings = {'DEDUP_INDEX': os.path.join(directory, 'dedup.sqlite'), 'EXPORT_BATCH_SIZE': 5}
+
+        def run(batch, bloom_capacity=0):
+            crawler = get_crawler(BusinessSpider, {**settings, 'DEDUP_BLOOM_CAPACITY': bloom_capacity})
+            spider = BusinessSpider.from_crawler(crawler, search_query='barbearia são paulo')
+            pipeline = DeduplicationPipeline()
+            pipeline.open_spider(spider)
+            kept = [item for item in batch if pipeline.process_item(item, spider)]
+            pipeline.close_spider(spider)
+            return kept, crawler.stats.get_value('dedup/duplicates', 0)
+
+        # 1ª execução: a mesma página duas vezes (paginação repetida) só conta uma vez
+        kept, duplicates = run(items + items)
+        assert len(kept) == 22 and duplicates == 22
+
+        # 2ª execução (com filtro de Bloom): os negócios da anterior são descartados, os novos passam
+        new = BusinessItem(name='Barbearia Nova', address='Rua Nova, 1', city='Atibaia', query='barbearia atibaia')
+        kept, duplicates = run(items + [new], bloom_capacity=1000)
+        assert kept == [new] and duplicates == 22
+
+    print("✅ Deduplicação entre execuções OK")
+    return True
+
+def test_freshness_cache():
+    """Teste do cache de frescor: consultas puladas ou servidas do cache e frescas só sem falhas"""
+    print("\n🧪 Testando cache de frescor...")
+
+    import tempfile
+    import scrapy
+    from scrapy.utils.test import get_crawler
+    from twisted.python.failure import Failure
+    from google_business_scraper.freshness import FreshnessCache
+    from google_business_scraper.items import BusinessItem
+    from google_business_scraper.queries import make_query
+    from google_business_scraper.replay import load_fixture, make_response
+    from google_business_scraper.spiders.business_spider import BusinessSpider
+
+    body = load_fixture(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'debug_page.html'))
+    complete = make_query('barbearia são paulo', 20)
+    failing = make_query('barbearia atibaia', 40)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'freshness.sqlite')
+        crawler = get_crawler(BusinessSpider, {'FRESHNESS_CACHE': path})
+        spider = BusinessSpider.from_crawler(crawler, queries=[complete, failing])
+
+        def crawl(query, start):
+            response = make_response(body, query['search_query'], query['max_results'], start=start)
+            output = list(spider.parse(response))
+            for item in output:
+                if isinstance(item, BusinessItem):
+                    spider.item_processed(item, response=response)
+            return [request for request in output if isinstance(request, scrapy.Request)]
+
+        list(spider.start_requests())
+        assert crawl(complete, 0) == [], "20 itens em uma página: consulta concluída"
+        # A página 20 da outra consulta falha (bloqueio esgotado, erro de rede...) e a paginação segue
+        page = crawl(failing, 0)[0]
+        failure = Failure(Exception('bloqueada'))
+        failure.request = page
+        assert [r.meta['start'] for r in spider.page_failed(failure)] == [40]
+        assert crawl(failing, 40) == [] and spider.query_finished(failing)
+        spider.closed('finished')
+
+        cache = FreshnessCache(path)
+        assert cache.is_fresh('barbearia são paulo')
+        assert not cache.is_fresh('barbearia atibaia'), "Consulta com falha deve ser buscada de novo"
+        assert len(cache.cached_items('barbearia são paulo')) == 20
+        cache.close()
+
+        # Próxima execução (skip): a consulta fresca é pulada e, na outra, só negócios novos ou alterados saem
+        crawler = get_crawler(BusinessSpider, {'FRESHNESS_CACHE': path})
+        spider = BusinessSpider.from_crawler(crawler, queries=[complete, failing])
+        requests = list(spider.start_requests())
+        assert [r.meta['query']['search_query'] for r in requests] == ['barbearia atibaia']
+        assert spider.skipped_queries == {'barbearia são paulo'}
+        output = list(spider.parse(make_response(body, 'barbearia atibaia', 40)))
+        assert not any(isinstance(r, BusinessItem) for r in output), "Negócios inalterados não são emitidos"
+        spider.closed('finished')
+
+        # Modo serve: a consulta fresca sai do cache por uma URI data:, sem tráfego de rede
+        crawler = get_crawler(BusinessSpider, {'FRESHNESS_CACHE': path, 'FRESHNESS_MODE': 'serve'})
+        spider = BusinessSpider.from_crawler(crawler, queries=[complete])
+        request, = spider.start_requests()
+        assert request.url == 'data:,'
+        items = list(request.callback(None, **request.cb_kwargs))
+        assert len(items) == 20 and all(item.query == 'barbearia são paulo' for item in items)
+        spider.closed('finished')
+        cache = FreshnessCache(path)
+        assert len(cache.cached_items('barbearia são paulo')) == 20, "Servir do cache não apaga os negócios"
+        cache.close()
+
+    print("✅ Cache de frescor OK")
+    return True
+
+def test_metrics():
+    """Teste das métricas: histogramas do caminho crítico, estatísticas do crawl e formato do Prometheus"""
+    print("\n🧪 Testando métricas...")
+
+    from scrapy.http import Request
+    from scrapy.utils.test import get_crawler
+    from twisted.web.test.requesthelper import DummyRequest
+    from google_business_scraper.items import BusinessItem
+    from google_business_scraper.metrics import MetricsExtension, MetricsResource
+    from google_business_scraper.pipelines import ValidationPipeline
+    from google_business_scraper.replay import load_fixture, make_response
+    from google_business_scraper.spiders.business_spider import BusinessSpider
+
+    body = load_fixture(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'debug_page.html'))
+    crawler = get_crawler(BusinessSpider, {'METRICS_ENABLED': True})
+    spider = BusinessSpider.from_crawler(crawler, search_query='barbearia são paulo', max_results=50)
+    extension = MetricsExtension.from_crawler(crawler)
+    extension.spider_opened(spider)
+    assert spider.metrics is extension.registry
+
+    response = make_response(body, 'barbearia são paulo', 50)
+    response.request.meta['download_latency'] = 0.3
+    extension.response_received(response, response.request, spider)
+    items = [r for r in spider.parse(response) if isinstance(r, BusinessItem)]
+    pipeline = ValidationPipeline()
+    for item in items + [BusinessItem(name='')]:
+        pipeline.process_item(item, spider)
+    extension.response_received(make_response(body), Request('https://www.google.com/'), spider)
+
+    crawler.stats.set_value('item_scraped_count', 22)
+    extension.spider_closed(spider)
+    stats = crawler.stats.get_stats()
+    assert stats['metrics/request_latency_seconds/count'] == 1, "Só respostas com download_latency"
+    assert stats['metrics/parse_seconds/count'] == 1
+    assert stats['metrics/items_per_page/count'] == 1 and stats['metrics/items_per_page/avg'] == 22
+    assert stats['metrics/pipeline_seconds/ValidationPipeline/count'] == 23
+    assert stats['metrics/selector_hits_total/name/.OSrXXb::text'] == 22
+
+    text = extension.render()
+    assert '# TYPE gbs_items_per_page histogram' in text
+    assert 'gbs_items_per_page_bucket{le="20"} 0' in text and 'gbs_items_per_page_bucket{le="30"} 1' in text
+    assert 'gbs_request_latency_seconds_bucket{le="+Inf"} 1' in text
+    assert 'gbs_pipeline_seconds_count{stage="ValidationPipeline"} 23' in text
+    assert 'gbs_scrapy_stat{key="item_scraped_count"} 22' in text
+    # Endpoint /metrics: o mesmo texto, com o content-type do Prometheus
+    request = DummyRequest([b'metrics'])
+    assert MetricsResource(extension).render_GET(request).decode('utf-8') == text
+    assert request.responseHeaders.getRawHeaders(b'content-type')[0].startswith(b'text/plain; version=0.0.4')
+
+    print("✅ Métricas OK")
+    return True
+
+def test_identity_crawl():
+    """Teste de ponta a ponta das identidades: scrape() contra proxies locais, um deles bloqueado (429)"""
+    print("\n🧪 Testando identidades de ponta a ponta...")
+
+    import asyncio
+    from twisted.internet.threads import blockingCallFromThread
+    from twisted.web import resource, server
+    from google_business_scraper.api import ScraperRunner
+    from google_business_scraper.spiders.business_spider import BusinessSpider
+
+    fixture = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'debug_page.html')
+    with open(fixture, 'rb') as f:
+        body = f.read()
+
+    class FixtureProxy(resource.Resource):
+        """Proxy HTTP local: devolve o debug_page.html (ou 429) e registra o que recebeu"""
+
+        isLeaf = True
+
+        def __init__(self, status):
+            super().__init__()
+            self.status = status
+            self.requests = []
+
+        def render_GET(self, request):
+            self.requests.append((request.uri.decode('utf-8'), request.getHeader('user-agent')))
+            request.setResponseCode(self.status)
+            request.setHeader(b'Content-Type', b'text/html; charset=UTF-8')
+            return body if self.status == 200 else b'Too Many Requests'
+
+    proxies = {'bloqueado': FixtureProxy(429), 'livre': FixtureProxy(200)}
+    runner = ScraperRunner({'DOWNLOAD_DELAY': 0, 'BACKOFF_MIN_DELAY': 0, 'LOG_LEVEL': 'WARNING',
+                            'RETRY_ENABLED': False, 'IDENTITY_COOLDOWN': 300,
+                            'IDENTITY_USER_AGENTS': ['agente-0', 'agente-1']})
+    runner.start()
+    listeners = {name: blockingCallFromThread(runner.reactor, runner.reactor.listenTCP, 0, server.Site(proxy),
+                                              interface='127.0.0.1')
+                 for name, proxy in proxies.items()}
+    # A 1ª identidade usa o proxy bloqueado; a 2ª, o livre (http:// para o proxy responder sem túnel CONNECT)
+    identity_proxies = [f"http://127.0.0.1:{listeners[name].getHost().port}" for name in ('bloqueado', 'livre')]
+    build_search_url = BusinessSpider.build_search_url
+    BusinessSpider.build_search_url = staticmethod(
+        lambda query, start=0, cell=None: build_search_url(query, start, cell).replace('https://', 'http://'))
+
+    async def collect():
+        return [item async for item in runner.scrape('barbearia são paulo', max_results=60,
+                                                     settings={'IDENTITY_PROXIES': identity_proxies})]
+
+    try:
+        items = asyncio.run(collect())
+    finally:
+        BusinessSpider.build_search_url = staticmethod(build_search_url)
+        for listener in listeners.values():
+            blockingCallFromThread(runner.reactor, listener.stopListening)
+        runner.stop()
+
+    # As 3 páginas trazem os mesmos 22 negócios: os repetidos saem na deduplicação
+    assert len(items) == 22, f"Esperados 22 itens, obtidos {len(items)}"
+    blocked, free = proxies['bloqueado'].requests, proxies['livre'].requests
+    # Depois do 429 a identidade fica em cooldown: a página bloqueada e as seguintes saem pela outra
+    assert len(blocked) == 1, f"Identidade em cooldown não deve receber requisições: {blocked}"
+    assert sorted(uri.split('start=')[-1] if 'start=' in uri else '0' for uri, _ in free) == ['0', '20', '40']
+    assert {agent for _, agent in blocked} == {'agente-0'} and {agent for _, agent in free} == {'agente-1'}, \
+        "Cada identidade mantém o seu User-Agent"
+
+    print("✅ Identidades de ponta a ponta OK")
+    return True
+
+def test_redis_task_queue():
+    """Teste da fila Redis (fakeredis): retomada por outro nó e operações conferindo o dono"""
+    print("\n🧪 Testando fila Redis...")
+
+    try:
+        import fakeredis
+        import redis
+    except ImportError:
+        print("⚠️ fakeredis não instalado, teste ignorado")
+        return True
+    import time
+    from google_business_scraper.distributed import RedisTaskQueue
+    from google_business_scraper.queries import make_query
+
+    server = fakeredis.FakeServer()
+    from_url = redis.Redis.from_url
+    redis.Redis.from_url = lambda url, **kwargs: fakeredis.FakeRedis(server=server)
+    try:
+        # Nó "a" com lease já vencido: simula um nó travado no meio da consulta
+        node_a = RedisTaskQueue('redis://localhost', lease=-1)
+        node_b = RedisTaskQueue('redis://localhost', lease=60)
+        node_a.node, node_b.node = 'a', 'b'
+    finally:
+        redis.Redis.from_url = from_url
+
+    key = 'barbearia atibaia'
+    assert node_a.enqueue([make_query(key)]) == 1 and node_b.enqueue([make_query(key)]) == 0
+    query, resumed = node_a.claim()
+    assert query['search_query'] == key and not resumed
+    assert node_a.redis.hget(node_a.keys['owners'], key) == b'a'
+
+    query, resumed = node_b.claim()
+    assert query['search_query'] == key and resumed
+    assert node_b.redis.hget(node_b.keys['owners'], key) == b'b'
+    assert not node_b.seen(key, 'fp1')
+    lease_b = node_b.redis.zscore(node_b.keys['leases'], key)
+
+    # O nó "a" volta: não renova, não devolve e não conclui a consulta que agora é do nó "b"
+    node_a.claimed.add(key)
+    node_a.release([key])
+    assert node_a.redis.llen(node_a.keys['pending']) == 0, "Consulta retomada não volta para a fila"
+    assert node_b.seen(key, 'fp1'), "Impressões digitais do novo dono devem ser mantidas"
+    node_a.complete(key)
+    assert not node_a.redis.sismember(node_a.keys['done'], key)
+    node_a.claimed.add(key)
+    node_a.renew()
+    assert key not in node_a.claimed, "Consulta perdida deve sair das consultas do nó"
+    assert node_b.redis.zscore(node_b.keys['leases'], key) == lease_b
+
+    node_b.complete(key)
+    assert node_b.counts() == {'pending': 0, 'running': 0, 'done': 1}
+    assert node_b.claim() == (None, False)
+
+    # Claim de consulta pendente grava lease e dono na mesma operação
+    assert node_b.enqueue([make_query('padaria atibaia'), make_query(key)]) == 1
+    query, resumed = node_b.claim()
+    assert query['search_query'] == 'padaria atibaia' and not resumed
+    assert node_b.redis.zscore(node_b.keys['leases'], 'padaria atibaia') > time.time()
+    assert node_b.redis.hget(node_b.keys['owners'], 'padaria atibaia') == b'b'
+    assert node_b.counts() == {'pending': 0, 'running': 1, 'done': 1}
+    node_a.close()
+    node_b.close()
+    assert node_a.counts() == {'pending': 1, 'running': 0, 'done': 1}
+
+    print("✅ Fila Redis OK")
+    return True
+
 def main():
     """Executar todos os testes"""
     print("🚀 Iniciando testes do pipeline...\n")
@@ -95,11 +1343,203 @@ def main():
     # Teste 2: Items do Scrapy
     items_ok = test_scrapy_items()
 
+    # Teste 3: Replay offline do parse
+    try:
+        replay_ok = test_replay_debug_page()
+    except AssertionError as e:
+        print(f"❌ Erro no replay: {e}")
+        replay_ok = False
+
+    # Teste 4: Pool de identidades
+    try:
+        identity_ok = test_identity_pool()
+    except AssertionError as e:
+        print(f"❌ Erro no pool de identidades: {e}")
+        identity_ok = False
+
+    # Teste 5: Detecção de bloqueio
+    try:
+        blocking_ok = test_block_detection()
+    except AssertionError as e:
+        print(f"❌ Erro na detecção de bloqueio: {e}")
+        blocking_ok = False
+
+    # Teste 6: Fila do modo distribuído
+    try:
+        distributed_ok = test_distributed_queue()
+    except AssertionError as e:
+        print(f"❌ Erro na fila distribuída: {e}")
+        distributed_ok = False
+
+    # Teste 7: Checkpoint de jobs
+    try:
+        checkpoint_ok = test_checkpoint_resume()
+    except AssertionError as e:
+        print(f"❌ Erro no checkpoint: {e}")
+        checkpoint_ok = False
+
+    # Teste 8: Planejador por grade geográfica
+    try:
+        planner_ok = test_geo_planner()
+    except AssertionError as e:
+        print(f"❌ Erro no planejador: {e}")
+        planner_ok = False
+
+    # Teste 9: API assíncrona
+    try:
+        api_ok = test_async_api()
+    except AssertionError as e:
+        print(f"❌ Erro na API assíncrona: {e}")
+        api_ok = False
+
+    # Teste 10: Cache HTTP
+    try:
+        cache_ok = test_http_cache()
+    except AssertionError as e:
+        print(f"❌ Erro no cache HTTP: {e}")
+        cache_ok = False
+
+    # Teste 11: Extração alternativa
+    try:
+        fallback_ok = test_fallback_extraction()
+    except AssertionError as e:
+        print(f"❌ Erro na extração alternativa: {e}")
+        fallback_ok = False
+
+    # Teste 12: Enriquecimento com a página de detalhes
+    try:
+        enrich_ok = test_detail_enrichment()
+    except AssertionError as e:
+        print(f"❌ Erro no enriquecimento: {e}")
+        enrich_ok = False
+
+    # Teste 13: Saúde dos seletores
+    try:
+        health_ok = test_selector_health()
+    except AssertionError as e:
+        print(f"❌ Erro na saúde dos seletores: {e}")
+        health_ok = False
+
+    # Teste 14: Normalização e gazetteer
+    try:
+        normalization_ok = test_normalization()
+    except AssertionError as e:
+        print(f"❌ Erro na normalização: {e}")
+        normalization_ok = False
+
+    # Teste 15: Inicialização rápida da CLI
+    try:
+        cli_ok = test_lazy_cli()
+    except AssertionError as e:
+        print(f"❌ Erro na CLI: {e}")
+        cli_ok = False
+
+    # Teste 16: Diário do XLSX
+    try:
+        journal_ok = test_xlsx_journal()
+    except AssertionError as e:
+        print(f"❌ Erro no diário do XLSX: {e}")
+        journal_ok = False
+
+    # Teste 17: Modo lote com arquivo de consultas
+    try:
+        batch_ok = test_batch_queries()
+    except AssertionError as e:
+        print(f"❌ Erro no modo lote: {e}")
+        batch_ok = False
+
+    # Teste 18: Paginação concorrente
+    try:
+        pagination_ok = test_concurrent_pagination()
+    except AssertionError as e:
+        print(f"❌ Erro na paginação: {e}")
+        pagination_ok = False
+
+    # Teste 19: Exportação XLSX em lotes
+    try:
+        xlsx_ok = test_xlsx_streaming()
+    except AssertionError as e:
+        print(f"❌ Erro na exportação XLSX: {e}")
+        xlsx_ok = False
+
+    # Teste 20: Formatos de exportação (sinks)
+    try:
+        sinks_ok = test_export_sinks()
+    except AssertionError as e:
+        print(f"❌ Erro nos formatos de exportação: {e}")
+        sinks_ok = False
+
+    # Teste 21: Snapshots HTML opcionais
+    try:
+        snapshot_ok = test_snapshot_store()
+    except AssertionError as e:
+        print(f"❌ Erro nos snapshots: {e}")
+        snapshot_ok = False
+
+    # Teste 22: Deduplicação entre execuções
+    try:
+        dedup_ok = test_dedup_across_runs()
+    except AssertionError as e:
+        print(f"❌ Erro na deduplicação: {e}")
+        dedup_ok = False
+
+    # Teste 23: Cache de frescor
+    try:
+        freshness_ok = test_freshness_cache()
+    except AssertionError as e:
+        print(f"❌ Erro no cache de frescor: {e}")
+        freshness_ok = False
+
+    # Teste 24: Métricas e endpoint do Prometheus
+    try:
+        metrics_ok = test_metrics()
+    except AssertionError as e:
+        print(f"❌ Erro nas métricas: {e}")
+        metrics_ok = False
+
+    # Teste 25: Identidades de ponta a ponta (scrape contra proxies locais)
+    try:
+        identity_crawl_ok = test_identity_crawl()
+    except AssertionError as e:
+        print(f"❌ Erro nas identidades de ponta a ponta: {e}")
+        identity_crawl_ok = False
+
+    # Teste 26: Fila Redis (fakeredis)
+    try:
+        redis_queue_ok = test_redis_task_queue()
+    except AssertionError as e:
+        print(f"❌ Erro na fila Redis: {e}")
+        redis_queue_ok = False
+
     print("\n📊 Resultado dos Testes:")
     print(f"Excel: {'✅ OK' if excel_ok else '❌ FALHOU'}")
     print(f"Items: {'✅ OK' if items_ok else '❌ FALHOU'}")
+    print(f"Replay: {'✅ OK' if replay_ok else '❌ FALHOU'}")
+    print(f"Identidades: {'✅ OK' if identity_ok else '❌ FALHOU'}")
+    print(f"Bloqueios: {'✅ OK' if blocking_ok else '❌ FALHOU'}")
+    print(f"Distribuído: {'✅ OK' if distributed_ok else '❌ FALHOU'}")
+    print(f"Checkpoint: {'✅ OK' if checkpoint_ok else '❌ FALHOU'}")
+    print(f"Planejador: {'✅ OK' if planner_ok else '❌ FALHOU'}")
+    print(f"API: {'✅ OK' if api_ok else '❌ FALHOU'}")
+    print(f"Cache HTTP: {'✅ OK' if cache_ok else '❌ FALHOU'}")
+    print(f"Extração alternativa: {'✅ OK' if fallback_ok else '❌ FALHOU'}")
+    print(f"Enriquecimento: {'✅ OK' if enrich_ok else '❌ FALHOU'}")
+    print(f"Seletores: {'✅ OK' if health_ok else '❌ FALHOU'}")
+    print(f"Normalização: {'✅ OK' if normalization_ok else '❌ FALHOU'}")
+    print(f"CLI: {'✅ OK' if cli_ok else '❌ FALHOU'}")
+    print(f"Diário XLSX: {'✅ OK' if journal_ok else '❌ FALHOU'}")
+    print(f"Modo lote: {'✅ OK' if batch_ok else '❌ FALHOU'}")
+    print(f"Paginação: {'✅ OK' if pagination_ok else '❌ FALHOU'}")
+    print(f"XLSX em lotes: {'✅ OK' if xlsx_ok else '❌ FALHOU'}")
+    print(f"Formatos: {'✅ OK' if sinks_ok else '❌ FALHOU'}")
+    print(f"Snapshots: {'✅ OK' if snapshot_ok else '❌ FALHOU'}")
+    print(f"Deduplicação: {'✅ OK' if dedup_ok else '❌ FALHOU'}")
+    print(f"Frescor: {'✅ OK' if freshness_ok else '❌ FALHOU'}")
+    print(f"Métricas: {'✅ OK' if metrics_ok else '❌ FALHOU'}")
+    print(f"Identidades (crawl): {'✅ OK' if identity_crawl_ok else '❌ FALHOU'}")
+    print(f"Fila Redis: {'✅ OK' if redis_queue_ok else '❌ FALHOU'}")
 
-    if excel_ok and items_ok:
+    if excel_ok and items_ok and replay_ok and identity_ok and blocking_ok and distributed_ok and checkpoint_ok and planner_ok and api_ok and cache_ok and fallback_ok and enrich_ok and health_ok and normalization_ok and cli_ok and journal_ok and batch_ok and pagination_ok and xlsx_ok and sinks_ok and snapshot_ok and dedup_ok and freshness_ok and metrics_ok and identity_crawl_ok and redis_queue_ok:
         print("\n🎉 Todos os testes passaram! O pipeline deve funcionar.")
     else:
         print("\n⚠️  Alguns testes falharam. Verifique os erros acima.")